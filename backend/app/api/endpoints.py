@@ -1,6 +1,11 @@
 # api/endpoints.py
 from fastapi import HTTPException, Depends
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+import asyncio
+import json
 import logging
+import sys
 from fastapi import BackgroundTasks
 from datetime import datetime
 from app.core.firebase_service import firebase_service
@@ -10,43 +15,152 @@ from app.models.schemas import (
     ChatRequest, ChatResponse, Source,
     GoogleTokenRequest, AuthResponse, UserInfo, ChatLimitResponse, PaymentPlaceholder
 )
-from app.core.rag_engine import rag_engine
+from app.config.settings import settings
 
 logger = logging.getLogger(__name__)
 
+# ============================================
+# RAG ENGINE (lazy)
+# ============================================
+# app.core.rag_engine pulls in langchain, chromadb and the model runtimes (~6 s, torch), so it
+# is only imported when a RAG route is hit or WORKER_ROLE preloads it (see main.startup_event),
+# and always on a worker thread so the event loop keeps serving the other routes meanwhile.
+RAG_ENGINE_MODULE = "app.core.rag_engine"
+_rag_load_task = None
+_rag_load_error = None
+
+
+def get_rag_engine():
+    """Import (on first use) and return the global RAG engine. Blocking: call off the event loop"""
+    from app.core.rag_engine import rag_engine
+    return rag_engine
+
+
+def loaded_rag_engine():
+    """The RAG engine if its module was already imported, else None (never triggers the import)"""
+    module = sys.modules.get(RAG_ENGINE_MODULE)
+    return getattr(module, "rag_engine", None)
+
+
+async def _load_rag_engine():
+    global _rag_load_error
+    try:
+        rag_engine = await asyncio.to_thread(get_rag_engine)
+    except Exception as e:
+        logger.error(f"Importing the RAG engine failed: {e}")
+        _rag_load_error = str(e)
+        return
+    _rag_load_error = None
+    await rag_engine.start_background_initialization()
+
+
+def start_rag_loading():
+    """Import the RAG module and initialize the engine in the background (idempotent; retries a failed import)"""
+    global _rag_load_task
+    if _rag_load_task is None or (_rag_load_task.done() and loaded_rag_engine() is None):
+        _rag_load_task = asyncio.get_running_loop().create_task(_load_rag_engine())
+    return _rag_load_task
+
+
 # ============================================
 # HEALTH CHECK
 # ============================================
 async def health_check():
     """Health check endpoint"""
     try:
-        if rag_engine.vectordb is None or rag_engine.qa is None:
-            return {"status": "unhealthy", "message": "RAG system not initialized"}
-        test_docs = rag_engine.vectordb.similarity_search("test", k=1)
+        rag_engine = loaded_rag_engine()
+        if rag_engine is None:
+            return {"status": "healthy", "message": "RAG Chatbot API is running (RAG engine not loaded)"}
+        if rag_engine.state == "failed":
+            return {"status": "unhealthy", "message": f"RAG system failed to initialize: {rag_engine.state_error}"}
+        if not rag_engine.is_ready:
+            # Liveness only; readiness for chat traffic is reported by /ready
+            return {"status": "healthy", "message": f"RAG Chatbot API is running (RAG engine {rag_engine.state})"}
+        test_docs = await run_in_threadpool(rag_engine.vectordb.similarity_search, "test", k=1)
         return {"status": "healthy", "message": "RAG Chatbot API is running"}
     except Exception as e:
         return {"status": "unhealthy", "message": f"Error: {str(e)}"}
 
+
+async def readiness_check():
+    """Readiness probe - 200 once the RAG models are loaded and warmed, else 503"""
+    rag_engine = loaded_rag_engine()
+    if rag_engine is None:
+        body = {"status": "importing" if _rag_load_task is not None else "not_started", "role": settings.WORKER_ROLE}
+        if _rag_load_error:
+            body["error"] = _rag_load_error
+        return JSONResponse(status_code=503, content=body)
+    body = {"status": rag_engine.state, "role": settings.WORKER_ROLE}
+    if rag_engine.state_error:
+        body["error"] = rag_engine.state_error
+    return JSONResponse(status_code=200 if rag_engine.is_ready else 503, content=body)
+
+
+def ensure_rag_ready():
+    """
+    Return the RAG engine, or reject the request with 503 while models are loading
+    (the first RAG request on a lazily-started worker kicks off the import and load)
+    """
+    rag_engine = loaded_rag_engine()
+    if rag_engine is None or rag_engine.state == "not_started":
+        if _rag_load_task is None:
+            logger.info("First RAG request on this worker - loading RAG engine in the background")
+        start_rag_loading()
+    if rag_engine is None:
+        raise HTTPException(
+            status_code=503,
+            detail=f"RAG engine is {'failed' if _rag_load_error else 'loading'}, try again shortly",
+            headers={"Retry-After": "5"},
+        )
+    if not rag_engine.is_ready:
+        raise HTTPException(
+            status_code=503,
+            detail=f"RAG engine is {rag_engine.state}, try again shortly",
+            headers={"Retry-After": "5"},
+        )
+    return rag_engine
+
 # ============================================
 # CHAT ENDPOINTS
 # ============================================
-# api/endpoints.py
+def format_sources(sources) -> list:
+    """Convert engine source dicts into response Source models"""
+    formatted_sources = []
+    if sources:
+        for src in sources:
+            if isinstance(src, dict):
+                formatted_sources.append(Source(
+                    document=src.get("document", "Unknown"),
+                    content=src.get("content", ""),
+                    score=src.get("score")
+                ))
+    return formatted_sources
+
 
-# Change this line:
+def resolve_conversation_id(request: ChatRequest, current_user: UserInfo) -> str:
+    if request.conversation_id != 'default':
+        return request.conversation_id
+    return f"conv_{current_user.google_id}_{int(datetime.utcnow().timestamp())}"
+
+
+def sse_event(event: str, data: dict) -> str:
+    """Encode one Server-Sent Event frame"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
 
 
-# To this:
 async def chat(request: ChatRequest, current_user: UserInfo, background_tasks: BackgroundTasks):
         """Main chat endpoint - now saves to Firebase"""
+        rag_engine = ensure_rag_ready()
         try:
             logger.info(f"Processing question from user {current_user.email}: {request.message}")
             logger.info(f"Conversation ID: {request.conversation_id}")
             
-            conversation_id = request.conversation_id if request.conversation_id != 'default' else f"conv_{current_user.google_id}_{int(datetime.utcnow().timestamp())}"
+            conversation_id = resolve_conversation_id(request, current_user)
             logger.info(f"Using conversation ID: {conversation_id}")
             
-            # Save user message to Firebase
-            user_message_saved = firebase_service.save_message(
+            # Save user message to Firebase (off the event loop)
+            user_message_saved = await run_in_threadpool(
+                firebase_service.save_message,
                 google_id=current_user.google_id,
                 conversation_id=conversation_id,
                 message_type='user',
@@ -57,16 +171,17 @@ async def chat(request: ChatRequest, current_user: UserInfo, background_tasks: B
                 logger.info("User message saved to Firebase successfully")
             
             # Get answer using RAG
-            answer, sources = rag_engine.ask_comprehensive_question(request.message)
+            answer, sources = await rag_engine.aask_comprehensive_question(request.message, mode=request.mode, domains=request.domains)
             
             # Increment chat count in Firebase
-            new_count = firebase_service.increment_chat_count(current_user.google_id)
-            remaining_chats = firebase_service.get_remaining_chats(current_user.google_id)
+            new_count = await run_in_threadpool(firebase_service.increment_chat_count, current_user.google_id)
+            remaining_chats = await run_in_threadpool(firebase_service.get_remaining_chats, current_user.google_id)
             
             logger.info(f"User {current_user.email} chat count: {new_count}, remaining: {remaining_chats}")
             
             # Save bot response to Firebase
-            bot_message_saved = firebase_service.save_message(
+            bot_message_saved = await run_in_threadpool(
+                firebase_service.save_message,
                 google_id=current_user.google_id,
                 conversation_id=conversation_id,
                 message_type='bot',
@@ -84,20 +199,9 @@ async def chat(request: ChatRequest, current_user: UserInfo, background_tasks: B
                 keep_count=3
             )
             
-            # Format sources for response
-            formatted_sources = []
-            if sources:
-                for src in sources:
-                    if isinstance(src, dict):
-                        formatted_sources.append(Source(
-                            document=src.get("document", "Unknown"),
-                            content=src.get("content", ""),
-                            score=src.get("score")
-                        ))
-            
             return ChatResponse(
                 response=answer,
-                sources=formatted_sources,
+                sources=format_sources(sources),
                 conversation_id=conversation_id,
                 remaining_chats=remaining_chats,
                 chat_count=new_count
@@ -110,12 +214,92 @@ async def chat(request: ChatRequest, current_user: UserInfo, background_tasks: B
             raise HTTPException(status_code=500, detail=f"Error processing request: {str(e)}")
 
 
+async def chat_stream(request: ChatRequest, current_user: UserInfo, background_tasks: BackgroundTasks):
+    """
+    Streaming chat endpoint (Server-Sent Events).
+    Emits `sources` once retrieval completes, `token` frames as the LLM generates,
+    then `done` after the exchange is saved to Firebase (or `error`).
+    The concatenated `token` frames are exactly the saved answer. Like /chat, a failed
+    request is not counted and saves no bot message; the user message is saved together
+    with the answer, so a failed stream leaves no unanswered turn behind.
+    """
+    rag_engine = ensure_rag_ready()
+    logger.info(f"Processing streaming question from user {current_user.email}: {request.message}")
+    conversation_id = resolve_conversation_id(request, current_user)
+    logger.info(f"Using conversation ID: {conversation_id}")
+
+    async def event_stream():
+        answer, sources = "", []
+        try:
+            async for event, payload in rag_engine.astream_comprehensive_question(
+                request.message, mode=request.mode, domains=request.domains
+            ):
+                if event == "sources":
+                    sources = payload
+                    yield sse_event("sources", {
+                        "conversation_id": conversation_id,
+                        "sources": [src.model_dump() for src in format_sources(sources)]
+                    })
+                elif event == "token":
+                    yield sse_event("token", {"content": payload})
+                elif event == "answer":
+                    answer = payload
+        except Exception as e:
+            logger.error(f"Error streaming chat response: {str(e)}")
+            import traceback
+            logger.error(f"Full traceback: {traceback.format_exc()}")
+            yield sse_event("error", {"detail": f"Error processing request: {str(e)}"})
+            return
+
+        # Stream closed cleanly - persist exactly like the blocking endpoint
+        await run_in_threadpool(
+            firebase_service.save_message,
+            google_id=current_user.google_id,
+            conversation_id=conversation_id,
+            message_type='user',
+            content=request.message
+        )
+        new_count = await run_in_threadpool(firebase_service.increment_chat_count, current_user.google_id)
+        remaining_chats = await run_in_threadpool(firebase_service.get_remaining_chats, current_user.google_id)
+        bot_message_saved = await run_in_threadpool(
+            firebase_service.save_message,
+            google_id=current_user.google_id,
+            conversation_id=conversation_id,
+            message_type='bot',
+            content=answer,
+            sources=sources
+        )
+        if bot_message_saved:
+            logger.info("Streamed bot response saved to Firebase successfully")
+
+        yield sse_event("done", {
+            "response": answer,
+            "conversation_id": conversation_id,
+            "remaining_chats": remaining_chats,
+            "chat_count": new_count
+        })
+
+    # Runs after the stream finishes
+    background_tasks.add_task(
+        firebase_service.cleanup_old_conversations,
+        current_user.google_id,
+        keep_count=3
+    )
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 async def debug_question(request: ChatRequest, current_user: UserInfo = Depends(get_current_user)):
     """Debug endpoint - requires authentication but no chat limit"""
+    rag_engine = ensure_rag_ready()
     try:
         logger.info(f"Debug request from user {current_user.email}: {request.message}")
-        answer = rag_engine.debug_rag_response(request.message)
-        docs = rag_engine.vectordb.as_retriever(search_kwargs={"k": 4}).get_relevant_documents(request.message)
+        answer = await rag_engine.adebug_rag_response(request.message)
+        docs = await rag_engine.vectordb.as_retriever(search_kwargs={"k": 4}).ainvoke(request.message)
         
         context_info = []
         for i, doc in enumerate(docs):
@@ -140,9 +324,10 @@ async def debug_question(request: ChatRequest, current_user: UserInfo = Depends(
 
 async def concise_chat(request: ChatRequest, current_user: UserInfo = Depends(check_chat_limit)):
     """Concise answer endpoint"""
+    rag_engine = ensure_rag_ready()
     try:
         logger.info(f"Concise chat from user {current_user.email}: {request.message}")
-        answer = rag_engine.ask_concise_question(request.message)
+        answer = await rag_engine.aask_concise_question(request.message, mode=request.mode, domains=request.domains)
         
         return {
             "response": answer,
@@ -317,12 +502,14 @@ async def delete_conversation(conversation_id: str, current_user: UserInfo):
 async def get_rag_info(current_user: UserInfo = Depends(get_current_user)):
     """Get RAG model configuration details"""
     try:
-        from app.core.rag_engine import rag_engine
-        from app.config.settings import settings
+        # Reports on the engine without importing it (see get_rag_engine)
+        rag_engine = loaded_rag_engine()
         
         # Get ChromaDB stats
         try:
-            if rag_engine.vectordb:
+            if rag_engine is None:
+                doc_count = "Not loaded"
+            elif rag_engine.vectordb:
                 collection = rag_engine.vectordb._collection
                 doc_count = collection.count()
             else:
@@ -346,7 +533,8 @@ async def get_rag_info(current_user: UserInfo = Depends(get_current_user)):
                 "fetch_k_multiplier": getattr(settings, "FETCH_K_MULTIPLIER", 10),
                 "min_fetch_k": getattr(settings, "MIN_FETCH_K", 60),
                 "lambda_mult": getattr(settings, "LAMBDA_MULT", 0.2),
-                "search_type": "MMR (Maximal Marginal Relevance)"
+                "search_type": "MMR (Maximal Marginal Relevance)",
+                "mode": getattr(settings, "RETRIEVAL_MODE", "dense")
             },
             "reranker": {
                 "model": getattr(settings, "RERANKER_MODEL", "BAAI/bge-reranker-base"),
@@ -355,8 +543,9 @@ async def get_rag_info(current_user: UserInfo = Depends(get_current_user)):
             },
             "context": {
                 "max_tokens": getattr(settings, "MAX_CONTEXT_TOKENS", 2500),
-                "fallback_tokens": getattr(settings, "FALLBACK_CONTEXT_TOKENS", 2000),
-                "hard_limit": getattr(settings, "PROMPT_TOKEN_HARD_LIMIT", 5200)
+                "hard_limit": getattr(settings, "PROMPT_TOKEN_HARD_LIMIT", 5200),
+                # Actual packing budget before the question's own tokens are subtracted
+                "packing_budget": rag_engine.context_budget()[0] if rag_engine is not None else "Not loaded"
             },
             "database": {
                 "type": "ChromaDB",
@@ -364,8 +553,15 @@ async def get_rag_info(current_user: UserInfo = Depends(get_current_user)):
                 "document_count": doc_count,
                 "domains": 99
             },
+            "runtime": rag_engine.stats() if rag_engine is not None else {"state": "not_loaded"},
             "pipeline": {
-                "multi_query": True,
+                "multi_query": getattr(settings, "QUERY_EXPANSION_ENABLED", True),
+                "default_mode": (
+                    rag_engine.default_mode if rag_engine is not None
+                    else getattr(settings, "DEFAULT_PIPELINE_MODE", "thorough")
+                ),
+                "early_exit": getattr(settings, "EARLY_EXIT_ENABLED", True),
+                "profiles": getattr(settings, "PIPELINE_PROFILES", {}),
                 "query_variants": 4,
                 "reranking": True,
                 "token_truncation": True,
@@ -11,32 +11,167 @@ class Settings:
     HOST = "0.0.0.0"
     PORT = 8000
 
+    # Worker role: "all" (default), "rag" (chat routes only, models preloaded at startup) or
+    # "api" (library/auth/payment; the RAG stack is imported lazily on the first RAG request)
+    WORKER_ROLE = os.getenv("WORKER_ROLE", "all")
+
     # Vector DB
     DB_PATH = "./chroma_db"
+    COLLECTION_NAME = "langchain"  # LangChain's default Chroma collection
+
+    # Near-duplicate chunk clustering (scritps/dedup_chunks.py): chunks whose text SimHashes
+    # differ in <= DEDUP_MAX_HAMMING bits and whose embeddings have cosine >= DEDUP_MIN_COSINE
+    # are clustered; COLLECTION_NAME keeps every chunk (tagged cluster_id / cluster_size) and
+    # DEDUP_COLLECTION_NAME one representative per cluster. With SERVE_DEDUPLICATED the engine
+    # (and the BM25 / router / FAISS indexes) use the smaller collection, so fetch_k can be lowered.
+    SERVE_DEDUPLICATED = False
+    DEDUP_COLLECTION_NAME = "langchain_dedup"
+    DEDUP_MAX_HAMMING = 3
+    DEDUP_MIN_COSINE = 0.95
+
+    # Serving backend: "chroma" (DB_PATH) or "faiss" (read-only HNSW index exported from the
+    # collection by scritps/export_ann_index.py, memory-mapped and shared across workers)
+    VECTOR_BACKEND = "chroma"
+    FAISS_INDEX_PATH = "./faiss_index"
+    FAISS_HNSW_M = 32                  # graph degree (export time): recall/memory vs build time
+    FAISS_HNSW_EF_CONSTRUCTION = 200   # export time
+    FAISS_HNSW_EF_SEARCH = 64          # query time: recall vs latency (raised to n_results if lower)
+    FAISS_MMAP = True
+    FAISS_FILTER_KEYS = ["domain"]     # metadata keys usable in `where` filters
+    # Filtered searches keeping at most this many rows scan them exactly; larger ones walk the
+    # graph with a widened beam, which is faster but can miss results when the rows are clustered
+    FAISS_EXACT_FILTER_MAX_ROWS = 50000
+    # Two-stage export: None (full-precision graph), "int8" (scalar-quantized graph, ~4x smaller)
+    # or "truncate" (graph over the first FAISS_TRUNCATE_DIMS dimensions; only worthwhile for
+    # Matryoshka-trained models). Candidates are rescored with the full vectors from disk.
+    FAISS_COMPACT = None
+    FAISS_TRUNCATE_DIMS = 256
+    FAISS_RESCORE_FACTOR = 4           # first-stage candidates per requested result
+
+    # ONNX exports (reranker/embedding backends) are written here once and reused
+    ONNX_CACHE_DIR = "./onnx_models"
 
     # Keys
     GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 
     # Models
     EMBEDDING_MODEL = "BAAI/bge-base-en-v1.5"
+    EMBEDDING_BACKEND = "torch"         # "torch" (SentenceTransformer) or "onnx" (int8 ONNX Runtime)
+    EMBEDDING_ONNX_QUANTIZE = True
+    EMBEDDING_ONNX_MIN_COSINE = 0.98    # mean cosine vs vectors stored in Chroma, else fall back to torch
     LLM_MODEL = "llama-3.1-8b-instant"
     LLM_TEMPERATURE = 0
+    # Tokenizer matching LLM_MODEL for context budgeting (HF repo id or local tokenizer.json);
+    # None or unavailable -> len/4 heuristic, logged as a warning. Meta's repo is gated, this mirror is not.
+    LLM_TOKENIZER = "NousResearch/Meta-Llama-3.1-8B-Instruct"
+    # Local copy of LLM_TOKENIZER's tokenizer.json, used instead of the Hub when present so offline
+    # hosts count real tokens; write it with scritps/fetch_tokenizer.py and ship it with the backend.
+    LLM_TOKENIZER_FILE = "./models/llm_tokenizer.json"
+    TOKEN_COUNT_CACHE_MAX_ENTRIES = 100000   # snippet content hash -> token count
+
+    # Query embedding micro-batching across concurrent requests
+    EMBEDDING_MICROBATCH_ENABLED = True
+    EMBEDDING_MICROBATCH_MAX_SIZE = 32     # texts per encoder call
+    EMBEDDING_MICROBATCH_MAX_WAIT_MS = 5   # how long the first text waits for company
 
     # Retrieval
     RETRIEVAL_K = 6  # used as final top-k in the engine
     FETCH_K_MULTIPLIER = 10
     MIN_FETCH_K = 60  # documents candidate floor to mirror engine behavior
     LAMBDA_MULT = 0.2  # MMR diversity weight used by the engine
+    MMR_OVER_UNION = False  # one MMR pass over the union of MultiQuery variants (hybrid: fused with BM25)
+    RETRIEVAL_MODE = "dense"  # "dense" (MMR) or "hybrid" (MMR + BM25 fused with reciprocal rank fusion)
+    QUERY_EXPANSION_ENABLED = True  # MultiQuery LLM expansion; hybrid mode may make it unnecessary
+
+    # Hybrid (BM25) retrieval
+    BM25_INDEX_PATH = "./bm25_index.pkl"  # built by scritps/build_bm25_index.py / ingest.py; workers only load it
+                                          # (missing or stale -> dense retrieval until it is rebuilt)
+    HYBRID_SPARSE_K = 20   # BM25 candidates per query fed into the fusion
+    HYBRID_RRF_K = 60      # reciprocal rank fusion constant
+
+    # Domain routing: unscoped questions are searched only in the DOMAIN_ROUTER_TOP_N domains
+    # whose chunk-embedding centroids are closest, unless the cut-off margin is too small
+    DOMAIN_ROUTER_ENABLED = True
+    # Written by scritps/build_domain_router.py / ingest.py. Workers only load it; a missing or
+    # stale table (collection changed since the build) turns routing off until it is rebuilt.
+    DOMAIN_ROUTER_PATH = "./chroma_db/domain_centroids.npz"
+    DOMAIN_ROUTER_CENTROIDS_PER_DOMAIN = 2  # 1 = mean direction; more = k-means over each domain's chunks
+    DOMAIN_ROUTER_TOP_N = 3
+    DOMAIN_ROUTER_MIN_MARGIN = 0.02  # N-th minus (N+1)-th domain similarity required to route
+
+    # Adaptive early exit: answer from plain top-k when the best hit is unambiguous,
+    # skipping query expansion and reranking (profiles that use neither are unaffected)
+    EARLY_EXIT_ENABLED = True
+    EARLY_EXIT_MIN_SCORE = 0.80    # top relevance score (0-1) required to exit early
+    EARLY_EXIT_MIN_MARGIN = 0.05   # top-1 minus top-2 relevance required to exit early
 
     # Reranker
     RERANKER_MODEL = "BAAI/bge-reranker-base"
     # Engine uses top_n = max(6, RETRIEVAL_K); with RETRIEVAL_K=5, this is 6
     RERANKER_TOP_N = 6
+    RERANKER_BACKEND = "torch"               # "torch" (HuggingFaceCrossEncoder) or "onnx" (int8 ONNX Runtime)
+    RERANKER_ONNX_QUANTIZE = True
+    RERANK_SCORE_CACHE_ENABLED = True        # (query, chunk id + content hash) -> cross-encoder score
+    RERANK_SCORE_CACHE_MAX_ENTRIES = 50000
+    RERANK_SCORE_CACHE_TTL_SECONDS = None    # keys change with chunk text, so reindexing needs no TTL; LRU bound only
+
+    # Pipeline profiles (latency tiers), selected per request via ChatRequest.mode
+    #   fast:     plain vector top-k, no query expansion, no rerank
+    #   balanced: MMR candidates -> cross-encoder rerank (no query expansion)
+    #   thorough: MMR -> MultiQuery (LLM) -> cross-encoder rerank
+    DEFAULT_PIPELINE_MODE = "thorough"
+    PIPELINE_PROFILES = {
+        "fast": {
+            "RETRIEVAL_K": 4, "fetch_k": 4, "LAMBDA_MULT": 1.0, "RERANKER_TOP_N": 4,
+            "search_type": "similarity", "query_expansion": False, "rerank": False,
+        },
+        "balanced": {
+            "RETRIEVAL_K": 18, "fetch_k": 40, "LAMBDA_MULT": 0.3, "RERANKER_TOP_N": RERANKER_TOP_N,
+            "search_type": "mmr", "query_expansion": False, "rerank": True,
+        },
+        "thorough": {
+            "RETRIEVAL_K": RETRIEVAL_K,
+            "fetch_k": max(MIN_FETCH_K, RETRIEVAL_K * FETCH_K_MULTIPLIER),
+            "LAMBDA_MULT": LAMBDA_MULT,
+            "RERANKER_TOP_N": max(RERANKER_TOP_N, RETRIEVAL_K),
+            "search_type": "mmr", "query_expansion": True, "rerank": True,
+        },
+    }
 
     # Prompt/context limits (match engine truncation logic)
-    MAX_CONTEXT_TOKENS = 2500          # initial truncate_documents cap
-    PROMPT_TOKEN_HARD_LIMIT = 5200      # safeguard before re-truncation
-    FALLBACK_CONTEXT_TOKENS = 2000      # second-stage truncation size
+    MAX_CONTEXT_TOKENS = 2500          # context packing budget
+    PROMPT_TOKEN_HARD_LIMIT = 5200      # template + question + context never exceed this
+
+    # Semantic answer cache (question embedding -> answer + sources). Off by default: questions
+    # differing only in an entity or number can embed above the threshold; check the threshold
+    # on your traffic with scritps/semantic_cache_threshold.py before enabling.
+    SEMANTIC_CACHE_ENABLED = False
+    SEMANTIC_CACHE_THRESHOLD = 0.95           # cosine similarity needed for a hit
+    SEMANTIC_CACHE_KEY_TERM_GUARD = True      # a hit also needs the same numbers / capitalized terms
+    SEMANTIC_CACHE_MAX_ENTRIES = 1000
+    SEMANTIC_CACHE_MAX_MB = 64
+    SEMANTIC_CACHE_TTL_SECONDS = 6 * 3600
+    SEMANTIC_CACHE_VERSION_CHECK_SECONDS = 30  # how often to re-check vector store / settings fingerprint
+
+    # Query expansion cache (normalized question -> MultiQuery variants)
+    QUERY_EXPANSION_CACHE_ENABLED = True
+    QUERY_EXPANSION_CACHE_MAX_ENTRIES = 5000
+    QUERY_EXPANSION_CACHE_TTL_SECONDS = 7 * 24 * 3600
+    QUERY_EXPANSION_CACHE_PATH = "./cache/query_expansions.json"  # None keeps it in memory only
+
+    # Concurrency (async RAG entry points, per worker)
+    RAG_MAX_CONCURRENCY = 8  # in-flight questions; extra requests wait on a semaphore
+    RAG_CPU_WORKERS = 4      # threads for embedding/search/rerank stages
+
+    # Startup: models load in the background; /ready gates chat traffic until done
+    RAG_WARMUP_ENABLED = True  # dummy query through embed/search/rerank before reporting ready
+
+    # Ingestion (scritps/ingest.py): chunking + embedding into DB_PATH / COLLECTION_NAME
+    INGEST_CHUNK_SIZE = 1000        # characters per chunk
+    INGEST_CHUNK_OVERLAP = 150
+    INGEST_EMBED_BATCH_SIZE = 256   # chunks per embedding call / Chroma upsert
+    INGEST_WORKERS = os.cpu_count() or 4  # chunking processes
+    INGEST_MANIFEST_PATH = "./chroma_db/ingest_manifest.json"  # file -> content hash -> chunk ids
 
     # Chat limits
     FREE_CHAT_LIMIT = 3
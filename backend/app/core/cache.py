@@ -0,0 +1,327 @@
+# core/cache.py
+import json
+import logging
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_KEY_TERM_RE = re.compile(r"[A-Za-z0-9][\w.-]*")
+
+
+def key_terms(question: str) -> frozenset:
+    """
+    Numbers and capitalized / acronym tokens (except the first word): the places, years and
+    section numbers that question embeddings barely separate ("population of Kerala in 2011").
+    """
+    tokens = _KEY_TERM_RE.findall(question or "")
+    return frozenset(
+        token.rstrip(".-").lower() for i, token in enumerate(tokens)
+        if any(c.isdigit() for c in token) or (i and token[0].isupper())
+    )
+
+
+class SemanticAnswerCache:
+    """
+    Answer cache keyed by the question embedding.
+    A lookup hits when the cosine similarity to a cached question is >= threshold,
+    so paraphrases reuse the stored answer. Entries are evicted LRU-first, on TTL
+    expiry, and whenever the entry count or approximate memory cap is exceeded.
+    The whole cache is dropped when `version_fn` (vector store / prompt / model
+    fingerprint) returns a different value. A `namespace` (e.g. the pipeline mode)
+    restricts a lookup to entries stored under the same namespace. With `key_term_guard`
+    a hit also needs the same key_terms() as the cached question, so near-misses that
+    differ only in an entity or a number are not served each other's answers.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.95,
+        max_entries: int = 1000,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl_seconds: float = 6 * 3600,
+        version_fn: Optional[Callable[[], Any]] = None,
+        version_check_seconds: float = 30,
+        key_term_guard: bool = True,
+    ):
+        self.threshold = threshold
+        self.key_term_guard = key_term_guard
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.version_fn = version_fn
+        self.version_check_seconds = version_check_seconds
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._next_id = 0
+        self._bytes = 0
+        self._matrix: Optional[np.ndarray] = None   # stacked vectors, rebuilt lazily
+        self._matrix_ids: List[int] = []
+        self._matrix_ns: Optional[np.ndarray] = None
+        self._version: Any = None
+        self._version_checked_at = 0.0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.guarded = 0
+
+    # ---- Internals (call with lock held) ----
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vec = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(vec))
+        return vec / norm if norm else vec
+
+    def _drop(self, entry_id: int):
+        entry = self._entries.pop(entry_id)
+        self._bytes -= entry["size"]
+        self._matrix = None
+
+    def _clear(self):
+        self._entries.clear()
+        self._bytes = 0
+        self._matrix = None
+
+    def _check_version(self):
+        if self.version_fn is None:
+            return
+        now = time.monotonic()
+        if now - self._version_checked_at < self.version_check_seconds:
+            return
+        self._version_checked_at = now
+        try:
+            version = self.version_fn()
+        except Exception as e:
+            logger.warning(f"Semantic cache version check failed: {e}")
+            return
+        if self._version is not None and version != self._version:
+            logger.info("Semantic cache invalidated (vector store or model settings changed)")
+            self.invalidations += 1
+            self._clear()
+        self._version = version
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl_seconds
+        expired = [eid for eid, e in self._entries.items() if e["created"] < cutoff]
+        for eid in expired:
+            self._drop(eid)
+        self.evictions += len(expired)
+
+    # ---- Public API ----
+
+    def get(self, vector, namespace: str = "", question: Optional[str] = None) -> Optional[Tuple[str, List[Dict[str, Any]]]]:
+        """Return (answer, sources) for the most similar cached question in `namespace`, or None."""
+        query = self._normalize(vector)
+        with self._lock:
+            self._check_version()
+            self._expire()
+            if not self._entries:
+                self.misses += 1
+                return None
+
+            if self._matrix is None:
+                self._matrix_ids = list(self._entries.keys())
+                self._matrix = np.stack([self._entries[eid]["vector"] for eid in self._matrix_ids])
+                self._matrix_ns = np.array([self._entries[eid]["namespace"] for eid in self._matrix_ids], dtype=object)
+            sims = np.where(self._matrix_ns == namespace, self._matrix @ query, -np.inf)
+            candidates = np.flatnonzero(sims >= self.threshold)
+            candidates = candidates[np.argsort(-sims[candidates])]
+            if self.key_term_guard and question is not None and len(candidates):
+                terms = key_terms(question)
+                allowed = [c for c in candidates if self._entries[self._matrix_ids[c]]["key_terms"] == terms]
+                if not allowed:
+                    self.guarded += 1
+                    logger.info(f"Semantic cache near-miss refused (key terms differ) for: {question}")
+                candidates = allowed
+            if not len(candidates):
+                self.misses += 1
+                return None
+            best = int(candidates[0])
+
+            entry_id = self._matrix_ids[best]
+            self._entries.move_to_end(entry_id)
+            self.hits += 1
+            entry = self._entries[entry_id]
+            logger.info(f"Semantic cache hit (similarity={float(sims[best]):.3f}) for: {entry['question']}")
+            return entry["answer"], [dict(src) for src in entry["sources"]]
+
+    def put(self, vector, question: str, answer: str, sources: List[Dict[str, Any]], namespace: str = ""):
+        vec = self._normalize(vector)
+        size = vec.nbytes + sys.getsizeof(answer) + sys.getsizeof(question) + sum(
+            sys.getsizeof(str(src)) for src in sources
+        )
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = {
+                "vector": vec,
+                "question": question,
+                "key_terms": key_terms(question),
+                "namespace": namespace,
+                "answer": answer,
+                "sources": [dict(src) for src in sources],
+                "created": time.time(),
+                "size": size,
+            }
+            self._bytes += size
+            self._matrix = None
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "approx_bytes": self._bytes,
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "guarded": self.guarded,
+            }
+
+
+class LRUTTLCache:
+    """
+    Thread-safe key/value cache with LRU eviction and a per-entry TTL.
+    When `persist_path` is set, entries are loaded from / saved to a JSON file so they
+    survive restarts (values must be JSON-serializable). Periodic saves run on a background
+    thread, and each writes a unique temp file before replacing the target, so neither the
+    caller (possibly the event loop) nor other workers sharing the path see a partial file.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 10000,
+        ttl_seconds: Optional[float] = None,
+        persist_path: Optional[str] = None,
+        save_every: int = 50,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.persist_path = persist_path
+        self.save_every = save_every
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._unsaved = 0
+        self._save_lock = threading.Lock()
+        self._saver: Optional[threading.Thread] = None
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _expired(self, created: float) -> bool:
+        return self.ttl_seconds is not None and time.time() - created > self.ttl_seconds
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            if self._expired(item[0]):
+                del self._entries[key]
+                self.evictions += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key: str, value: Any):
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            self._unsaved += 1
+            should_save = self.persist_path and self._unsaved >= self.save_every
+            if should_save and self._saver is not None and self._saver.is_alive():
+                should_save = False  # the running save will be followed by the next one
+            if should_save:
+                self._unsaved = 0
+                self._saver = threading.Thread(target=self.save, name="cache-saver", daemon=True)
+        if should_save:
+            self._saver.start()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def load(self):
+        """Load persisted entries, skipping expired ones. Missing/corrupt files are ignored."""
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return
+        try:
+            with open(self.persist_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            logger.warning(f"Could not load cache from {self.persist_path}: {e}")
+            return
+        with self._lock:
+            for key, (created, value) in data.items():
+                if not self._expired(created):
+                    self._entries[key] = (created, value)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        logger.info(f"Loaded {len(self._entries)} cache entries from {self.persist_path}")
+
+    def save(self):
+        if not self.persist_path:
+            return
+        with self._save_lock:  # one writer per process, so an older snapshot never replaces a newer one
+            with self._lock:
+                data = {key: [created, value] for key, (created, value) in self._entries.items()}
+                self._unsaved = 0
+            tmp_path = None
+            try:
+                directory = os.path.dirname(self.persist_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with tempfile.NamedTemporaryFile(
+                    "w", encoding="utf-8", dir=directory or ".", prefix=f"{os.path.basename(self.persist_path)}.",
+                    suffix=".tmp", delete=False,
+                ) as f:
+                    tmp_path = f.name
+                    json.dump(data, f)
+                os.replace(tmp_path, self.persist_path)
+            except Exception as e:
+                logger.warning(f"Could not persist cache to {self.persist_path}: {e}")
+                if tmp_path and os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "persistent": bool(self.persist_path),
+            }
@@ -0,0 +1,205 @@
+# core/dedup.py
+import hashlib
+import logging
+import re
+import time
+from collections import Counter
+from typing import Dict, List
+
+import numpy as np
+
+from app.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+_WORD_RE = re.compile(r"\w+")
+_BIT_SHIFTS = np.arange(64, dtype=np.uint64)
+
+
+def serving_collection_name() -> str:
+    """The collection the engine and its derived indexes (BM25, router, FAISS) are built from."""
+    if getattr(settings, "SERVE_DEDUPLICATED", False):
+        return getattr(settings, "DEDUP_COLLECTION_NAME", f"{settings.COLLECTION_NAME}_dedup")
+    return settings.COLLECTION_NAME
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1.0, norms)
+
+
+def simhash(text: str, shingle: int = 3) -> int:
+    """64-bit SimHash over lowercased word shingles (stable across processes)."""
+    words = _WORD_RE.findall((text or "").lower())
+    grams = [" ".join(words[i:i + shingle]) for i in range(max(len(words) - shingle + 1, 1))] if words else []
+    if not grams:
+        return 0
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(g.encode("utf-8"), digest_size=8).digest(), "little") for g in grams),
+        dtype=np.uint64, count=len(grams),
+    )
+    votes = ((hashes[:, None] >> _BIT_SHIFTS) & np.uint64(1)).sum(axis=0) * 2 > len(grams)
+    return int(np.packbits(votes, bitorder="little").view("<u8")[0])
+
+
+def _hamming(fingerprints: np.ndarray, fingerprint: np.uint64) -> np.ndarray:
+    xor = (fingerprints ^ fingerprint).astype("<u8")
+    return np.unpackbits(xor.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+def near_duplicate_clusters(
+    fingerprints: np.ndarray, vectors: np.ndarray, max_hamming: int = 3, min_cosine: float = 0.95,
+) -> np.ndarray:
+    """
+    Cluster label (root row index) per row. Two rows are near-duplicates when their SimHash
+    fingerprints differ in <= max_hamming bits AND their unit vectors have cosine >= min_cosine.
+    Candidates come from LSH banding: with max_hamming + 1 bands, any pair within the Hamming
+    bound agrees exactly on at least one band, so only rows sharing a band key are compared.
+    Within a band bucket the clustering is anchor-based (leader clustering): each row is only
+    compared with the bucket's anchors, so a B~C edge is not seen once B has joined anchor A
+    and C has not, unless B and C meet again in another band. Clusters from all bands are
+    merged with union-find, so the result is a subset (never a superset) of the connected
+    components of the near-duplicate relation.
+    """
+    n = len(fingerprints)
+    parent = np.arange(n)
+
+    def find(i: int) -> int:
+        root = i
+        while parent[root] != root:
+            root = parent[root]
+        while parent[i] != root:
+            parent[i], i = root, parent[i]
+        return root
+
+    bands = max_hamming + 1
+    width = 64 // bands
+    for band in range(bands):
+        bits = 64 - band * width if band == bands - 1 else width
+        keys = (fingerprints >> np.uint64(band * width)) & np.uint64((1 << bits) - 1)
+        order = np.argsort(keys, kind="stable")
+        boundaries = np.flatnonzero(np.diff(keys[order])) + 1
+        for group in np.split(order, boundaries):
+            # Compare against one anchor at a time; rows that match it are merged and dropped,
+            # so a bucket of k copies of one template costs O(k), not O(k^2) pairs.
+            pending = group
+            while len(pending) > 1:
+                anchor, rest = pending[0], pending[1:]
+                match = (_hamming(fingerprints[rest], fingerprints[anchor]) <= max_hamming) & \
+                        (vectors[rest] @ vectors[anchor] >= min_cosine)
+                root = find(anchor)
+                for row in rest[match]:
+                    parent[find(row)] = root
+                pending = rest[~match]
+    return np.asarray([find(i) for i in range(n)])
+
+
+def _representative(members: np.ndarray, vectors: np.ndarray) -> int:
+    """Member closest to the cluster's mean direction."""
+    if len(members) == 1:
+        return int(members[0])
+    member_vectors = vectors[members]
+    return int(members[np.argmax(member_vectors @ member_vectors.mean(axis=0))])
+
+
+def deduplicate_collection(
+    source, target=None, max_hamming: int = 3, min_cosine: float = 0.95,
+    max_cluster_sources: int = 10, batch_size: int = 5000, dry_run: bool = False,
+) -> Dict:
+    """
+    Cluster near-duplicate chunks of `source` and record the membership in its metadata
+    (cluster_id = representative chunk id, cluster_size). When `target` is given it is synced
+    to hold only the representatives (one per cluster, singletons included), each carrying
+    cluster_size and the sources its duplicates came from (cluster_sources).
+    dry_run only computes the report.
+    """
+    started = time.perf_counter()
+    ids: List[str] = []
+    texts: List[str] = []
+    metadatas: List[Dict] = []
+    vector_pages, fingerprints = [], []
+    offset = 0
+    while True:
+        page = source.get(include=["documents", "metadatas", "embeddings"], limit=batch_size, offset=offset)
+        if not len(page["ids"]):
+            break
+        ids.extend(page["ids"])
+        texts.extend(doc or "" for doc in page["documents"])
+        metadatas.extend(dict(m or {}) for m in page["metadatas"])
+        vector_pages.append(np.asarray(page["embeddings"], dtype=np.float32))
+        fingerprints.extend(simhash(doc or "") for doc in page["documents"])
+        offset += len(page["ids"])
+    if not ids:
+        return {"chunks": 0, "clusters": 0, "duplicates": 0, "reduction": 0.0, "seconds": 0.0}
+
+    raw_vectors = np.concatenate(vector_pages)
+    vectors = _normalize(raw_vectors)
+    labels = near_duplicate_clusters(
+        np.asarray(fingerprints, dtype=np.uint64), vectors, max_hamming=max_hamming, min_cosine=min_cosine,
+    )
+    order = np.argsort(labels, kind="stable")
+    boundaries = np.flatnonzero(np.diff(labels[order])) + 1
+    clusters = np.split(order, boundaries)
+
+    representatives: Dict[int, List[int]] = {}
+    cluster_of: Dict[int, int] = {}
+    for members in clusters:
+        rep = _representative(members, vectors)
+        representatives[rep] = members.tolist()
+        for row in members:
+            cluster_of[int(row)] = rep
+
+    # ---- Membership metadata on the source chunks (only rows whose cluster changed) ----
+    changed_ids, changed_metadatas = [], []
+    for row, rep in cluster_of.items():
+        membership = {"cluster_id": ids[rep], "cluster_size": len(representatives[rep])}
+        if any(metadatas[row].get(key) != value for key, value in membership.items()):
+            metadatas[row].update(membership)
+            changed_ids.append(ids[row])
+            changed_metadatas.append(metadatas[row])
+    for start in range(0, len(changed_ids) if not dry_run else 0, batch_size):
+        source.update(ids=changed_ids[start:start + batch_size], metadatas=changed_metadatas[start:start + batch_size])
+
+    # ---- Serving collection: representatives only ----
+    if target is not None and not dry_run:
+        keep = sorted(representatives)
+        for start in range(0, len(keep), batch_size):
+            rows = keep[start:start + batch_size]
+            rows_metadatas = []
+            for rep in rows:
+                sources = dict.fromkeys(metadatas[m].get("source") for m in representatives[rep])
+                sources.pop(None, None)
+                rows_metadatas.append({
+                    **metadatas[rep], "cluster_sources": ", ".join(list(sources)[:max_cluster_sources]),
+                })
+            target.upsert(
+                ids=[ids[r] for r in rows],
+                documents=[texts[r] for r in rows],
+                metadatas=rows_metadatas,
+                embeddings=raw_vectors[rows],
+            )
+        keep_ids = {ids[r] for r in keep}
+        stale, offset = [], 0
+        while True:
+            page = target.get(include=[], limit=batch_size, offset=offset)
+            if not page["ids"]:
+                break
+            stale.extend(i for i in page["ids"] if i not in keep_ids)
+            offset += len(page["ids"])
+        for start in range(0, len(stale), batch_size):
+            target.delete(ids=stale[start:start + batch_size])
+
+    sizes = Counter(len(members) for members in representatives.values())
+    report = {
+        "chunks": len(ids),
+        "clusters": len(representatives),
+        "duplicates": len(ids) - len(representatives),
+        "reduction": round(1 - len(representatives) / len(ids), 4),
+        "largest_clusters": sorted((len(m) for m in representatives.values()), reverse=True)[:5],
+        "singletons": sizes.get(1, 0),
+        "metadata_updates": len(changed_ids),
+        "seconds": round(time.perf_counter() - started, 2),
+    }
+    logger.info(f"Deduplicated {report['chunks']} chunks into {report['clusters']} clusters "
+                f"({report['reduction']:.1%} fewer) in {report['seconds']}s")
+    return report
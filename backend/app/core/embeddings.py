@@ -0,0 +1,179 @@
+# core/embeddings.py
+import asyncio
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+
+def _documents_are_queries(embeddings: Embeddings) -> bool:
+    """True for models whose embed_query is embed_documents([text])[0] (no query instruction/prompt)."""
+    from langchain_community.embeddings.huggingface import HuggingFaceEmbeddings
+
+    return type(embeddings).embed_query is HuggingFaceEmbeddings.embed_query
+
+
+def embed_queries(embeddings: Embeddings, texts: List[str]) -> List[List[float]]:
+    """
+    Embed several queries with embed_query semantics, in one call where that is safe.
+    Models that add a query instruction (BGE query prompts, instruct models) would lose
+    recall if queries went through embed_documents, so they fall back to embed_query per text.
+    """
+    batched = getattr(embeddings, "embed_queries", None)
+    if batched is not None:
+        return batched(list(texts))
+    if _documents_are_queries(embeddings):
+        return embeddings.embed_documents(list(texts))
+    return [embeddings.embed_query(text) for text in texts]
+
+
+class MicroBatchingEmbeddings(Embeddings):
+    """
+    Wraps an Embeddings model and coalesces query embeddings from concurrent requests
+    into one batch. A background thread collects queries for up to `max_wait_ms` (or
+    until `max_batch_size` are queued), embeds them with one embed_queries() call, and
+    resolves each caller's future with its vector. Document embeddings go straight to
+    the wrapped model.
+    """
+
+    def __init__(self, inner: Embeddings, max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self.inner = inner
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+
+        self._queue: "queue.Queue[Optional[Tuple[str, Future]]]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+        self.batches = 0
+        self.texts = 0
+        self.largest_batch = 0
+
+    # ---- Worker ----
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._start_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                self._worker.start()
+
+    def _collect(self, first: Tuple[str, Future]) -> Tuple[List[Tuple[str, Future]], bool]:
+        """Gather up to max_batch_size items within max_wait; returns (batch, stop_requested)."""
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch, stop = self._collect(first)
+            live = [(text, fut) for text, fut in batch if fut.set_running_or_notify_cancel()]
+            if live:
+                try:
+                    vectors = embed_queries(self.inner, [text for text, _ in live])
+                    for (_, fut), vector in zip(live, vectors):
+                        fut.set_result(vector)
+                except Exception as e:
+                    for _, fut in live:
+                        fut.set_exception(e)
+                self.batches += 1
+                self.texts += len(live)
+                self.largest_batch = max(self.largest_batch, len(live))
+            if stop:
+                return
+
+    def _submit(self, texts: List[str]) -> List[Future]:
+        self._ensure_worker()
+        futures = []
+        for text in texts:
+            fut: Future = Future()
+            self._queue.put((text, fut))
+            futures.append(fut)
+        return futures
+
+    # ---- Embeddings API ----
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.inner.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._submit([text])[0].result()
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        if len(texts) > self.max_batch_size:
+            return embed_queries(self.inner, texts)
+        return [fut.result() for fut in self._submit(list(texts))]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.inner.aembed_documents(texts)
+
+    async def aembed_queries(self, texts: List[str]) -> List[List[float]]:
+        if len(texts) > self.max_batch_size:
+            return await asyncio.to_thread(embed_queries, self.inner, texts)
+        return list(await asyncio.gather(*(asyncio.wrap_future(f) for f in self._submit(list(texts)))))
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await asyncio.wrap_future(self._submit([text])[0])
+
+    def close(self):
+        if self._worker is not None and self._worker.is_alive():
+            self._queue.put(None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "texts": self.texts,
+            "avg_batch_size": round(self.texts / self.batches, 2) if self.batches else 0.0,
+            "largest_batch": self.largest_batch,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+        }
+
+
+def check_embedding_compatibility(
+    embeddings: Embeddings,
+    db_path: str,
+    collection_name: str,
+    sample_size: int = 32,
+    min_cosine: float = 0.98,
+) -> Tuple[bool, Dict[str, float]]:
+    """
+    Re-embed a sample of stored chunks with `embeddings` and compare against the vectors
+    persisted in Chroma. Returns (compatible, {"mean_cosine", "min_cosine", "sampled"}).
+    """
+    import chromadb
+
+    collection = chromadb.PersistentClient(path=db_path).get_collection(collection_name)
+    sample = collection.get(limit=sample_size, include=["documents", "embeddings"])
+    pairs = [(doc, vec) for doc, vec in zip(sample["documents"], sample["embeddings"]) if doc]
+    if not pairs:
+        return True, {"mean_cosine": 1.0, "min_cosine": 1.0, "sampled": 0}
+
+    stored = np.asarray([vec for _, vec in pairs], dtype=np.float32)
+    fresh = np.asarray(embeddings.embed_documents([doc for doc, _ in pairs]), dtype=np.float32)
+    stored /= np.clip(np.linalg.norm(stored, axis=1, keepdims=True), 1e-12, None)
+    fresh /= np.clip(np.linalg.norm(fresh, axis=1, keepdims=True), 1e-12, None)
+    cosines = np.sum(stored * fresh, axis=1)
+
+    report = {"mean_cosine": float(cosines.mean()), "min_cosine": float(cosines.min()), "sampled": len(pairs)}
+    return report["mean_cosine"] >= min_cosine, report
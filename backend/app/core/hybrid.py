@@ -0,0 +1,252 @@
+# core/hybrid.py
+import logging
+import math
+import os
+import pickle
+import re
+import tempfile
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from app.core.retrievers import VectorSearchRetriever
+
+logger = logging.getLogger(__name__)
+
+# Keeps acronyms, scheme names and IDs ("nfhs-5", "pm_kisan", "2011") as single tokens.
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+_SPLIT_RE = re.compile(r"[-_./]")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased terms; compound IDs are indexed both whole and by their parts."""
+    tokens: List[str] = []
+    for token in _TOKEN_RE.findall((text or "").lower()):
+        tokens.append(token)
+        parts = _SPLIT_RE.split(token)
+        if len(parts) > 1:
+            tokens.extend(p for p in parts if p)
+    return tokens
+
+
+def collection_fingerprint(collection, db_path: Optional[str] = None) -> Tuple[int, float]:
+    """
+    (row count, mtime of DB_PATH/chroma.sqlite3). Any Chroma write bumps the mtime (reads do not),
+    so this also catches same-count edits such as an incremental reindex of a changed file.
+    """
+    sqlite_path = os.path.join(db_path, "chroma.sqlite3") if db_path else None
+    mtime = os.path.getmtime(sqlite_path) if sqlite_path and os.path.exists(sqlite_path) else 0.0
+    return collection.count(), mtime
+
+
+class BM25Index:
+    """
+    In-process Okapi BM25 inverted index over chunk ids.
+    Postings are stored as numpy arrays (doc index, term frequency) per term, so a query
+    only touches the postings of its own terms.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.ids: List[str] = []
+        self.doc_lens = np.zeros(0, dtype=np.float32)
+        self.avgdl = 0.0
+        self.postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self.idf: Dict[str, float] = {}
+        self.doc_domains = np.zeros(0, dtype=object)  # metadata["domain"] per doc, for scoped search
+        self.fingerprint: Optional[Tuple[int, float]] = None  # collection_fingerprint() at build time
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    # ---- Build / persist ----
+
+    def build(self, ids: List[str], texts: List[str], domains: Optional[List[Optional[str]]] = None) -> "BM25Index":
+        raw: Dict[str, Tuple[List[int], List[int]]] = defaultdict(lambda: ([], []))
+        lens = []
+        for idx, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            lens.append(sum(counts.values()))
+            for term, tf in counts.items():
+                docs, tfs = raw[term]
+                docs.append(idx)
+                tfs.append(tf)
+
+        n_docs = len(ids)
+        self.ids = list(ids)
+        self.doc_lens = np.asarray(lens, dtype=np.float32)
+        self.avgdl = float(self.doc_lens.mean()) if n_docs else 0.0
+        self.doc_domains = np.asarray(domains if domains is not None else [None] * n_docs, dtype=object)
+        self.postings = {
+            term: (np.asarray(docs, dtype=np.int32), np.asarray(tfs, dtype=np.float32))
+            for term, (docs, tfs) in raw.items()
+        }
+        self.idf = {
+            term: math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, (docs, _) in self.postings.items()
+        }
+        return self
+
+    @classmethod
+    def from_collection(cls, collection, batch_size: int = 5000, db_path: Optional[str] = None) -> "BM25Index":
+        """Build from every document in a Chroma collection (paged reads)."""
+        fingerprint = collection_fingerprint(collection, db_path)
+        ids, texts, domains = [], [], []
+        offset = 0
+        while True:
+            page = collection.get(include=["documents", "metadatas"], limit=batch_size, offset=offset)
+            if not page["ids"]:
+                break
+            ids.extend(page["ids"])
+            texts.extend(doc or "" for doc in page["documents"])
+            domains.extend((metadata or {}).get("domain") for metadata in page["metadatas"])
+            offset += len(page["ids"])
+        logger.info(f"Building BM25 index over {len(ids)} chunks...")
+        index = cls().build(ids, texts, domains)
+        index.fingerprint = fingerprint
+        return index
+
+    def save(self, path: str):
+        """Write to a unique temp file and rename, so a worker loading concurrently never sees a partial file."""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            "wb", dir=directory or ".", prefix=f"{os.path.basename(path)}.", suffix=".tmp", delete=False
+        ) as f:
+            tmp_path = f.name
+            try:
+                pickle.dump(self.__dict__, f, protocol=pickle.HIGHEST_PROTOCOL)
+            except BaseException:
+                f.close()
+                os.remove(tmp_path)
+                raise
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        index = cls()
+        with open(path, "rb") as f:
+            index.__dict__.update(pickle.load(f))
+        return index
+
+    # ---- Query ----
+
+    def search(self, query: str, n: int, domains: Optional[List[str]] = None) -> List[Tuple[str, float]]:
+        """Top-n (chunk id, bm25 score) for the query, optionally only among chunks of `domains`."""
+        if not self.ids:
+            return []
+        if domains and len(self.doc_domains) != len(self.ids):
+            return []  # index predates domain metadata; cannot scope, so contribute nothing
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        norm = self.k1 * (1 - self.b + self.b * self.doc_lens / (self.avgdl or 1.0))
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            docs, tfs = posting
+            scores[docs] += self.idf[term] * tfs * (self.k1 + 1) / (tfs + norm[docs])
+        if domains:
+            scores[~np.isin(self.doc_domains, list(domains))] = 0.0
+        n = min(n, int(np.count_nonzero(scores)))
+        if n <= 0:
+            return []
+        top = np.argpartition(-scores, n - 1)[:n]
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[i], float(scores[i])) for i in top]
+
+
+def load_or_build_bm25(
+    collection, path: Optional[str], db_path: Optional[str] = None, save: bool = True,
+) -> Optional[BM25Index]:
+    """
+    Load a prebuilt index when it matches the collection (fingerprint, domain column), else build
+    one and save it to `path`. db_path is the Chroma directory whose sqlite mtime goes into the
+    fingerprint. Serving workers pass save=False: they only load, and a missing or stale index
+    returns None (dense retrieval) instead of every worker rebuilding and rewriting it; building
+    is left to scritps/build_bm25_index.py / ingest.py.
+    """
+    if path and os.path.exists(path):
+        index = BM25Index.load(path)
+        fingerprint = collection_fingerprint(collection, db_path)
+        if (
+            getattr(index, "fingerprint", None) == fingerprint
+            and len(index) == fingerprint[0]
+            and len(index.doc_domains) == len(index)
+        ):
+            logger.info(f"Loaded BM25 index ({len(index)} chunks) from {path}")
+            return index
+        reason = f"BM25 index at {path} is stale"
+    else:
+        reason = f"No prebuilt BM25 index at {path}"
+    if not save:
+        logger.warning(f"{reason}; serving dense retrieval until scritps/build_bm25_index.py rebuilds it")
+        return None
+    logger.info(f"{reason}, building one")
+    index = BM25Index.from_collection(collection, db_path=db_path)
+    if path:
+        index.save(path)
+    return index
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[str]:
+    """Fuse ranked id lists: score(id) = sum 1 / (k + rank)."""
+    fused: Dict[str, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            fused[doc_id] += 1.0 / (k + rank + 1)
+    return sorted(fused, key=fused.get, reverse=True)
+
+
+class HybridRetriever(VectorSearchRetriever):
+    """
+    Dense (MMR) + sparse (BM25) retrieval fused with reciprocal rank fusion.
+    Exact matches on acronyms / IDs come from BM25 even when the dense search misses them.
+    """
+
+    sparse_index: BM25Index
+    sparse_k: int = 20
+    rrf_k: int = 60
+
+    def _sparse_ids(self, query: str) -> List[str]:
+        return [doc_id for doc_id, _ in self.sparse_index.search(query, self.sparse_k, self.domains)]
+
+    def _fetch_missing(self, fused_ids: List[List[str]], known: Dict[str, Document]):
+        """Sparse-only hits are fetched from the vector store in one call."""
+        missing = list({doc_id for ids in fused_ids for doc_id in ids if doc_id not in known})
+        if missing:
+            fetched = self.vectorstore._collection.get(ids=missing, include=["documents", "metadatas"])
+            for doc_id, text, metadata in zip(fetched["ids"], fetched["documents"], fetched["metadatas"]):
+                known[doc_id] = Document(id=doc_id, page_content=text or "", metadata=metadata or {})
+
+    def search_many(self, queries: List[str]) -> List[List[Document]]:
+        dense_lists = super().search_many(queries)
+        k = self.search_kwargs.get("k", 4)
+
+        fused_ids: List[List[str]] = []
+        known: Dict[str, Document] = {}
+        for query, dense in zip(queries, dense_lists):
+            for doc in dense:
+                known[doc.id] = doc
+            fused_ids.append(reciprocal_rank_fusion([[d.id for d in dense], self._sparse_ids(query)], k=self.rrf_k)[:k])
+
+        self._fetch_missing(fused_ids, known)
+        return [[known[doc_id] for doc_id in ids if doc_id in known] for ids in fused_ids]
+
+    def search_union(self, queries: List[str]) -> List[Document]:
+        """
+        MMR_OVER_UNION in hybrid mode: the single dense MMR ranking over all queries is fused
+        with every query's BM25 ranking, keeping the same k-per-query budget.
+        """
+        if not queries:
+            return []
+        dense = super().search_union(queries)
+        known: Dict[str, Document] = {doc.id: doc for doc in dense}
+        fused = reciprocal_rank_fusion(
+            [[d.id for d in dense]] + [self._sparse_ids(query) for query in queries], k=self.rrf_k
+        )[:self.search_kwargs.get("k", 4) * len(queries)]
+        self._fetch_missing([fused], known)
+        return [known[doc_id] for doc_id in fused if doc_id in known]
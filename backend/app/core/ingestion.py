@@ -0,0 +1,364 @@
+# core/ingestion.py
+"""
+Builds / updates the Chroma collection from the per-domain folders under
+settings.GDRIVE_ROOT_PATH. Files are read and chunked in a process pool, chunks are
+embedded in large batches with settings.EMBEDDING_MODEL in the parent process, and
+written to Chroma with bulk upserts. An IngestManifest (file -> content hash -> chunk
+ids) makes re-runs incremental. Used by scritps/ingest.py.
+"""
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import re
+import resource
+import time
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_EXTENSIONS = {".txt", ".md", ".html", ".htm", ".pdf"}
+
+_TAG_RE = re.compile(r"<[^>]+>")
+
+Chunk = Tuple[str, str, Dict[str, Any]]  # (chunk id, text, metadata)
+
+
+@dataclass
+class SourceFile:
+    path: str
+    relpath: str      # relative to the corpus root; stable identity across machines
+    domain_id: str
+
+
+@dataclass
+class IngestionStats:
+    files: int = 0
+    failed_files: int = 0
+    chunks: int = 0
+    embed_seconds: float = 0.0
+    write_seconds: float = 0.0
+    started: float = field(default_factory=time.perf_counter)
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def report(self) -> Dict[str, Any]:
+        own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        workers = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+        return {
+            "files": self.files,
+            "failed_files": self.failed_files,
+            "chunks": self.chunks,
+            "seconds": round(self.elapsed, 1),
+            "chunks_per_second": round(self.chunks / self.elapsed, 1) if self.elapsed else 0.0,
+            "embed_seconds": round(self.embed_seconds, 1),
+            "write_seconds": round(self.write_seconds, 1),
+            "peak_rss_mb": round(own, 1),                 # parent: embedding model + batches
+            "peak_worker_rss_mb": round(workers, 1),      # largest chunking worker
+        }
+
+
+# ---- Discovery / chunking (runs in worker processes) ----
+
+def discover_files(root: str, domains: Dict[str, str]) -> List[SourceFile]:
+    """Supported files under root/<folder> for every domain id -> folder name mapping."""
+    files: List[SourceFile] = []
+    for domain_id, folder in domains.items():
+        domain_dir = os.path.join(root, folder)
+        if not os.path.isdir(domain_dir):
+            logger.warning(f"Domain folder missing for {domain_id}: {domain_dir}")
+            continue
+        for dirpath, _, filenames in os.walk(domain_dir):
+            for filename in sorted(filenames):
+                if os.path.splitext(filename)[1].lower() in SUPPORTED_EXTENSIONS:
+                    path = os.path.join(dirpath, filename)
+                    files.append(SourceFile(path, os.path.relpath(path, root), domain_id))
+    return files
+
+
+def read_text(path: str) -> str:
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".pdf":
+        try:
+            from pypdf import PdfReader
+        except ImportError as e:
+            raise RuntimeError("PDF ingestion needs `pip install pypdf`") from e
+        return "\n".join(page.extract_text() or "" for page in PdfReader(path).pages)
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        text = f.read()
+    if ext in (".html", ".htm"):
+        text = _TAG_RE.sub(" ", text)
+    return text
+
+
+def chunk_id(relpath: str, index: int) -> str:
+    return f"{hashlib.sha1(relpath.encode('utf-8')).hexdigest()[:16]}-{index:05d}"
+
+
+def chunk_file(source: SourceFile, chunk_size: int, chunk_overlap: int, snippet_chars: int) -> List[Chunk]:
+    """Read and split one file; metadata carries source, title, domain and the precomputed snippet."""
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    from app.core.utils import snippet_metadata
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    filename = os.path.basename(source.path)
+    title = os.path.splitext(filename)[0].replace("_", " ").strip()
+    chunks: List[Chunk] = []
+    for i, text in enumerate(splitter.split_text(read_text(source.path))):
+        text = text.strip()
+        if not text:
+            continue
+        metadata = {"source": filename, "title": title, "domain": source.domain_id, "path": source.relpath}
+        metadata.update(snippet_metadata(text, snippet_chars))
+        chunks.append((chunk_id(source.relpath, i), text, metadata))
+    return chunks
+
+
+# ---- Embedding / writing (parent process) ----
+
+def _batches(items: List[Chunk], size: int) -> Iterable[List[Chunk]]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def write_chunks(collection, embeddings, chunks: List[Chunk], stats: IngestionStats, embed_batch_size: int):
+    """Embed in batches of embed_batch_size and upsert each batch into the collection."""
+    max_write = collection._client.get_max_batch_size() if hasattr(collection, "_client") else 5000
+    for batch in _batches(chunks, min(embed_batch_size, max_write)):
+        start = time.perf_counter()
+        vectors = embeddings.embed_documents([text for _, text, _ in batch])
+        stats.embed_seconds += time.perf_counter() - start
+
+        start = time.perf_counter()
+        collection.upsert(
+            ids=[cid for cid, _, _ in batch],
+            embeddings=vectors,
+            documents=[text for _, text, _ in batch],
+            metadatas=[metadata for _, _, metadata in batch],
+        )
+        stats.write_seconds += time.perf_counter() - start
+        stats.chunks += len(batch)
+
+
+def ingest_files(
+    files: List[SourceFile],
+    collection,
+    embeddings,
+    workers: int = 4,
+    chunk_size: int = 1000,
+    chunk_overlap: int = 150,
+    embed_batch_size: int = 256,
+    snippet_chars: int = 600,
+    on_file_done=None,
+) -> IngestionStats:
+    """
+    Chunk `files` in a process pool and stream the chunks into embedding + bulk upserts;
+    embedding overlaps with chunking of the remaining files.
+    `on_file_done(source, chunk_ids)` is called after a file's chunks are written.
+    """
+    from app.core.utils import get_tokenizer
+
+    get_tokenizer()  # load once in the parent; forked workers inherit it
+    stats = IngestionStats()
+    pending: List[Chunk] = []
+    done_files: List[Tuple[SourceFile, List[str]]] = []
+
+    def flush():
+        write_chunks(collection, embeddings, pending, stats, embed_batch_size)
+        pending.clear()
+        for source, ids in done_files:
+            if on_file_done is not None:
+                on_file_done(source, ids)
+        done_files.clear()
+        logger.info(f"Ingested {stats.files}/{len(files)} files, {stats.chunks} chunks "
+                    f"({stats.chunks / stats.elapsed:.1f} chunks/s)")
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(chunk_file, source, chunk_size, chunk_overlap, snippet_chars): source for source in files
+        }
+        for future in as_completed(futures):
+            source = futures[future]
+            try:
+                chunks = future.result()
+            except Exception as e:
+                stats.failed_files += 1
+                logger.warning(f"Skipping {source.relpath}: {e}")
+                continue
+            stats.files += 1
+            pending.extend(chunks)
+            done_files.append((source, [cid for cid, _, _ in chunks]))
+            if len(pending) >= embed_batch_size:
+                flush()
+    if pending or done_files:
+        flush()
+    return stats
+
+
+# ---- Incremental re-indexing ----
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class IngestManifest:
+    """
+    JSON sidecar of what is indexed: relpath -> {sha256, size, mtime, domain, chunk_ids},
+    plus the chunking parameters. A file is re-chunked only if its content hash changed
+    (size + mtime short-circuit the hash for untouched files) or the chunking changed.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path: str, chunking: Dict[str, Any]):
+        self.path = path
+        self.chunking = chunking
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self._planned: Dict[str, Tuple[str, int, float]] = {}  # relpath -> (sha256, size, mtime) at plan time
+        self._unsaved = 0
+
+    def load(self) -> "IngestManifest":
+        if not os.path.exists(self.path):
+            return self
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") == self.VERSION and data.get("chunking") == self.chunking:
+            self.files = data.get("files", {})
+        else:
+            logger.info("Manifest chunking parameters changed, every file will be re-indexed")
+            # Keep chunk ids so the old chunks are still replaced / deleted.
+            self.files = {
+                rel: {"domain": e.get("domain"), "chunk_ids": e.get("chunk_ids", [])}
+                for rel, e in data.get("files", {}).items()
+            }
+        return self
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": self.VERSION, "chunking": self.chunking, "files": self.files}, f)
+        os.replace(tmp, self.path)
+        self._unsaved = 0
+
+    def plan(
+        self, files: List[SourceFile], domains: Optional[Iterable[str]] = None
+    ) -> Tuple[List[SourceFile], List[str], List[str]]:
+        """
+        Split into (new or changed files, unchanged relpaths, removed relpaths).
+        Only manifest entries of `domains` (default: all) can count as removed.
+        """
+        changed: List[SourceFile] = []
+        unchanged: List[str] = []
+        for source in files:
+            entry = self.files.get(source.relpath)
+            stat = os.stat(source.path)
+            if entry and "sha256" in entry and entry.get("size") == stat.st_size and entry.get("mtime") == stat.st_mtime:
+                unchanged.append(source.relpath)
+                continue
+            sha = file_sha256(source.path)
+            if entry and entry.get("sha256") == sha:
+                entry.update(size=stat.st_size, mtime=stat.st_mtime)  # touched, not modified
+                unchanged.append(source.relpath)
+                continue
+            # Hash taken before chunking, so an edit during the run is picked up next time.
+            self._planned[source.relpath] = (sha, stat.st_size, stat.st_mtime)
+            changed.append(source)
+
+        present = {source.relpath for source in files}
+        scope = set(domains) if domains is not None else None
+        removed = [
+            relpath for relpath, entry in self.files.items()
+            if relpath not in present and (scope is None or entry.get("domain") in scope)
+        ]
+        return changed, unchanged, removed
+
+    def record(self, source: SourceFile, chunk_ids: List[str], save_every: int = 50):
+        sha, size, mtime = self._planned.pop(source.relpath)
+        self.files[source.relpath] = {
+            "sha256": sha,
+            "size": size,
+            "mtime": mtime,
+            "domain": source.domain_id,
+            "chunk_ids": chunk_ids,
+        }
+        self._unsaved += 1
+        if self._unsaved >= save_every:
+            self.save()
+
+    def stale_ids(self, relpath: str, new_ids: Optional[List[str]] = None) -> List[str]:
+        """Chunk ids previously indexed for relpath that are not in new_ids."""
+        keep = set(new_ids or [])
+        return [cid for cid in self.files.get(relpath, {}).get("chunk_ids", []) if cid not in keep]
+
+
+@contextmanager
+def ingest_lock(manifest_path: str):
+    """Exclusive lock so only one ingestion process writes to the collection at a time."""
+    directory = os.path.dirname(manifest_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(f"{manifest_path}.lock", "w") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise RuntimeError(f"Another ingestion run holds {manifest_path}.lock")
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _delete_ids(collection, ids: List[str], batch_size: int = 5000) -> int:
+    for start in range(0, len(ids), batch_size):
+        collection.delete(ids=ids[start:start + batch_size])
+    return len(ids)
+
+
+def reindex(
+    files: List[SourceFile],
+    collection,
+    embeddings,
+    manifest: IngestManifest,
+    domains: Optional[Iterable[str]] = None,
+    **ingest_kwargs,
+) -> Dict[str, Any]:
+    """
+    Incremental run: ingest only new/changed files, then delete their superseded chunks and
+    the chunks of files that disappeared. New chunks are upserted before stale ones are
+    deleted, so an interrupted run never leaves a changed file without chunks.
+    Not a live update: Chroma's PersistentClient does not support several processes
+    writing one directory, and a running API keeps the index it loaded. Run ingestion
+    with no other writer and restart serving workers afterwards.
+    """
+    changed, unchanged, removed = manifest.plan(files, domains)
+    logger.info(f"Re-index plan: {len(changed)} new/changed, {len(unchanged)} unchanged, {len(removed)} removed")
+
+    deleted = 0
+
+    def on_file_done(source: SourceFile, chunk_ids: List[str]):
+        nonlocal deleted
+        deleted += _delete_ids(collection, manifest.stale_ids(source.relpath, chunk_ids))
+        manifest.record(source, chunk_ids)
+
+    stats = ingest_files(changed, collection, embeddings, on_file_done=on_file_done, **ingest_kwargs)
+    for relpath in removed:
+        deleted += _delete_ids(collection, manifest.stale_ids(relpath))
+        manifest.files.pop(relpath, None)
+    manifest.save()
+
+    report = stats.report()
+    report.update(unchanged_files=len(unchanged), removed_files=len(removed), deleted_chunks=deleted)
+    return report
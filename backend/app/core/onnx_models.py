@@ -0,0 +1,159 @@
+# core/onnx_models.py
+"""
+ONNX Runtime backends for the CPU-heavy models.
+Exports a Hugging Face model to ONNX once (optionally int8 dynamic-quantized) into
+settings.ONNX_CACHE_DIR and serves it with onnxruntime. Needs the optional
+`optimum[onnxruntime]` package; importing this module does not.
+"""
+import logging
+import os
+import re
+import threading
+from typing import List, Tuple
+
+import numpy as np
+from langchain_community.cross_encoders import BaseCrossEncoder
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+_export_lock = threading.Lock()
+
+
+def _model_dir(model_name: str, task: str, cache_dir: str) -> str:
+    return os.path.join(cache_dir, task, re.sub(r"[^\w.-]+", "__", model_name))
+
+
+def export_onnx_model(model_name: str, task: str, cache_dir: str, quantize: bool = True) -> str:
+    """
+    Export `model_name` for `task` ("text-classification" or "feature-extraction") to ONNX
+    and return the path of the .onnx file to load. Reuses a previous export if present.
+    """
+    out_dir = _model_dir(model_name, task, cache_dir)
+    onnx_path = os.path.join(out_dir, "model_quantized.onnx" if quantize else "model.onnx")
+    with _export_lock:
+        if os.path.exists(onnx_path):
+            return onnx_path
+
+        try:
+            from optimum.onnxruntime import (
+                ORTModelForFeatureExtraction, ORTModelForSequenceClassification, ORTQuantizer,
+            )
+            from optimum.onnxruntime.configuration import AutoQuantizationConfig
+            from transformers import AutoTokenizer
+        except ImportError as e:
+            raise RuntimeError("ONNX export needs `pip install optimum[onnxruntime]`") from e
+
+        logger.info(f"Exporting {model_name} ({task}) to ONNX in {out_dir} (one-time)...")
+        model_cls = ORTModelForSequenceClassification if task == "text-classification" else ORTModelForFeatureExtraction
+        model = model_cls.from_pretrained(model_name, export=True)
+        model.save_pretrained(out_dir)
+        AutoTokenizer.from_pretrained(model_name).save_pretrained(out_dir)
+
+        if quantize:
+            # Dynamic int8 quantization: weights stored int8, activations quantized at runtime.
+            quantizer = ORTQuantizer.from_pretrained(out_dir)
+            qconfig = AutoQuantizationConfig.avx2(is_static=False, per_channel=False)
+            quantizer.quantize(save_dir=out_dir, quantization_config=qconfig)
+        logger.info(f"✅ ONNX export ready: {onnx_path}")
+    return onnx_path
+
+
+class _OnnxModel:
+    """Shared tokenizer + onnxruntime session loading for the ONNX backends."""
+
+    def __init__(self, model_name: str, task: str, cache_dir: str, quantize: bool = True,
+                 max_length: int = 512, num_threads: int = 0):
+        try:
+            import onnxruntime as ort
+            from transformers import AutoTokenizer
+        except ImportError as e:
+            raise RuntimeError("ONNX backend needs `pip install optimum[onnxruntime]`") from e
+
+        self.model_name = model_name
+        self.max_length = max_length
+        onnx_path = export_onnx_model(model_name, task, cache_dir, quantize=quantize)
+
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(onnx_path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(os.path.dirname(onnx_path))
+
+    def _run(self, encoded) -> np.ndarray:
+        feed = {name: np.asarray(value, dtype=np.int64) for name, value in encoded.items() if name in self.input_names}
+        return self.session.run(None, feed)[0]
+
+
+class OnnxCrossEncoder(_OnnxModel, BaseCrossEncoder):
+    """
+    Drop-in BaseCrossEncoder (same interface as HuggingFaceCrossEncoder) backed by an
+    ONNX export of the reranker. Single-logit models get a sigmoid, matching the
+    sentence-transformers CrossEncoder scores.
+    """
+
+    def __init__(self, model_name: str, cache_dir: str, quantize: bool = True,
+                 batch_size: int = 32, max_length: int = 512, num_threads: int = 0):
+        super().__init__(model_name, "text-classification", cache_dir, quantize=quantize,
+                         max_length=max_length, num_threads=num_threads)
+        self.batch_size = batch_size
+
+    def score(self, text_pairs: List[Tuple[str, str]]) -> List[float]:
+        scores: List[float] = []
+        for start in range(0, len(text_pairs), self.batch_size):
+            batch = text_pairs[start:start + self.batch_size]
+            encoded = self.tokenizer(
+                [q for q, _ in batch], [d for _, d in batch],
+                padding=True, truncation=True, max_length=self.max_length, return_tensors="np",
+            )
+            logits = self._run(encoded)
+            if logits.ndim > 1 and logits.shape[1] > 1:
+                batch_scores = logits[:, 1]
+            else:
+                batch_scores = 1.0 / (1.0 + np.exp(-logits.reshape(-1)))
+            scores.extend(float(s) for s in batch_scores)
+        return scores
+
+
+class OnnxEmbeddings(_OnnxModel, Embeddings):
+    """
+    Embeddings backed by an ONNX export of a sentence-transformers encoder.
+    Defaults (CLS pooling + L2 normalization) reproduce BAAI/bge-*-v1.5, so vectors
+    stay comparable with the ones already persisted in Chroma.
+    """
+
+    def __init__(self, model_name: str, cache_dir: str, quantize: bool = True, batch_size: int = 32,
+                 max_length: int = 512, pooling: str = "cls", normalize: bool = True, num_threads: int = 0):
+        super().__init__(model_name, "feature-extraction", cache_dir, quantize=quantize,
+                         max_length=max_length, num_threads=num_threads)
+        self.batch_size = batch_size
+        self.pooling = pooling
+        self.normalize = normalize
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        encoded = self.tokenizer(
+            texts, padding=True, truncation=True, max_length=self.max_length, return_tensors="np",
+        )
+        hidden = self._run(encoded)
+        if self.pooling == "mean":
+            mask = encoded["attention_mask"][..., None].astype(hidden.dtype)
+            vectors = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        else:
+            vectors = hidden[:, 0]
+        if self.normalize:
+            vectors = vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+        return vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors: List[List[float]] = []
+        for start in range(0, len(texts), self.batch_size):
+            vectors.extend(self._encode(list(texts[start:start + self.batch_size])).tolist())
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Batched embed_query (no query instruction is applied, so this is embed_documents)."""
+        return self.embed_documents(texts)
@@ -1,6 +1,13 @@
 import os
+import asyncio
+import hashlib
 import logging
-from typing import List, Tuple, Dict, Any
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+from typing import List, Tuple, Dict, Any, AsyncIterator, Optional
 
 from fastapi import HTTPException
 from langchain.prompts import PromptTemplate
@@ -9,14 +16,25 @@ from langchain_community.vectorstores import Chroma
 from langchain_groq import ChatGroq
 from langchain_community.embeddings import SentenceTransformerEmbeddings
 from langchain.schema import Document
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
 
 # Retrieval upgrades
-from langchain.retrievers import ContextualCompressionRetriever, MultiQueryRetriever
-from langchain.retrievers.document_compressors import CrossEncoderReranker
+from langchain.retrievers import ContextualCompressionRetriever
 from langchain_community.cross_encoders import HuggingFaceCrossEncoder
 
 from app.config.settings import settings
-from app.core.utils import clean_repetitive_text, count_tokens, truncate_documents
+from app.core.cache import LRUTTLCache, SemanticAnswerCache
+from app.core.dedup import serving_collection_name
+from app.core.hybrid import BM25Index, HybridRetriever, load_or_build_bm25
+from app.core.embeddings import MicroBatchingEmbeddings, check_embedding_compatibility
+from app.core.onnx_models import OnnxCrossEncoder, OnnxEmbeddings
+from app.core.rerankers import CachedCrossEncoderReranker
+from app.core.routing import DomainRouter, load_or_build_router
+from app.core.retrievers import BatchedMultiQueryRetriever, VectorSearchRetriever
+from app.core.vector_backends import FaissCollection, FaissVectorStore
+from app.core.utils import (
+    RepetitionFilter, clean_repetitive_text, count_tokens, pack_documents, truncate_documents,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -38,13 +56,116 @@ REQUIREMENTS:
 
 COMPREHENSIVE ANSWER:"""
 
+MULTIQUERY_PROMPT_TEMPLATE = (
+    "You expand search queries for retrieval.\n"
+    "Given a question, produce 4 alternative queries that expand acronyms, aliases, and synonyms.\n"
+    "Return only the 4 queries, one per line, no numbering, no bullets, no explanations.\n"
+    "Question: {question}"
+)
+
+CONCISE_PROMPT_TEMPLATE = """Answer this question using only the provided context. Be clear and concise. Do not repeat information.
+
+    Context: {context}
+
+    Question: {question}
+
+    Concise Answer:"""
+
+WARMUP_QUESTION = "What does the census report say about population growth?"
+
+# Engine lifecycle states (reported by /ready)
+STATE_NOT_STARTED = "not_started"
+STATE_LOADING = "loading"
+STATE_WARMING = "warming"
+STATE_READY = "ready"
+STATE_FAILED = "failed"
+
+
+@dataclass
+class PipelineProfile:
+    """Retrieval stages of one latency tier (settings.PIPELINE_PROFILES), built once at startup."""
+    name: str
+    base_retriever: Any
+    retriever: Any                  # composed retriever for the sync path
+    mq_retriever: Any = None        # None when the tier skips query expansion
+    compressor: Any = None          # None when the tier skips (or cannot load) the reranker
+    top_k: int = 4                  # documents handed to the LLM
+    domains: Tuple[str, ...] = ()   # library domains the search is restricted to (empty -> all)
+
+    @property
+    def escalates(self) -> bool:
+        """True if the tier has expansion/rerank stages that an early exit can skip."""
+        return self.mq_retriever is not None or self.compressor is not None
+
+    @property
+    def cache_namespace(self) -> str:
+        """Answer-cache namespace: tier plus domain scope, since both change the context."""
+        return f"{self.name}:{','.join(self.domains)}" if self.domains else self.name
+
+
 class RAGEngine:
-    def _init_(self):
-        self.vectordb: Chroma | None = None
+    def __init__(self):
+        self.vectordb: Chroma | FaissVectorStore | None = None
+        self.embeddings: SentenceTransformerEmbeddings | OnnxEmbeddings | MicroBatchingEmbeddings | None = None
         self.llm: ChatGroq | None = None
         self.qa: RetrievalQA | None = None
         self.retriever = None           # final composed retriever (MultiQuery -> Rerank)
         self.base_retriever = None      # base vectorstore retriever
+        self.mq_retriever = None        # MultiQuery stage (LLM expansion + per-query search)
+        self.compressor = None          # cross-encoder rerank stage (None if unavailable)
+        # The four attributes above mirror the default profile; other tiers live here.
+        self.profiles: Dict[str, PipelineProfile] = {}
+        self.default_mode = getattr(settings, "DEFAULT_PIPELINE_MODE", "thorough")
+        self.sparse_index: BM25Index | None = None
+        self.domain_router: DomainRouter | None = None
+        self._rerank_model = None       # cross-encoder shared by every reranking profile
+
+        self.state = STATE_NOT_STARTED
+        self.state_error: str | None = None
+        self._init_task: asyncio.Task | None = None
+
+        # Async entry points: CPU stages (embedding, search, rerank) run on a bounded pool,
+        # and the semaphore caps in-flight questions per worker.
+        self._executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, "RAG_CPU_WORKERS", 4),
+            thread_name_prefix="rag-cpu",
+        )
+        self._semaphore = asyncio.Semaphore(getattr(settings, "RAG_MAX_CONCURRENCY", 8))
+
+        # Retrieval path taken per request (adaptive early exit vs full pipeline)
+        self._path_lock = threading.Lock()
+        self.path_stats: Dict[str, Dict[str, float]] = {
+            "early_exit": {"requests": 0, "total_ms": 0.0},
+            "escalated": {"requests": 0, "total_ms": 0.0},
+        }
+        self.route_stats: Dict[str, int] = {"routed": 0, "global": 0}
+
+        self.answer_cache: SemanticAnswerCache | None = None
+        if getattr(settings, "SEMANTIC_CACHE_ENABLED", False):
+            self.answer_cache = SemanticAnswerCache(
+                threshold=getattr(settings, "SEMANTIC_CACHE_THRESHOLD", 0.95),
+                max_entries=getattr(settings, "SEMANTIC_CACHE_MAX_ENTRIES", 1000),
+                max_bytes=getattr(settings, "SEMANTIC_CACHE_MAX_MB", 64) * 1024 * 1024,
+                ttl_seconds=getattr(settings, "SEMANTIC_CACHE_TTL_SECONDS", 6 * 3600),
+                version_fn=self._cache_version,
+                version_check_seconds=getattr(settings, "SEMANTIC_CACHE_VERSION_CHECK_SECONDS", 30),
+                key_term_guard=getattr(settings, "SEMANTIC_CACHE_KEY_TERM_GUARD", True),
+            )
+
+        self.expansion_cache: LRUTTLCache | None = None
+        if getattr(settings, "QUERY_EXPANSION_CACHE_ENABLED", True):
+            self.expansion_cache = LRUTTLCache(
+                max_entries=getattr(settings, "QUERY_EXPANSION_CACHE_MAX_ENTRIES", 5000),
+                ttl_seconds=getattr(settings, "QUERY_EXPANSION_CACHE_TTL_SECONDS", 7 * 24 * 3600),
+                persist_path=getattr(settings, "QUERY_EXPANSION_CACHE_PATH", None),
+            )
+
+        self.rerank_cache: LRUTTLCache | None = None
+        if getattr(settings, "RERANK_SCORE_CACHE_ENABLED", True):
+            self.rerank_cache = LRUTTLCache(
+                max_entries=getattr(settings, "RERANK_SCORE_CACHE_MAX_ENTRIES", 50000),
+                ttl_seconds=getattr(settings, "RERANK_SCORE_CACHE_TTL_SECONDS", None),
+            )
 
     # ---- Builders ----
 
@@ -59,74 +180,268 @@ class RAGEngine:
             api_key=api_key,
         )
 
-    def _build_embeddings(self) -> SentenceTransformerEmbeddings:
+    def _build_onnx_embeddings(self) -> OnnxEmbeddings | None:
+        """ONNX int8 query encoder, only if its vectors match the ones persisted in Chroma."""
+        try:
+            embeddings = OnnxEmbeddings(
+                settings.EMBEDDING_MODEL,
+                cache_dir=getattr(settings, "ONNX_CACHE_DIR", "./onnx_models"),
+                quantize=getattr(settings, "EMBEDDING_ONNX_QUANTIZE", True),
+            )
+            compatible, report = check_embedding_compatibility(
+                embeddings,
+                settings.DB_PATH,
+                getattr(settings, "COLLECTION_NAME", "langchain"),
+                min_cosine=getattr(settings, "EMBEDDING_ONNX_MIN_COSINE", 0.98),
+            )
+        except Exception as e:
+            logger.warning(f"ONNX embeddings unavailable, using SentenceTransformer backend: {e}")
+            return None
+        if not compatible:
+            logger.warning(f"ONNX embeddings drift from stored vectors {report}, using SentenceTransformer backend")
+            return None
+        logger.info(f"ONNX embeddings compatible with stored vectors: {report}")
+        return embeddings
+
+    def _build_embeddings(self):
         # Must match the model used during indexing/persist to avoid mismatch.
-        return SentenceTransformerEmbeddings(model_name=settings.EMBEDDING_MODEL)
-
-    def _build_vectorstore(self) -> Chroma:
+        embeddings = None
+        if getattr(settings, "EMBEDDING_BACKEND", "torch") == "onnx":
+            embeddings = self._build_onnx_embeddings()
+        if embeddings is None:
+            embeddings = SentenceTransformerEmbeddings(model_name=settings.EMBEDDING_MODEL)
+        if getattr(settings, "EMBEDDING_MICROBATCH_ENABLED", True):
+            # Coalesce query embeddings from concurrent requests into one encoder batch.
+            embeddings = MicroBatchingEmbeddings(
+                embeddings,
+                max_batch_size=getattr(settings, "EMBEDDING_MICROBATCH_MAX_SIZE", 32),
+                max_wait_ms=getattr(settings, "EMBEDDING_MICROBATCH_MAX_WAIT_MS", 5),
+            )
+        return embeddings
+
+    def _build_vectorstore(self) -> Chroma | FaissVectorStore:
+        if getattr(settings, "VECTOR_BACKEND", "chroma") == "faiss":
+            try:
+                collection = FaissCollection(
+                    settings.FAISS_INDEX_PATH,
+                    ef_search=getattr(settings, "FAISS_HNSW_EF_SEARCH", 64),
+                    use_mmap=getattr(settings, "FAISS_MMAP", True),
+                    exact_filter_max_rows=getattr(settings, "FAISS_EXACT_FILTER_MAX_ROWS", 50000),
+                    rescore_factor=getattr(settings, "FAISS_RESCORE_FACTOR", 4),
+                )
+                logger.info(f"Serving {collection.count()} chunks from the FAISS index at {settings.FAISS_INDEX_PATH}")
+                return FaissVectorStore(collection, self.embeddings)
+            except Exception as e:
+                logger.warning(f"FAISS index unavailable, falling back to Chroma: {e}")
+        collection_name = getattr(settings, "COLLECTION_NAME", "langchain")
+        served_name = serving_collection_name()
+        if served_name != collection_name:
+            vectordb = Chroma(
+                collection_name=served_name,
+                persist_directory=settings.DB_PATH,
+                embedding_function=self.embeddings,
+            )
+            if vectordb._collection.count():
+                logger.info(f"Serving {vectordb._collection.count()} deduplicated chunks from '{served_name}'")
+                return vectordb
+            logger.warning(f"Deduplicated collection '{served_name}' is empty (run scritps/dedup_chunks.py), "
+                           f"serving '{collection_name}'")
         return Chroma(
+            collection_name=collection_name,
             persist_directory=settings.DB_PATH,
-            embedding_function=self._build_embeddings(),
+            embedding_function=self.embeddings,
         )
 
-    def _build_base_retriever(self):
-        # Use settings to compute fetch_k and lambda_mult.
-        fetch_k_multiplier = getattr(settings, "FETCH_K_MULTIPLIER", 10)
-        min_fetch_k = getattr(settings, "MIN_FETCH_K", 60)
-        lambda_mult = getattr(settings, "LAMBDA_MULT", 0.2)
-        fetch_k = max(min_fetch_k, settings.RETRIEVAL_K * fetch_k_multiplier)
-        return self.vectordb.as_retriever(
-            search_type="mmr",
-            search_kwargs={
-                "k": settings.RETRIEVAL_K,          # final top-k
-                "fetch_k": fetch_k,                 # candidate pool
-                "lambda_mult": lambda_mult,         # diversity/similarity balance
-            },
+    def _profile_settings(self) -> Dict[str, Dict[str, Any]]:
+        profiles = getattr(settings, "PIPELINE_PROFILES", None)
+        if profiles:
+            return profiles
+        # No profiles configured: a single tier equivalent to the full pipeline.
+        return {"thorough": {
+            "RETRIEVAL_K": settings.RETRIEVAL_K,
+            "fetch_k": max(getattr(settings, "MIN_FETCH_K", 60),
+                           settings.RETRIEVAL_K * getattr(settings, "FETCH_K_MULTIPLIER", 10)),
+            "LAMBDA_MULT": getattr(settings, "LAMBDA_MULT", 0.2),
+            "RERANKER_TOP_N": max(getattr(settings, "RERANKER_TOP_N", settings.RETRIEVAL_K), settings.RETRIEVAL_K),
+            "search_type": "mmr", "query_expansion": True, "rerank": True,
+        }}
+
+    def _load_sparse_index(self) -> BM25Index | None:
+        if getattr(settings, "RETRIEVAL_MODE", "dense") != "hybrid":
+            return None
+        try:
+            return load_or_build_bm25(
+                self.vectordb._collection, getattr(settings, "BM25_INDEX_PATH", None), db_path=settings.DB_PATH,
+                save=False,  # every worker runs this at startup; the index is built offline
+            )
+        except Exception as e:
+            logger.warning(f"BM25 index unavailable, falling back to dense retrieval: {e}")
+            return None
+
+    def _load_domain_router(self) -> DomainRouter | None:
+        if not getattr(settings, "DOMAIN_ROUTER_ENABLED", True):
+            return None
+        try:
+            router = load_or_build_router(
+                self.vectordb._collection,
+                getattr(settings, "DOMAIN_ROUTER_PATH", None),
+                centroids_per_domain=getattr(settings, "DOMAIN_ROUTER_CENTROIDS_PER_DOMAIN", 1),
+                save=False,  # every worker runs this at startup; the table is built offline
+                db_path=settings.DB_PATH,
+            )
+            if router is None or len(router) <= getattr(settings, "DOMAIN_ROUTER_TOP_N", 3):
+                return None
+            return router
+        except Exception as e:
+            logger.warning(f"Domain router unavailable, searching all domains: {e}")
+            return None
+
+    def _build_base_retriever(self, profile: Dict[str, Any]):
+        search_type = profile.get("search_type", "mmr")
+        search_kwargs = {
+            "k": profile["RETRIEVAL_K"],            # final top-k (rerank candidates when reranking)
+            "fetch_k": profile["fetch_k"],          # MMR candidate pool
+            "lambda_mult": profile["LAMBDA_MULT"],  # diversity/similarity balance
+        }
+
+        if self.sparse_index is not None:
+            return HybridRetriever(
+                vectorstore=self.vectordb,
+                search_type=search_type,
+                search_kwargs=search_kwargs,
+                sparse_index=self.sparse_index,
+                sparse_k=getattr(settings, "HYBRID_SPARSE_K", 20),
+                rrf_k=getattr(settings, "HYBRID_RRF_K", 60),
+                mmr_over_union=getattr(settings, "MMR_OVER_UNION", False),
+            )
+
+        # Same contract as vectordb.as_retriever, plus batched multi-query search.
+        return VectorSearchRetriever(
+            vectorstore=self.vectordb,
+            search_type=search_type,
+            search_kwargs=search_kwargs,
+            mmr_over_union=getattr(settings, "MMR_OVER_UNION", False),
         )
 
     def _build_multiquery_retriever(self, base_retriever):
         # Keep behavior but read all variables from settings where applicable.
-        mq_prompt = PromptTemplate.from_template(
-            "You expand search queries for retrieval.\n"
-            "Given a question, produce 4 alternative queries that expand acronyms, aliases, and synonyms.\n"
-            "Return only the 4 queries, one per line, no numbering, no bullets, no explanations.\n"
-            "Question: {question}"
-        )
-        return MultiQueryRetriever.from_llm(
+        mq_prompt = PromptTemplate.from_template(MULTIQUERY_PROMPT_TEMPLATE)
+        mq_retriever = BatchedMultiQueryRetriever.from_llm(
             retriever=base_retriever,
             llm=self.llm,
             prompt=mq_prompt,
             include_original=True,
         )
-
-    def _wrap_with_reranker(self, base_retriever):
+        # Variants depend on the expansion prompt and model, so both are part of the key.
+        mq_retriever.query_cache = self.expansion_cache
+        mq_retriever.cache_namespace = f"{settings.LLM_MODEL}\n{MULTIQUERY_PROMPT_TEMPLATE}"
+        return mq_retriever
+
+    def _build_rerank_model(self, reranker_model: str):
+        if getattr(settings, "RERANKER_BACKEND", "torch") == "onnx":
+            try:
+                return OnnxCrossEncoder(
+                    reranker_model,
+                    cache_dir=getattr(settings, "ONNX_CACHE_DIR", "./onnx_models"),
+                    quantize=getattr(settings, "RERANKER_ONNX_QUANTIZE", True),
+                )
+            except Exception as e:
+                logger.warning(f"ONNX reranker unavailable, using PyTorch backend: {e}")
+        return HuggingFaceCrossEncoder(model_name=reranker_model)
+
+    def _wrap_with_reranker(self, base_retriever, top_n: int):
+        """Return (compressor, composed retriever); (None, base_retriever) if the model is unavailable."""
         try:
             reranker_model = getattr(settings, "RERANKER_MODEL", "BAAI/bge-reranker-base")
-            # Align top_n with settings while preserving the existing safeguard.
-            base_top_n = getattr(settings, "RERANKER_TOP_N", settings.RETRIEVAL_K)
-            top_n = max(base_top_n, settings.RETRIEVAL_K)
-            rerank_model = HuggingFaceCrossEncoder(model_name=reranker_model)
-            compressor = CrossEncoderReranker(model=rerank_model, top_n=top_n)
-            return ContextualCompressionRetriever(base_retriever=base_retriever, base_compressor=compressor)
+            if self._rerank_model is None:
+                self._rerank_model = self._build_rerank_model(reranker_model)
+            # Dedupes the MultiQuery union and caches (query, chunk) scores per backend.
+            compressor = CachedCrossEncoderReranker(
+                model=self._rerank_model,
+                top_n=top_n,
+                score_cache=self.rerank_cache,
+                cache_namespace=f"{type(self._rerank_model).__name__}:{reranker_model}",
+            )
+            return compressor, ContextualCompressionRetriever(base_retriever=base_retriever, base_compressor=compressor)
         except Exception as e:
             logger.warning(f"Reranker unavailable, falling back to base retriever: {e}")
-            return base_retriever
+            return None, base_retriever
+
+    def _build_profile(self, name: str, config: Dict[str, Any]) -> PipelineProfile:
+        base_retriever = self._build_base_retriever(config)
+        profile = PipelineProfile(name=name, base_retriever=base_retriever, retriever=base_retriever)
+        # Multi-query expansion (can be switched off globally, e.g. when hybrid recall suffices)
+        if config.get("query_expansion") and getattr(settings, "QUERY_EXPANSION_ENABLED", True):
+            profile.mq_retriever = self._build_multiquery_retriever(base_retriever)
+            profile.retriever = profile.mq_retriever
+        if config.get("rerank"):
+            profile.compressor, profile.retriever = self._wrap_with_reranker(profile.retriever, config["RERANKER_TOP_N"])
+        profile.top_k = config["RERANKER_TOP_N"] if profile.compressor is not None else config["RETRIEVAL_K"]
+        logger.info(
+            f"Pipeline profile '{name}': k={config['RETRIEVAL_K']}, fetch_k={config['fetch_k']}, "
+            f"expansion={profile.mq_retriever is not None}, rerank={profile.compressor is not None}"
+        )
+        return profile
+
+    def _profile(self, mode: Optional[str] = None, domains: Optional[List[str]] = None) -> PipelineProfile:
+        profile = self.profiles.get(mode or self.default_mode)
+        if profile is None:
+            raise ValueError(f"Unknown pipeline mode '{mode}' (available: {', '.join(self.profiles)})")
+        return self._scope_profile(profile, domains) if domains else profile
+
+    def _scope_profile(self, profile: PipelineProfile, domains: List[str]) -> PipelineProfile:
+        """
+        Per-request copy of a profile whose searches only see chunks of `domains`
+        (metadata filter in Chroma, masked postings in BM25). The copies are shallow, so
+        models, caches and the vector store stay shared.
+        """
+        domains = sorted(set(domains))
+        base_retriever = profile.base_retriever.with_domains(domains)
+        mq_retriever = profile.mq_retriever.model_copy(update={"retriever": base_retriever}) if profile.mq_retriever else None
+        retriever = mq_retriever or base_retriever
+        if profile.compressor is not None:
+            retriever = ContextualCompressionRetriever(base_retriever=retriever, base_compressor=profile.compressor)
+        return PipelineProfile(
+            name=profile.name,
+            base_retriever=base_retriever,
+            retriever=retriever,
+            mq_retriever=mq_retriever,
+            compressor=profile.compressor,
+            top_k=profile.top_k,
+            domains=tuple(domains),
+        )
 
     # ---- Lifecycle ----
 
+    @property
+    def is_ready(self) -> bool:
+        return self.state == STATE_READY
+
     def initialize(self):
-        """Initialize RAG components with settings-driven parameters."""
+        """Initialize RAG components with settings-driven parameters, then warm them up."""
         try:
+            self.state, self.state_error = STATE_LOADING, None
             logger.info("Initializing RAG components...")
             self.llm = self._build_llm()
+            if self.expansion_cache is not None:
+                self.expansion_cache.load()
+            self.embeddings = self._build_embeddings()
             self.vectordb = self._build_vectorstore()
 
-            # Base retriever (vectorstore-backed)
-            self.base_retriever = self._build_base_retriever()
-
-            # Multi-query expansion -> rerank
-            mq_retriever = self._build_multiquery_retriever(self.base_retriever)
-            self.retriever = self._wrap_with_reranker(mq_retriever)
+            self.sparse_index = self._load_sparse_index()
+            self.domain_router = self._load_domain_router()
+
+            # One composed retriever per latency tier; the reranker model is loaded once and shared.
+            self.profiles = {
+                name: self._build_profile(name, config) for name, config in self._profile_settings().items()
+            }
+            if self.default_mode not in self.profiles:
+                self.default_mode = next(iter(self.profiles))
+            default = self.profiles[self.default_mode]
+            self.base_retriever = default.base_retriever
+            self.mq_retriever = default.mq_retriever
+            self.compressor = default.compressor
+            self.retriever = default.retriever
 
             prompt = PromptTemplate(template=PROMPT_TEMPLATE, input_variables=["context", "question"])
 
@@ -139,59 +454,422 @@ class RAGEngine:
                 return_source_documents=True,
             )
 
+            if getattr(settings, "RAG_WARMUP_ENABLED", True):
+                self.state = STATE_WARMING
+                self.warm_up()
+            self.state = STATE_READY
             logger.info("✅ RAG pipeline ready (settings-aligned)")
         except Exception as e:
+            self.state, self.state_error = STATE_FAILED, str(e)
             logger.error(f"Error initializing RAG: {str(e)}")
             raise
 
-    # ---- Inference ----
+    def warm_up(self, question: str = WARMUP_QUESTION):
+        """
+        Push a dummy query through embedding, search and rerank of every profile so model
+        weights, tokenizers and the Chroma index are loaded before real traffic (no LLM call).
+        """
+        started = time.perf_counter()
+        try:
+            self.embeddings.embed_query(question)
+            count_tokens(question)  # loads the LLM tokenizer
+            for profile in self.profiles.values():
+                docs = profile.base_retriever.invoke(question)
+                if profile.compressor is not None and docs:
+                    profile.compressor.compress_documents(docs, question)
+        except Exception as e:
+            logger.warning(f"RAG warm-up failed (serving anyway): {e}")
+            return
+        logger.info(f"RAG warm-up finished in {(time.perf_counter() - started) * 1000:.0f} ms")
 
-    def ask_comprehensive_question(self, question: str, max_tokens: int = 300) -> Tuple[str, List[Dict[str, Any]]]:
-        """Get comprehensive answer with token control."""
+    async def ainitialize(self):
+        """Run initialize() off the event loop; failures are kept in state/state_error."""
         try:
-            # Use the composed retriever via Runnable API
-            docs: List[Document] = self.retriever.invoke(question)
+            await asyncio.to_thread(self.initialize)
+        except Exception:
+            pass  # already logged and recorded by initialize()
+
+    def start_background_initialization(self) -> asyncio.Task:
+        """Schedule ainitialize() on the running loop so the server accepts traffic immediately."""
+        if self._init_task is None:
+            self._init_task = asyncio.get_running_loop().create_task(self.ainitialize())
+        return self._init_task
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if isinstance(self.embeddings, MicroBatchingEmbeddings):
+            self.embeddings.close()
+        if self.expansion_cache is not None:
+            self.expansion_cache.save()
+
+    # ---- Answer cache ----
+
+    def _cache_version(self) -> Tuple[str, int, float]:
+        """Fingerprint of everything a cached answer depends on."""
+        config = "|".join(str(v) for v in (
+            PROMPT_TEMPLATE,
+            settings.LLM_MODEL,
+            settings.LLM_TEMPERATURE,
+            settings.EMBEDDING_MODEL,
+            getattr(settings, "RERANKER_MODEL", None),
+            settings.RETRIEVAL_K,
+            getattr(settings, "RERANKER_TOP_N", None),
+            sorted(self._profile_settings().items()),
+            getattr(settings, "MAX_CONTEXT_TOKENS", None),
+        ))
+        doc_count = self.vectordb._collection.count() if self.vectordb is not None else 0
+        sqlite_path = os.path.join(settings.DB_PATH, "chroma.sqlite3")
+        db_mtime = os.path.getmtime(sqlite_path) if os.path.exists(sqlite_path) else 0.0
+        return hashlib.sha256(config.encode("utf-8")).hexdigest(), doc_count, db_mtime
+
+    def _answer_cache_lookup(self, question: str, namespace: str, query_vector=None):
+        """
+        Return (query_vector, cached (answer, sources) or None). The question is embedded here
+        only when caching is on and no vector was passed in; otherwise query_vector is returned as is.
+        """
+        if self.answer_cache is None:
+            return query_vector, None
+        if query_vector is None:
+            query_vector = self.embeddings.embed_query(question)
+        # Tiers and domain scopes retrieve different context, so each only reuses its own answers.
+        return query_vector, self.answer_cache.get(query_vector, namespace=namespace, question=question)
+
+    def _needs_query_vector(self, profile: PipelineProfile) -> bool:
+        """Whether the answer cache, the domain router or the early-exit probe will embed the question."""
+        return (
+            self.answer_cache is not None
+            or (self.domain_router is not None and not profile.domains)
+            or (profile.escalates and getattr(settings, "EARLY_EXIT_ENABLED", True)
+                and hasattr(profile.base_retriever, "search_with_relevance"))
+        )
 
-            # Settings-driven truncation thresholds
-            max_ctx = getattr(settings, "MAX_CONTEXT_TOKENS", 2500)
-            hard_prompt_limit = getattr(settings, "PROMPT_TOKEN_HARD_LIMIT", 5500)
-            fallback_ctx = getattr(settings, "FALLBACK_CONTEXT_TOKENS", 3500)
+    def stats(self) -> Dict[str, Any]:
+        """Runtime counters for caches and batching (exposed via /api/rag-info)."""
+        return {
+            "state": self.state,
+            "caches": {
+                "semantic_answer_cache": self.answer_cache.stats() if self.answer_cache else {"enabled": False},
+                "query_expansion_cache": self.expansion_cache.stats() if self.expansion_cache else {"enabled": False},
+            },
+            "default_mode": self.default_mode,
+            "reranker": {
+                name: profile.compressor.stats() if profile.compressor is not None else {"enabled": False}
+                for name, profile in self.profiles.items()
+            },
+            "retrieval_paths": self._path_stats(),
+            "domain_routing": (
+                {"domains": len(self.domain_router), **self.route_stats} if self.domain_router else {"enabled": False}
+            ),
+            "embedding_batcher": (
+                self.embeddings.stats() if isinstance(self.embeddings, MicroBatchingEmbeddings) else {"enabled": False}
+            ),
+        }
+
+    # ---- Adaptive early exit ----
+
+    def _early_exit_probe(self, question: str, profile: PipelineProfile, query_vector=None) -> List[Document] | None:
+        """
+        Plain top-k with relevance scores. Returns those documents when the top hit is
+        confident (score and margin over the runner-up above the thresholds), else None
+        so the caller escalates to the profile's expansion/rerank stages.
+        The vector-store score is kept as metadata["relevance_score"]: metadata["score"]
+        holds cross-encoder scores on the reranked path, a different scale.
+        """
+        if not profile.escalates or not getattr(settings, "EARLY_EXIT_ENABLED", True):
+            return None
+        search_with_relevance = getattr(profile.base_retriever, "search_with_relevance", None)
+        if search_with_relevance is None:
+            return None
+        if query_vector is None:
+            query_vector = self.embeddings.embed_query(question)
+
+        pairs = search_with_relevance(query_vector, max(profile.top_k, 2))
+        if not pairs:
+            return None
+        top_score = pairs[0][1]
+        margin = top_score - pairs[1][1] if len(pairs) > 1 else top_score
+        confident = (
+            top_score >= getattr(settings, "EARLY_EXIT_MIN_SCORE", 0.80)
+            and margin >= getattr(settings, "EARLY_EXIT_MIN_MARGIN", 0.05)
+        )
+        logger.info(
+            f"Early-exit probe [{profile.name}]: top={top_score:.3f} margin={margin:.3f} -> "
+            f"{'early exit' if confident else 'escalate'}"
+        )
+        if not confident:
+            return None
+        docs = []
+        for doc, score in pairs[: profile.top_k]:
+            doc.metadata["relevance_score"] = score
+            docs.append(doc)
+        return docs
+
+    def _record_path(self, path: str, started: float):
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._path_lock:
+            self.path_stats[path]["requests"] += 1
+            self.path_stats[path]["total_ms"] += elapsed_ms
+        logger.info(f"Retrieval path: {path} ({elapsed_ms:.0f} ms)")
+
+    def _path_stats(self) -> Dict[str, Any]:
+        with self._path_lock:
+            stats = {
+                path: {
+                    "requests": int(v["requests"]),
+                    "avg_retrieval_ms": round(v["total_ms"] / v["requests"], 1) if v["requests"] else 0.0,
+                }
+                for path, v in self.path_stats.items()
+            }
+        if stats["early_exit"]["requests"] and stats["escalated"]["requests"]:
+            stats["est_ms_saved_per_early_exit"] = round(
+                stats["escalated"]["avg_retrieval_ms"] - stats["early_exit"]["avg_retrieval_ms"], 1
+            )
+        return stats
+
+    # ---- Domain routing ----
+
+    def _route(self, question: str, profile: PipelineProfile, query_vector=None):
+        """
+        Scope an unscoped profile to the domains the centroid router picks for the question.
+        Returns (profile, query_vector); the profile is unchanged when the routing margin is
+        too small (global search) or the caller already chose domains.
+        """
+        if self.domain_router is None or profile.domains:
+            return profile, query_vector
+        if query_vector is None:
+            query_vector = self.embeddings.embed_query(question)
+        domains = self.domain_router.route(
+            query_vector,
+            top_n=getattr(settings, "DOMAIN_ROUTER_TOP_N", 3),
+            min_margin=getattr(settings, "DOMAIN_ROUTER_MIN_MARGIN", 0.02),
+        )
+        with self._path_lock:
+            self.route_stats["routed" if domains else "global"] += 1
+        if not domains:
+            return profile, query_vector
+        logger.info(f"Routed to domains: {', '.join(domains)}")
+        return self._scope_profile(profile, domains), query_vector
+
+    def _retrieve(self, question: str, profile: PipelineProfile, query_vector=None) -> List[Document]:
+        """Sync retrieval: domain routing, early-exit probe, then the profile's composed retriever."""
+        profile, query_vector = self._route(question, profile, query_vector)
+        if not profile.escalates:
+            return profile.retriever.invoke(question)
+        started = time.perf_counter()
+        docs = self._early_exit_probe(question, profile, query_vector)
+        if docs is not None:
+            self._record_path("early_exit", started)
+            return docs
+        docs = profile.retriever.invoke(question)
+        self._record_path("escalated", started)
+        return docs
+
+    # ---- Async stages ----
+
+    async def _run_cpu(self, func, *args):
+        """Run a blocking (CPU-bound) stage on the bounded RAG executor."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(func, *args))
+
+    async def _aembed_question(self, question: str, profile: PipelineProfile):
+        """
+        The question vector for the cache / router / probe stages, or None when none of them runs.
+        The micro-batcher is awaited on the event loop, so waiting for a batch to fill does not
+        hold an executor thread (which would cap batches at RAG_CPU_WORKERS).
+        """
+        if not self._needs_query_vector(profile):
+            return None
+        if isinstance(self.embeddings, MicroBatchingEmbeddings):
+            return await self.embeddings.aembed_query(question)
+        return await self._run_cpu(self.embeddings.embed_query, question)
+
+    async def _aretrieve(self, question: str, profile: PipelineProfile, query_vector=None) -> List[Document]:
+        """
+        Async equivalent of _retrieve: the question is embedded on the event loop, the MultiQuery
+        expansion uses the LLM's ainvoke, while routing, the probe, search and rerank run on the
+        bounded executor.
+        """
+        if query_vector is None:
+            query_vector = await self._aembed_question(question, profile)
+        profile, query_vector = await self._run_cpu(self._route, question, profile, query_vector)
+        if not profile.escalates:
+            return await self._run_cpu(profile.retriever.invoke, question)
+
+        started = time.perf_counter()
+        docs = await self._run_cpu(self._early_exit_probe, question, profile, query_vector)
+        if docs is not None:
+            self._record_path("early_exit", started)
+            return docs
+        docs = await self._aretrieve_full(question, profile)
+        self._record_path("escalated", started)
+        return docs
+
+    async def _aretrieve_full(self, question: str, profile: PipelineProfile) -> List[Document]:
+        if profile.mq_retriever is None:
+            return await self._run_cpu(profile.retriever.invoke, question)
+
+        mq_retriever = profile.mq_retriever
+        queries = await mq_retriever.agenerate_queries(
+            question, AsyncCallbackManagerForRetrieverRun.get_noop_manager()
+        )
+        if mq_retriever.include_original:
+            queries.append(question)
+        docs = await self._run_cpu(
+            mq_retriever.retrieve_documents, queries, CallbackManagerForRetrieverRun.get_noop_manager()
+        )
+        docs = mq_retriever.unique_union(docs)
 
-            # Build truncated context
-            context = truncate_documents(docs, max_context_tokens=max_ctx)
-            formatted_prompt = PROMPT_TEMPLATE.format(context=context, question=question)
+        if profile.compressor is not None:
+            docs = await self._run_cpu(profile.compressor.compress_documents, docs, question)
+        return list(docs)
 
-            total_tokens = count_tokens(formatted_prompt)
-            logger.info(f"Total prompt tokens: {total_tokens}")
+    # ---- Inference ----
+
+    def context_budget(self, question: str = "") -> Tuple[int, int]:
+        """
+        (context packing budget, template + question tokens): MAX_CONTEXT_TOKENS, capped so
+        that the whole prompt stays within PROMPT_TOKEN_HARD_LIMIT.
+        """
+        max_ctx = getattr(settings, "MAX_CONTEXT_TOKENS", 2500)
+        hard_prompt_limit = getattr(settings, "PROMPT_TOKEN_HARD_LIMIT", 5500)
+        overhead = count_tokens(PROMPT_TEMPLATE.format(context="", question=question))
+        return min(max_ctx, hard_prompt_limit - overhead), overhead
+
+    def _build_prompt(self, docs: List[Document], question: str) -> str:
+        """Format PROMPT_TEMPLATE once, with a context packed to fit both token limits."""
+        # Template + question are measured once; the context gets whatever budget remains.
+        budget, overhead = self.context_budget(question)
+        context, context_tokens = pack_documents(docs, max_context_tokens=budget)
+        logger.info(f"Total prompt tokens: {overhead + context_tokens} (context {context_tokens})")
+        return PROMPT_TEMPLATE.format(context=context, question=question)
+
+    def _build_sources(self, docs: List[Document]) -> List[Dict[str, Any]]:
+        sources: List[Dict[str, Any]] = []
+        for i, doc in enumerate(docs):
+            sources.append({
+                "document": doc.metadata.get("source", f"Document {i+1}"),
+                "content": (doc.page_content[:200] + "...") if len(doc.page_content) > 200 else doc.page_content,
+                "score": doc.metadata.get("score"),
+                "title": doc.metadata.get("title"),
+            })
+        return sources
+
+    def ask_comprehensive_question(
+        self, question: str, max_tokens: int = 300, mode: Optional[str] = None,
+        domains: Optional[List[str]] = None,
+    ) -> Tuple[str, List[Dict[str, Any]]]:
+        """
+        Get comprehensive answer with token control; `mode` selects the pipeline profile and
+        `domains` restricts retrieval to those library domains.
+        """
+        try:
+            profile = self._profile(mode, domains)
+            query_vector, cached = self._answer_cache_lookup(question, profile.cache_namespace)
+            if cached is not None:
+                return cached
 
-            if total_tokens > hard_prompt_limit:
-                context = truncate_documents(docs, max_context_tokens=fallback_ctx)
-                formatted_prompt = PROMPT_TEMPLATE.format(context=context, question=question)
+            # Early exit on a confident top hit, else the profile's composed retriever
+            docs: List[Document] = self._retrieve(question, profile, query_vector)
+            formatted_prompt = self._build_prompt(docs, question)
 
             # Send to LLM
             response = self.llm.invoke(formatted_prompt)
             answer = response.content if hasattr(response, "content") else str(response)
             answer = clean_repetitive_text(answer)
+            sources = self._build_sources(docs)
+
+            if self.answer_cache is not None and query_vector is not None:
+                self.answer_cache.put(query_vector, question, answer, sources, namespace=profile.cache_namespace)
+            return answer, sources
+
+        except Exception as e:
+            logger.error(f"RAG processing failed: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"RAG processing failed: {str(e)}")
+
+    async def aask_comprehensive_question(
+        self, question: str, max_tokens: int = 300, mode: Optional[str] = None,
+        domains: Optional[List[str]] = None,
+    ) -> Tuple[str, List[Dict[str, Any]]]:
+        """Async variant of ask_comprehensive_question that does not block the event loop."""
+        try:
+            profile = self._profile(mode, domains)
+            # Embedded before the concurrency gate so queued questions still share encoder batches
+            query_vector = await self._aembed_question(question, profile)
+            async with self._semaphore:
+                query_vector, cached = await self._run_cpu(
+                    self._answer_cache_lookup, question, profile.cache_namespace, query_vector
+                )
+                if cached is not None:
+                    return cached
+
+                docs = await self._aretrieve(question, profile, query_vector)
+                formatted_prompt = await self._run_cpu(self._build_prompt, docs, question)
+                response = await self.llm.ainvoke(formatted_prompt)
 
-            # Build sources
-            sources: List[Dict[str, Any]] = []
-            for i, doc in enumerate(docs):
-                sources.append({
-                    "document": doc.metadata.get("source", f"Document {i+1}"),
-                    "content": (doc.page_content[:200] + "...") if len(doc.page_content) > 200 else doc.page_content,
-                    "score": doc.metadata.get("score"),
-                    "title": doc.metadata.get("title"),
-                })
+            answer = response.content if hasattr(response, "content") else str(response)
+            answer = clean_repetitive_text(answer)
+            sources = self._build_sources(docs)
 
+            if self.answer_cache is not None and query_vector is not None:
+                self.answer_cache.put(query_vector, question, answer, sources, namespace=profile.cache_namespace)
             return answer, sources
 
         except Exception as e:
             logger.error(f"RAG processing failed: {str(e)}")
             raise HTTPException(status_code=500, detail=f"RAG processing failed: {str(e)}")
 
-    def ask_concise_question(self, question: str) -> str:
+    async def astream_comprehensive_question(
+        self, question: str, mode: Optional[str] = None, domains: Optional[List[str]] = None
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Streaming variant of ask_comprehensive_question.
+        Yields ("sources", sources) as soon as retrieval completes, then ("token", text) as
+        sentences complete, and finally ("answer", full_answer). Tokens go through the same
+        repetition cleanup as the blocking path, so they concatenate to exactly `full_answer`;
+        generation stops once the LLM starts looping.
+        """
+        profile = self._profile(mode, domains)
+        query_vector = await self._aembed_question(question, profile)
+        async with self._semaphore:
+            query_vector, cached = await self._run_cpu(
+                self._answer_cache_lookup, question, profile.cache_namespace, query_vector
+            )
+            if cached is not None:
+                answer, sources = cached
+                yield "sources", sources
+                yield "token", answer
+                yield "answer", answer
+                return
+
+            docs = await self._aretrieve(question, profile, query_vector)
+            sources = self._build_sources(docs)
+            yield "sources", sources
+
+            formatted_prompt = await self._run_cpu(self._build_prompt, docs, question)
+            parts: List[str] = []
+            repetition = RepetitionFilter()
+            async for chunk in self.llm.astream(formatted_prompt):
+                token = repetition.feed(chunk.content if hasattr(chunk, "content") else str(chunk))
+                if token:
+                    parts.append(token)
+                    yield "token", token
+                if repetition.stopped:
+                    break
+            token = repetition.flush()
+            if token:
+                parts.append(token)
+                yield "token", token
+
+        answer = "".join(parts)
+        if self.answer_cache is not None and query_vector is not None:
+            self.answer_cache.put(query_vector, question, answer, sources, namespace=profile.cache_namespace)
+        yield "answer", answer
+
+    def ask_concise_question(
+        self, question: str, mode: Optional[str] = None, domains: Optional[List[str]] = None
+    ) -> str:
         """Get concise, non-repetitive answer."""
-        docs: List[Document] = self.retriever.invoke(question)
+        docs: List[Document] = self._retrieve(question, self._profile(mode, domains))
 
         # Reuse the same, richer builder (no 'Document i' labels)
         context = truncate_documents(
@@ -200,24 +878,28 @@ class RAGEngine:
             snippet_chars=600
         )
 
-        concise_prompt = f"""Answer this question using only the provided context. Be clear and concise. Do not repeat information.
-
-    Context: {context}
-
-    Question: {question}
-
-    Concise Answer:"""
+        concise_prompt = CONCISE_PROMPT_TEMPLATE.format(context=context, question=question)
         try:
             response = self.llm.invoke(concise_prompt)
             return response.content if hasattr(response, "content") else str(response)
         except Exception:
             return self.llm(concise_prompt)
 
+    async def aask_concise_question(
+        self, question: str, mode: Optional[str] = None, domains: Optional[List[str]] = None
+    ) -> str:
+        """Async variant of ask_concise_question."""
+        profile = self._profile(mode, domains)
+        query_vector = await self._aembed_question(question, profile)
+        async with self._semaphore:
+            docs = await self._aretrieve(question, profile, query_vector)
+            context = await self._run_cpu(
+                truncate_documents, docs, getattr(settings, "MAX_CONTEXT_TOKENS", 2500), 600
+            )
+            response = await self.llm.ainvoke(CONCISE_PROMPT_TEMPLATE.format(context=context, question=question))
+        return response.content if hasattr(response, "content") else str(response)
 
-    def debug_rag_response(self, question: str) -> str:
-        """Debug: log relevance and show context preview with scores if available."""
-        logger.info(f"🔍 Question: {question}")
-
+    def _log_candidate_scores(self, question: str):
         # Inspect vectorstore scores (pre-MQ/rerank) for diagnosis
         try:
             pairs = self.vectordb.similarity_search_with_relevance_scores(
@@ -232,11 +914,26 @@ class RAGEngine:
         except Exception as e:
             logger.info(f"Score-based debug fallback: {e}")
 
+    def debug_rag_response(self, question: str) -> str:
+        """Debug: log relevance and show context preview with scores if available."""
+        logger.info(f"🔍 Question: {question}")
+        self._log_candidate_scores(question)
+
         # Run the QA chain on the composed retriever
         result = self.qa.invoke({"query": question})
         answer = result["result"]
         logger.info(f"\n🤖 Comprehensive Answer:\n{answer}")
         return answer
 
+    async def adebug_rag_response(self, question: str) -> str:
+        """Async variant of debug_rag_response."""
+        logger.info(f"🔍 Question: {question}")
+        async with self._semaphore:
+            await self._run_cpu(self._log_candidate_scores, question)
+            result = await self.qa.ainvoke({"query": question})
+        answer = result["result"]
+        logger.info(f"\n🤖 Comprehensive Answer:\n{answer}")
+        return answer
+
 # Global RAG engine instance
 rag_engine = RAGEngine()
@@ -0,0 +1,103 @@
+# core/rerankers.py
+import hashlib
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+
+from langchain.retrievers.document_compressors import CrossEncoderReranker
+from langchain_core.callbacks import Callbacks
+from langchain_core.documents import Document
+from pydantic import PrivateAttr
+
+from app.core.cache import LRUTTLCache
+
+logger = logging.getLogger(__name__)
+
+
+def chunk_key(doc: Document) -> str:
+    """
+    Identity for a chunk's current text: its vector store id plus a hash of its content.
+    Ids are positional (ingestion.chunk_id), so reindexing an edited file reuses them for
+    new text; the content hash keeps cached scores from outliving the text they scored.
+    """
+    content_hash = hashlib.sha1(doc.page_content.encode("utf-8")).hexdigest()
+    if getattr(doc, "id", None):
+        return f"{doc.id}:{content_hash[:16]}"
+    return content_hash
+
+
+class CachedCrossEncoderReranker(CrossEncoderReranker):
+    """
+    CrossEncoderReranker that dedupes candidates by chunk id / content hash before
+    scoring and memoizes (query, chunk) -> score, so overlapping MultiQuery results
+    and repeated questions skip redundant cross-encoder forward passes.
+    The score is also written to each returned document's metadata["score"].
+    """
+
+    score_cache: Optional[LRUTTLCache] = None
+    cache_namespace: str = ""  # reranker model/backend; part of every key
+
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _pairs_scored: int = PrivateAttr(default=0)
+    _pairs_skipped: int = PrivateAttr(default=0)
+    _requests: int = PrivateAttr(default=0)
+
+    def _score_key(self, query: str, key: str) -> str:
+        return hashlib.sha256(f"{self.cache_namespace}\n{query}\n{key}".encode("utf-8")).hexdigest()
+
+    def compress_documents(
+        self,
+        documents: Sequence[Document],
+        query: str,
+        callbacks: Optional[Callbacks] = None,
+    ) -> Sequence[Document]:
+        unique: Dict[str, Document] = {}
+        for doc in documents:
+            unique.setdefault(chunk_key(doc), doc)
+
+        scores: Dict[str, float] = {}
+        pending: List[str] = []
+        for key in unique:
+            cached = self.score_cache.get(self._score_key(query, key)) if self.score_cache else None
+            if cached is not None:
+                scores[key] = cached
+            else:
+                pending.append(key)
+
+        if pending:
+            new_scores = self.model.score([(query, unique[key].page_content) for key in pending])
+            for key, score in zip(pending, new_scores):
+                scores[key] = float(score)
+                if self.score_cache is not None:
+                    self.score_cache.set(self._score_key(query, key), scores[key])
+
+        skipped = len(documents) - len(pending)
+        with self._lock:
+            self._requests += 1
+            self._pairs_scored += len(pending)
+            self._pairs_skipped += skipped
+        logger.info(
+            f"Rerank: {len(documents)} candidates, {len(pending)} pairs scored, {skipped} skipped "
+            f"({len(documents) - len(unique)} duplicates, {len(unique) - len(pending)} cached)"
+        )
+
+        ranked = sorted(unique, key=lambda key: scores[key], reverse=True)[: self.top_n]
+        return [
+            Document(
+                id=unique[key].id,
+                page_content=unique[key].page_content,
+                metadata={**unique[key].metadata, "score": scores[key]},
+            )
+            for key in ranked
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self._pairs_scored + self._pairs_skipped
+            return {
+                "requests": self._requests,
+                "pairs_scored": self._pairs_scored,
+                "pairs_skipped": self._pairs_skipped,
+                "skip_rate": round(self._pairs_skipped / total, 4) if total else 0.0,
+                "score_cache": self.score_cache.stats() if self.score_cache else {"enabled": False},
+            }
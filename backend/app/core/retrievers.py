@@ -0,0 +1,250 @@
+# core/retrievers.py
+import hashlib
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain.retrievers import MultiQueryRetriever
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.runnables.config import run_in_executor
+from pydantic import Field
+
+from app.core.cache import LRUTTLCache
+from app.core.embeddings import embed_queries
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_question(question: str) -> str:
+    """Case/whitespace/trailing-punctuation insensitive form used for cache keys."""
+    return " ".join(question.lower().split()).rstrip("?!. ")
+
+
+def _unit_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1.0, norms)
+
+
+def mmr_select(query_embedding, candidate_embeddings, k: int = 4, lambda_mult: float = 0.5) -> List[int]:
+    """
+    Maximal marginal relevance over candidate vectors; returns candidate indices in pick order.
+    Candidates are normalized once and each step only adds one matrix-vector product to a
+    running max-similarity-to-selected vector (langchain's maximal_marginal_relevance rebuilds
+    the selected-vs-candidates similarity matrix every step). Same selection rule and ties.
+    `query_embedding` may be a (n_queries, dim) matrix: relevance is then the best cosine
+    to any of the queries.
+    """
+    candidates = np.asarray(candidate_embeddings, dtype=np.float32)
+    k = min(k, len(candidates))
+    if k <= 0:
+        return []
+    candidates = _unit_rows(candidates)
+    query = _unit_rows(np.asarray(query_embedding, dtype=np.float32))
+    relevance = candidates @ query if query.ndim == 1 else (candidates @ query.T).max(axis=1)
+
+    selected = [int(np.argmax(relevance))]
+    redundancy = candidates @ candidates[selected[0]]
+    available = np.ones(len(candidates), dtype=bool)
+    available[selected[0]] = False
+    while len(selected) < k:
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(redundancy, candidates @ candidates[best], out=redundancy)
+    return selected
+
+
+class VectorSearchRetriever(BaseRetriever):
+    """
+    Chroma-backed retriever (same search_type/search_kwargs contract as
+    `vectorstore.as_retriever`) that can also serve many queries at once:
+    `search_many` embeds every query in one batch and issues a single Chroma
+    `query()` with all query embeddings, then applies MMR per query.
+    `domains` restricts every search to chunks whose metadata["domain"] is listed.
+    With `mmr_over_union`, multi-query callers use `search_union` instead: one MMR pass
+    over the deduplicated candidates of all queries.
+    """
+
+    vectorstore: Any
+    search_type: str = "mmr"  # "mmr" or "similarity"
+    search_kwargs: Dict[str, Any] = Field(default_factory=dict)
+    domains: Optional[List[str]] = None
+    mmr_over_union: bool = False
+
+    def with_domains(self, domains: Optional[List[str]]) -> "VectorSearchRetriever":
+        """Shallow copy scoped to `domains` (cheap enough to build per request)."""
+        return self.model_copy(update={"domains": list(domains) if domains else None})
+
+    def _where(self) -> Optional[Dict[str, Any]]:
+        where = self.search_kwargs.get("filter")
+        if self.domains:
+            domain_filter = {"domain": {"$in": list(self.domains)}}
+            where = {"$and": [where, domain_filter]} if where else domain_filter
+        return where
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return self.search_many([query])[0]
+
+    def search_many(self, queries: List[str]) -> List[List[Document]]:
+        """Return one result list per query, using one embedding batch and one ANN call."""
+        if not queries:
+            return []
+        k = self.search_kwargs.get("k", 4)
+        use_mmr = self.search_type == "mmr"
+        n_results = self.search_kwargs.get("fetch_k", 20) if use_mmr else k
+
+        query_embeddings = embed_queries(self.vectorstore.embeddings, queries)
+        include = ["documents", "metadatas", "distances"] + (["embeddings"] if use_mmr else [])
+        results = self.vectorstore._collection.query(
+            query_embeddings=query_embeddings,
+            n_results=n_results,
+            where=self._where(),
+            include=include,
+        )
+
+        per_query: List[List[Document]] = []
+        for qi, query_embedding in enumerate(query_embeddings):
+            ids = results["ids"][qi]
+            if use_mmr and ids:
+                order = mmr_select(
+                    query_embedding,
+                    results["embeddings"][qi],
+                    k=k,
+                    lambda_mult=self.search_kwargs.get("lambda_mult", 0.5),
+                )
+            else:
+                order = range(min(k, len(ids)))
+            per_query.append([
+                Document(
+                    id=ids[i],
+                    page_content=results["documents"][qi][i],
+                    metadata=results["metadatas"][qi][i] or {},
+                )
+                for i in order
+            ])
+        return per_query
+
+    def search_union(self, queries: List[str]) -> List[Document]:
+        """
+        One MMR pass over the union of every query's fetch_k candidates (duplicates
+        dropped), relevance being the best similarity to any query. Selects k per query,
+        the same budget search_many hands downstream, minus its cross-query duplicates.
+        """
+        if not queries:
+            return []
+        if self.search_type != "mmr":
+            return [doc for docs in self.search_many(queries) for doc in docs]
+        query_embeddings = embed_queries(self.vectorstore.embeddings, queries)
+        results = self.vectorstore._collection.query(
+            query_embeddings=query_embeddings,
+            n_results=self.search_kwargs.get("fetch_k", 20),
+            where=self._where(),
+            include=["documents", "metadatas", "embeddings"],
+        )
+
+        pool: Dict[str, Tuple[str, Dict[str, Any], Any]] = {}
+        for qi in range(len(queries)):
+            for i, doc_id in enumerate(results["ids"][qi]):
+                if doc_id not in pool:
+                    pool[doc_id] = (results["documents"][qi][i], results["metadatas"][qi][i], results["embeddings"][qi][i])
+        if not pool:
+            return []
+        ids = list(pool)
+        order = mmr_select(
+            query_embeddings,
+            [pool[doc_id][2] for doc_id in ids],
+            k=self.search_kwargs.get("k", 4) * len(queries),
+            lambda_mult=self.search_kwargs.get("lambda_mult", 0.5),
+        )
+        return [
+            Document(id=ids[i], page_content=pool[ids[i]][0], metadata=pool[ids[i]][1] or {})
+            for i in order
+        ]
+
+    def search_with_relevance(self, query_embedding: List[float], k: int) -> List[Tuple[Document, float]]:
+        """Plain top-k for a precomputed query embedding, with the vector store's relevance scores (0-1)."""
+        results = self.vectorstore._collection.query(
+            query_embeddings=[query_embedding],
+            n_results=k,
+            where=self._where(),
+            include=["documents", "metadatas", "distances"],
+        )
+        relevance = self.vectorstore._select_relevance_score_fn()
+        return [
+            (Document(id=doc_id, page_content=text, metadata=metadata or {}), relevance(distance))
+            for doc_id, text, metadata, distance in zip(
+                results["ids"][0], results["documents"][0], results["metadatas"][0], results["distances"][0]
+            )
+        ]
+
+
+class CachedMultiQueryRetriever(MultiQueryRetriever):
+    """
+    MultiQueryRetriever that memoizes the LLM-generated query variants, so repeated
+    questions skip the expansion round trip. `cache_namespace` (expansion prompt +
+    LLM model) is hashed into every key, so changing either invalidates old entries.
+    """
+
+    query_cache: Optional[LRUTTLCache] = None
+    cache_namespace: str = ""
+
+    def _cache_key(self, question: str) -> str:
+        raw = f"{self.cache_namespace}\n{normalize_question(question)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def generate_queries(self, question: str, run_manager: CallbackManagerForRetrieverRun) -> List[str]:
+        if self.query_cache is None:
+            return super().generate_queries(question, run_manager)
+        key = self._cache_key(question)
+        cached = self.query_cache.get(key)
+        if cached is not None:
+            logger.info(f"Query expansion cache hit: {cached}")
+            return list(cached)
+        queries = super().generate_queries(question, run_manager)
+        if queries:
+            self.query_cache.set(key, list(queries))
+        return queries
+
+    async def agenerate_queries(self, question: str, run_manager: AsyncCallbackManagerForRetrieverRun) -> List[str]:
+        if self.query_cache is None:
+            return await super().agenerate_queries(question, run_manager)
+        key = self._cache_key(question)
+        cached = self.query_cache.get(key)
+        if cached is not None:
+            logger.info(f"Query expansion cache hit: {cached}")
+            return list(cached)
+        queries = await super().agenerate_queries(question, run_manager)
+        if queries:
+            self.query_cache.set(key, list(queries))
+        return queries
+
+
+class BatchedMultiQueryRetriever(CachedMultiQueryRetriever):
+    """
+    CachedMultiQueryRetriever whose sub-searches (original + variants) run as one batched
+    embedding + ANN pass when the base retriever supports `search_many`, instead of one
+    retriever call per query.
+    """
+
+    def retrieve_documents(self, queries: List[str], run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        if getattr(self.retriever, "mmr_over_union", False):
+            return self.retriever.search_union(queries)
+        search_many = getattr(self.retriever, "search_many", None)
+        if search_many is None:
+            return super().retrieve_documents(queries, run_manager)
+        return [doc for docs in search_many(queries) for doc in docs]
+
+    async def aretrieve_documents(
+        self, queries: List[str], run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        if getattr(self.retriever, "mmr_over_union", False):
+            return await run_in_executor(None, self.retriever.search_union, queries)
+        search_many = getattr(self.retriever, "search_many", None)
+        if search_many is None:
+            return await super().aretrieve_documents(queries, run_manager)
+        document_lists = await run_in_executor(None, search_many, queries)
+        return [doc for docs in document_lists for doc in docs]
@@ -0,0 +1,185 @@
+# core/routing.py
+import logging
+import os
+import tempfile
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.hybrid import collection_fingerprint
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1.0, norms)
+
+
+def spherical_kmeans(vectors: np.ndarray, k: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """k unit-norm centroids of unit-norm vectors (cosine k-means, random-sample init)."""
+    k = min(k, len(vectors))
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)]
+    for _ in range(iterations):
+        assign = np.argmax(vectors @ centroids.T, axis=1)
+        for c in range(k):
+            members = vectors[assign == c]
+            if len(members):
+                centroids[c] = members.sum(axis=0)
+        centroids = _normalize(centroids)
+    return centroids
+
+
+class DomainRouter:
+    """
+    Embedding-centroid router over library domains.
+    Each domain is summarized by one or more unit-norm centroids of its chunk vectors
+    (kept as one small float32 matrix); a query is routed to the top-n domains by best
+    centroid similarity, or to None (global search) when the cut-off is not clear.
+    """
+
+    def __init__(self, centroids: Optional[np.ndarray] = None, centroid_domains: Optional[List[str]] = None,
+                 doc_count: int = 0, fingerprint: Optional[Tuple[int, float]] = None):
+        self.centroids = centroids if centroids is not None else np.zeros((0, 0), dtype=np.float32)
+        self.centroid_domains = list(centroid_domains or [])
+        self.domains = list(dict.fromkeys(self.centroid_domains))
+        self.doc_count = doc_count
+        self.fingerprint = fingerprint  # collection_fingerprint() of the collection it was built from
+        # Column index of each centroid's domain, for the per-domain max below
+        self._domain_index = np.asarray([self.domains.index(d) for d in self.centroid_domains], dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.domains)
+
+    # ---- Build / persist ----
+
+    @classmethod
+    def from_collection(
+        cls, collection, centroids_per_domain: int = 1, sample_per_domain: int = 2000,
+        batch_size: int = 5000, seed: int = 0, db_path: Optional[str] = None,
+    ) -> "DomainRouter":
+        """
+        Build from the stored chunk vectors and their metadata["domain"] (paged reads).
+        With one centroid per domain it is the exact mean direction; with more, they come
+        from k-means over a reservoir sample of each domain's vectors.
+        db_path is the Chroma directory whose sqlite mtime goes into the fingerprint.
+        """
+        fingerprint = collection_fingerprint(collection, db_path)
+        rng = np.random.default_rng(seed)
+        sums: Dict[str, np.ndarray] = {}
+        seen: Dict[str, int] = defaultdict(int)
+        samples: Dict[str, List[np.ndarray]] = defaultdict(list)
+        offset = doc_count = 0
+        while True:
+            page = collection.get(include=["embeddings", "metadatas"], limit=batch_size, offset=offset)
+            if not len(page["ids"]):
+                break
+            vectors = _normalize(np.asarray(page["embeddings"], dtype=np.float32))
+            for vector, metadata in zip(vectors, page["metadatas"]):
+                domain = (metadata or {}).get("domain")
+                if not domain:
+                    continue
+                sums[domain] = sums[domain] + vector if domain in sums else vector.copy()
+                seen[domain] += 1
+                if centroids_per_domain > 1:
+                    if len(samples[domain]) < sample_per_domain:
+                        samples[domain].append(vector)
+                    else:
+                        slot = rng.integers(seen[domain])
+                        if slot < sample_per_domain:
+                            samples[domain][slot] = vector
+            offset += len(page["ids"])
+            doc_count += len(page["ids"])
+
+        rows, row_domains = [], []
+        for domain in sorted(sums):
+            if centroids_per_domain > 1 and seen[domain] > centroids_per_domain:
+                domain_rows = list(spherical_kmeans(np.stack(samples[domain]), centroids_per_domain, seed=seed))
+            else:
+                domain_rows = [_normalize(sums[domain])]
+            rows.extend(domain_rows)
+            row_domains.extend([domain] * len(domain_rows))
+        centroids = np.stack(rows).astype(np.float32) if rows else None
+        logger.info(f"Built domain router: {len(sums)} domains, {len(row_domains)} centroids over {doc_count} chunks")
+        return cls(centroids, row_domains, doc_count, fingerprint)
+
+    def save(self, path: str):
+        """Write to a unique temp file and rename, so concurrent writers and readers never collide."""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            "wb", dir=directory or ".", prefix=f"{os.path.basename(path)}.", suffix=".tmp", delete=False
+        ) as f:
+            tmp_path = f.name
+            try:
+                extra = {"fingerprint": np.asarray(self.fingerprint, dtype=np.float64)} if self.fingerprint else {}
+                np.savez(f, centroids=self.centroids, centroid_domains=np.asarray(self.centroid_domains),
+                         doc_count=np.asarray(self.doc_count), **extra)
+            except BaseException:
+                f.close()
+                os.remove(tmp_path)
+                raise
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "DomainRouter":
+        with np.load(path) as data:
+            fingerprint = (int(data["fingerprint"][0]), float(data["fingerprint"][1])) if "fingerprint" in data else None
+            return cls(data["centroids"], [str(d) for d in data["centroid_domains"]], int(data["doc_count"]), fingerprint)
+
+    # ---- Query ----
+
+    def scores(self, query_vector) -> List[Tuple[str, float]]:
+        """(domain, best centroid cosine) for every domain, best first."""
+        if not len(self.domains):
+            return []
+        sims = self.centroids @ _normalize(np.asarray(query_vector, dtype=np.float32))
+        best = np.full(len(self.domains), -np.inf, dtype=np.float32)
+        np.maximum.at(best, self._domain_index, sims)
+        order = np.argsort(-best)
+        return [(self.domains[i], float(best[i])) for i in order]
+
+    def route(self, query_vector, top_n: int, min_margin: float) -> Optional[List[str]]:
+        """
+        The top_n domains, or None (search everything) when there are no more domains
+        than top_n or the last chosen domain beats the first excluded one by < min_margin.
+        """
+        ranked = self.scores(query_vector)
+        if len(ranked) <= top_n:
+            return None
+        margin = ranked[top_n - 1][1] - ranked[top_n][1]
+        if margin < min_margin:
+            return None
+        return [domain for domain, _ in ranked[:top_n]]
+
+
+def load_or_build_router(
+    collection, path: Optional[str], centroids_per_domain: int = 1, save: bool = True,
+    db_path: Optional[str] = None,
+) -> Optional[DomainRouter]:
+    """
+    Load the prebuilt centroid table when its fingerprint (row count + sqlite mtime, see
+    hybrid.collection_fingerprint) matches the collection, else build one and save it to `path`.
+    Serving workers pass save=False: they only load, and a missing or stale table returns None
+    (routing off) instead of every worker scanning all embeddings; building is left to
+    scritps/build_domain_router.py / ingest.py.
+    """
+    if path and os.path.exists(path):
+        router = DomainRouter.load(path)
+        if router.fingerprint is not None and router.fingerprint == collection_fingerprint(collection, db_path):
+            logger.info(f"Loaded domain router ({len(router)} domains) from {path}")
+            return router
+        reason = f"Domain router at {path} is stale"
+    else:
+        reason = f"No prebuilt domain router at {path}"
+    if not save:
+        logger.warning(f"{reason}; routing is off until scritps/build_domain_router.py rebuilds it")
+        return None
+    logger.info(f"{reason}, building one")
+    router = DomainRouter.from_collection(collection, centroids_per_domain=centroids_per_domain, db_path=db_path)
+    if path:
+        router.save(path)
+    return router
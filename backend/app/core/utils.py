@@ -1,5 +1,9 @@
 # utils.py
-import logging, re
+import hashlib, logging, os, re, threading
+from typing import Optional, Tuple
+
+from app.config.settings import settings
+from app.core.cache import LRUTTLCache
 
 logger = logging.getLogger(__name__)
 
@@ -21,9 +25,110 @@ def clean_repetitive_text(text: str) -> str:
             break
     return (". ".join(out) + ("." if out else ""))
 
-def count_tokens(text: str) -> int:
+
+class RepetitionFilter:
+    """
+    Streaming clean_repetitive_text: feed() LLM chunks and emit text as sentences complete;
+    the concatenation of everything emitted (including flush()) equals
+    clean_repetitive_text() of the full text. `stopped` turns True once the answer loops.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._seen = set()
+        self._count = 0
+        self.stopped = False
+
+    def _sentence(self, s: str) -> str:
+        s = s.strip()
+        if s and s not in self._seen:
+            self._seen.add(s)
+            self._count += 1
+            return s if self._count == 1 else ". " + s
+        if self._count > 5:
+            self.stopped = True
+        return ""
+
+    def feed(self, chunk: str) -> str:
+        if self.stopped:
+            return ""
+        *sentences, self._buffer = (self._buffer + chunk).split(".")
+        out = []
+        for s in sentences:
+            out.append(self._sentence(s))
+            if self.stopped:
+                break
+        return "".join(out)
+
+    def flush(self) -> str:
+        tail = "" if self.stopped else self._sentence(self._buffer)
+        self._buffer = ""
+        return tail + ("." if self._count else "")
+
+# ---- Token counting ----
+
+_tokenizer = None
+_tokenizer_loaded = False
+_tokenizer_lock = threading.Lock()
+_token_cache = LRUTTLCache(max_entries=getattr(settings, "TOKEN_COUNT_CACHE_MAX_ENTRIES", 100000))
+
+def heuristic_count_tokens(text: str) -> int:
     return len(text) // 4
 
+def _load_tokenizer(name: str):
+    from tokenizers import Tokenizer
+    local_file = getattr(settings, "LLM_TOKENIZER_FILE", None)
+    if local_file and os.path.isfile(local_file):
+        return Tokenizer.from_file(local_file), local_file
+    if os.path.isfile(name):
+        return Tokenizer.from_file(name), name
+    return Tokenizer.from_pretrained(name), f"{name} (Hugging Face Hub)"
+
+def get_tokenizer():
+    """
+    LLM_MODEL's tokenizer (HF `tokenizers`), loaded once: LLM_TOKENIZER_FILE when present,
+    else LLM_TOKENIZER (local file or Hub id). None means use the heuristic.
+    """
+    global _tokenizer, _tokenizer_loaded
+    if _tokenizer_loaded:
+        return _tokenizer
+    with _tokenizer_lock:
+        if not _tokenizer_loaded:
+            name = getattr(settings, "LLM_TOKENIZER", None)
+            if name:
+                try:
+                    _tokenizer, source = _load_tokenizer(name)
+                    logger.info(f"Token counting with tokenizer {source}")
+                except Exception as e:
+                    logger.warning(
+                        f"Tokenizer {name} unavailable, falling back to the len/4 heuristic for prompt budgets "
+                        f"(run scritps/fetch_tokenizer.py to ship {getattr(settings, 'LLM_TOKENIZER_FILE', None)}): {e}"
+                    )
+            else:
+                logger.warning("LLM_TOKENIZER is not set, counting tokens with the len/4 heuristic")
+            _tokenizer_loaded = True
+    return _tokenizer
+
+def count_tokens(text: str, cache_key: Optional[str] = None) -> int:
+    """
+    Token count under LLM_MODEL's tokenizer (len/4 if it cannot be loaded).
+    Pass a stable `cache_key` (e.g. chunk id) for static text to reuse earlier counts.
+    """
+    if not text:
+        return 0
+    if cache_key is not None:
+        cached = _token_cache.get(cache_key)
+        if cached is not None:
+            return cached
+    tokenizer = get_tokenizer()
+    if tokenizer is None:
+        n = heuristic_count_tokens(text)
+    else:
+        n = len(tokenizer.encode(text, add_special_tokens=False).ids)
+    if cache_key is not None:
+        _token_cache.set(cache_key, n)
+    return n
+
 def _sanitize(text: str) -> str:
     if not text:
         return text
@@ -32,25 +137,110 @@ def _sanitize(text: str) -> str:
     text = _IDLIKE_RE.sub("", text)
     return " ".join(text.split())
 
+# ---- Precomputed snippets (index time) ----
+
+SNIPPET_KEY = "snippet"
+SNIPPET_TOKENS_KEY = "snippet_tokens"
+SNIPPET_CHARS_KEY = "snippet_chars"
+SNIPPET_TOKENIZER_KEY = "snippet_tokenizer"
+
+def tokenizer_name() -> str:
+    """Identifies what count_tokens measures, so stored counts can be validated."""
+    return getattr(settings, "LLM_TOKENIZER", None) if get_tokenizer() is not None else "len/4"
+
+def snippet_metadata(text: str, snippet_chars: int = 600) -> dict:
+    """Chunk metadata holding the sanitized snippet and its token count (see precompute_snippets.py)."""
+    snippet = _sanitize((text or "").strip()[:snippet_chars]) or ""
+    return {
+        SNIPPET_KEY: snippet,
+        SNIPPET_TOKENS_KEY: count_tokens(snippet),
+        SNIPPET_CHARS_KEY: snippet_chars,
+        SNIPPET_TOKENIZER_KEY: tokenizer_name(),
+    }
+
+def _snippet(doc, snippet_chars: int) -> Tuple[str, int]:
+    """(sanitized snippet, tokens): precomputed metadata when it matches, else computed now."""
+    metadata = getattr(doc, "metadata", None) or {}
+    if (
+        metadata.get(SNIPPET_TOKENS_KEY) is not None
+        and metadata.get(SNIPPET_CHARS_KEY) == snippet_chars
+        and metadata.get(SNIPPET_TOKENIZER_KEY) == tokenizer_name()
+    ):
+        return metadata.get(SNIPPET_KEY) or "", int(metadata[SNIPPET_TOKENS_KEY])
+    content = (getattr(doc, "page_content", "") or "").strip()
+    if not content:
+        return "", 0
+    snippet = _sanitize(content[:snippet_chars])
+    # Keyed by the snippet's content, not the chunk id: reindexing reuses ids for edited text
+    return snippet, count_tokens(snippet, cache_key=hashlib.sha1(snippet.encode("utf-8")).hexdigest())
+
+CONTEXT_SEPARATOR = "\n\n---\n\n"
+
+def trim_to_tokens(text: str, max_tokens: int) -> str:
+    """Longest prefix of `text` (cut at a word boundary) within max_tokens."""
+    tokenizer = get_tokenizer()
+    if tokenizer is None:
+        prefix = text[: max_tokens * 4]
+    else:
+        encoding = tokenizer.encode(text, add_special_tokens=False)
+        if len(encoding.ids) <= max_tokens:
+            return text
+        prefix = text[: encoding.offsets[max_tokens - 1][1]] if max_tokens > 0 else ""
+    if len(prefix) < len(text) and " " in prefix:
+        prefix = prefix.rsplit(" ", 1)[0]
+    return prefix.strip()
+
+def pack_documents(
+    docs,
+    max_context_tokens: int = 2500,
+    snippet_chars: int = 600,
+    min_snippet_tokens: int = 32,
+) -> Tuple[str, int]:
+    """
+    Single-pass context packing. Picks sanitized snippets (precomputed at index time
+    when present) greedily by relevance score per token (metadata["score"] from the
+    reranker, else 1 / rank) until the budget is used; the first snippet that does not
+    fit is trimmed into the remaining space when at least `min_snippet_tokens` are left.
+    Selected snippets keep their retrieval order. Tokenizer-bound: async callers run it
+    on the RAG executor.
+    Returns (context, context_tokens) - the count includes the separators.
+    """
+    sep_tokens = count_tokens(CONTEXT_SEPARATOR, cache_key="__context_separator__")
+    candidates = []  # (rank, snippet, tokens, score)
+    for rank, doc in enumerate(docs):
+        snippet, toks = _snippet(doc, snippet_chars)
+        if not snippet:
+            continue
+        score = (getattr(doc, "metadata", None) or {}).get("score")
+        score = float(score) if score is not None else 1.0 / (rank + 1)
+        candidates.append((rank, snippet, toks, max(score, 1e-6)))
+
+    chosen, used = [], 0
+    for rank, snippet, toks, score in sorted(candidates, key=lambda c: c[3] / (c[2] + sep_tokens), reverse=True):
+        cost = toks + (sep_tokens if chosen else 0)
+        if used + cost <= max_context_tokens:
+            chosen.append((rank, snippet))
+            used += cost
+            continue
+        room = max_context_tokens - used - (sep_tokens if chosen else 0)
+        if room < min_snippet_tokens:
+            continue  # a smaller, lower-density snippet may still fit whole
+        trimmed = trim_to_tokens(snippet, room)
+        if trimmed:
+            used += count_tokens(trimmed) + (sep_tokens if chosen else 0)
+            chosen.append((rank, trimmed))
+        break
+
+    context = CONTEXT_SEPARATOR.join(snippet for _, snippet in sorted(chosen))
+    return context, used
+
 def truncate_documents(
     docs,
     max_context_tokens: int = 2500,
     snippet_chars: int = 600  # richer snippet like your pasted code
 ) -> str:
     """
-    Build a clean, label-free context string by concatenating sanitized snippets.
+    Build a clean, label-free context string from sanitized snippets (see pack_documents).
     No 'Document i' prefixes; chunks are separated by a neutral divider.
     """
-    parts, used = [], 0
-    for doc in docs:
-        content = (getattr(doc, "page_content", "") or "").strip()
-        if not content:
-            continue
-        snippet = _sanitize(content[:snippet_chars])
-        toks = count_tokens(snippet)
-        if used + toks > max_context_tokens:
-            break
-        if snippet:
-            parts.append(snippet)
-            used += toks
-    return "\n\n---\n\n".join(parts).strip()
\ No newline at end of file
+    return pack_documents(docs, max_context_tokens=max_context_tokens, snippet_chars=snippet_chars)[0]
@@ -0,0 +1,410 @@
+# core/vector_backends.py
+"""
+Vector store backends for serving.
+The engine, retrievers and index builders only need a LangChain VectorStore whose
+`_collection` answers Chroma's count / get / query calls. "chroma" is LangChain's Chroma
+over DB_PATH; "faiss" is a read-only in-process HNSW index exported from that collection
+and memory-mapped from disk, so worker processes share its pages. The export can instead
+be two-stage: an int8 or dimension-truncated graph returns a wider candidate pool,
+which is rescored exactly with the full-precision vectors (paged in from disk on
+demand). Needs the optional `faiss-cpu` package; importing this module does not.
+"""
+import json
+import logging
+import mmap
+import os
+import shutil
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from app.core.retrievers import mmr_select
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = "index.faiss"
+VECTORS_FILE = "vectors.npy"     # full-precision vectors (two-stage exports only)
+RECORDS_FILE = "records.jsonl"   # one {"document", "metadata"} JSON object per row
+OFFSETS_FILE = "offsets.npy"     # byte offset of every row in RECORDS_FILE (+ end)
+COLUMNS_FILE = "columns.npz"     # int32 value codes of the filterable metadata keys
+META_FILE = "meta.json"
+
+
+def _import_faiss():
+    try:
+        import faiss
+    except ImportError as e:
+        raise RuntimeError("The FAISS vector backend needs `pip install faiss-cpu`") from e
+    return faiss
+
+
+def _collection_space(collection) -> str:
+    """Distance function of a Chroma collection: "l2" (default), "cosine" or "ip"."""
+    space = (collection.metadata or {}).get("hnsw:space")
+    if space is None:
+        try:
+            space = collection.configuration_json.get("hnsw", {}).get("space")
+        except Exception:
+            space = None
+    return space or "l2"
+
+
+def _unit_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1.0, norms)
+
+
+# ---- Export ----
+
+def _first_stage(vectors: np.ndarray, space: str, truncate_dims: Optional[int]) -> np.ndarray:
+    """Vectors as the first-stage graph sees them: optionally truncated (and then renormalized for cosine)."""
+    if not truncate_dims:
+        return np.ascontiguousarray(vectors, dtype=np.float32)
+    head = np.ascontiguousarray(vectors[:, :truncate_dims], dtype=np.float32)
+    return _unit_rows(head) if space == "cosine" else head
+
+
+def export_faiss_index(
+    collection, out_dir: str, m: int = 32, ef_construction: int = 200,
+    filter_keys: Iterable[str] = ("domain",), compact: Optional[str] = None, truncate_dims: int = 256,
+    batch_size: int = 5000,
+) -> Dict[str, Any]:
+    """
+    Export every chunk of a Chroma collection into an HNSW index directory (same distance
+    function as the collection, so distances and relevance scores match Chroma's).
+    `compact` builds the graph over a smaller first stage, "int8" (8-bit scalar
+    quantization) or "truncate" (first `truncate_dims` dimensions), and keeps the full
+    vectors in VECTORS_FILE for rescoring. Built next to `out_dir` and swapped in at the
+    end; returns the written meta.
+    """
+    if compact not in (None, "int8", "truncate"):
+        raise ValueError(f"Unknown compact mode '{compact}' (use 'int8' or 'truncate')")
+    faiss = _import_faiss()
+    space = _collection_space(collection)
+    filter_keys = list(filter_keys)
+    tmp_dir = f"{out_dir}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    vectors_path = os.path.join(tmp_dir, VECTORS_FILE)
+
+    # Pass 1: records + full vectors (a disk-backed array, so the corpus never sits in RAM)
+    total = collection.count()
+    vectors = None
+    ids: List[str] = []
+    offsets = [0]
+    columns: Dict[str, List[Any]] = {key: [] for key in filter_keys}
+    with open(os.path.join(tmp_dir, RECORDS_FILE), "wb") as records:
+        offset = 0
+        while offset < total:
+            page = collection.get(include=["embeddings", "documents", "metadatas"], limit=batch_size, offset=offset)
+            if not len(page["ids"]):
+                break
+            page_vectors = np.asarray(page["embeddings"], dtype=np.float32)[: total - offset]
+            if space == "cosine":
+                page_vectors = _unit_rows(page_vectors)
+            if vectors is None:
+                vectors = np.lib.format.open_memmap(
+                    vectors_path, mode="w+", dtype=np.float32, shape=(total, page_vectors.shape[1])
+                )
+            vectors[offset: offset + len(page_vectors)] = page_vectors
+            for doc_id, text, metadata in zip(page["ids"], page["documents"], page["metadatas"]):
+                metadata = metadata or {}
+                line = json.dumps({"document": text or "", "metadata": metadata}, ensure_ascii=False).encode("utf-8")
+                records.write(line + b"\n")
+                offsets.append(offsets[-1] + len(line) + 1)
+                ids.append(doc_id)
+                for key in filter_keys:
+                    columns[key].append(metadata.get(key))
+            offset += len(page_vectors)
+    if vectors is None:
+        raise ValueError("Collection is empty; nothing to export")
+    vectors.flush()
+
+    # Pass 2: the graph, over the full or the compact first-stage vectors
+    full_dim = vectors.shape[1]
+    truncate = truncate_dims if compact == "truncate" else None
+    dim = truncate or full_dim
+    metric = faiss.METRIC_L2 if space == "l2" else faiss.METRIC_INNER_PRODUCT
+    if compact == "int8":
+        index = faiss.IndexHNSWSQ(dim, faiss.ScalarQuantizer.QT_8bit, m, metric)
+        sample = np.sort(np.random.default_rng(0).choice(offset, size=min(offset, 100000), replace=False))
+        index.train(_first_stage(vectors[sample], space, truncate))  # per-dimension value ranges
+    else:
+        index = faiss.IndexHNSWFlat(dim, m, metric)
+    index.hnsw.efConstruction = ef_construction
+    for start in range(0, offset, batch_size):
+        index.add(_first_stage(vectors[start: start + batch_size], space, truncate))
+        logger.info(f"Indexed {min(start + batch_size, offset)}/{offset} chunks into HNSW")
+    del vectors
+    if compact is None:
+        os.remove(vectors_path)  # the flat graph storage already holds the full vectors
+
+    faiss.write_index(index, os.path.join(tmp_dir, INDEX_FILE))
+    np.save(os.path.join(tmp_dir, OFFSETS_FILE), np.asarray(offsets, dtype=np.int64))
+    vocabs = {key: sorted({v for v in values if v is not None}, key=str) for key, values in columns.items()}
+    codes = {}
+    for key, values in columns.items():
+        lookup = {v: i for i, v in enumerate(vocabs[key])}
+        codes[key] = np.asarray([lookup.get(v, -1) for v in values], dtype=np.int32)
+    np.savez(os.path.join(tmp_dir, COLUMNS_FILE), **codes)
+    meta = {
+        "space": space,
+        "dim": full_dim,
+        "count": index.ntotal,
+        "M": m,
+        "ef_construction": ef_construction,
+        "compact": compact,
+        "first_stage_dim": index.d,
+        "ids": ids,
+        "vocabs": vocabs,
+    }
+    with open(os.path.join(tmp_dir, META_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+    old_dir = f"{out_dir}.old"
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(out_dir):
+        os.replace(out_dir, old_dir)
+    os.replace(tmp_dir, out_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    logger.info(f"HNSW index ({index.ntotal} chunks, {space}, M={m}, compact={compact}) written to {out_dir}")
+    return {k: v for k, v in meta.items() if k != "ids"}
+
+
+# ---- Serving ----
+
+class FaissCollection:
+    """
+    Read-only, Chroma-compatible view (count / get / query) of an exported HNSW index.
+    The index and the row records are memory-mapped; only ids, offsets and the
+    filterable metadata columns live on the heap. `where` filters may use $and / $or
+    and $eq / $ne / $in / $nin on the exported filter keys; filters leaving at most
+    `exact_filter_max_rows` rows are answered by an exact scan of those rows.
+    Two-stage exports fetch `rescore_factor` x n_results candidates from the compact
+    graph and rank them by their exact full-precision distances.
+    """
+
+    def __init__(
+        self, path: str, ef_search: int = 64, use_mmap: bool = True, exact_filter_max_rows: int = 50000,
+        rescore_factor: int = 4,
+    ):
+        faiss = _import_faiss()
+        self._faiss = faiss
+        with open(os.path.join(path, META_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.path = path
+        self.space = meta["space"]
+        self.metadata = {"hnsw:space": self.space}
+        self.dim = meta["dim"]
+        self.compact = meta.get("compact")
+        self.ef_search = ef_search
+        self.exact_filter_max_rows = exact_filter_max_rows
+        self.rescore_factor = rescore_factor
+        # IO_FLAG_MMAP_IFC maps the graph and vectors in place (file-backed pages);
+        # plain IO_FLAG_MMAP still copies an HNSWFlat index onto the heap.
+        mmap_flag = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+        self.index = faiss.read_index(os.path.join(path, INDEX_FILE), mmap_flag if use_mmap else 0)
+        self._storage = faiss.downcast_index(self.index.storage)  # flat vectors under the graph
+        # Full-precision vectors of a two-stage export; pages are read only for rescored rows
+        self._vectors = np.load(os.path.join(path, VECTORS_FILE), mmap_mode="r") if self.compact else None
+        self._truncate_dims = self.index.d if self.compact == "truncate" else None
+        self.ids: List[str] = meta["ids"]
+        self._row = {doc_id: i for i, doc_id in enumerate(self.ids)}
+        self._offsets = np.load(os.path.join(path, OFFSETS_FILE), mmap_mode="r" if use_mmap else None)
+        with open(os.path.join(path, RECORDS_FILE), "rb") as f:
+            self._records = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if use_mmap else f.read()
+        with np.load(os.path.join(path, COLUMNS_FILE)) as columns:
+            self._columns = {key: columns[key] for key in columns.files}
+        self._vocabs = {key: {v: i for i, v in enumerate(values)} for key, values in meta["vocabs"].items()}
+
+    def count(self) -> int:
+        return self.index.ntotal
+
+    def _record(self, row: int) -> Dict[str, Any]:
+        return json.loads(self._records[int(self._offsets[row]):int(self._offsets[row + 1])])
+
+    def _mask(self, where: Dict[str, Any]) -> np.ndarray:
+        """Boolean row mask for a Chroma `where` filter."""
+        masks = []
+        for key, cond in where.items():
+            if key in ("$and", "$or"):
+                sub = [self._mask(clause) for clause in cond]
+                masks.append(np.logical_and.reduce(sub) if key == "$and" else np.logical_or.reduce(sub))
+                continue
+            if key not in self._columns:
+                raise ValueError(f"Metadata key '{key}' is not filterable in the FAISS index (export it as a filter key)")
+            op, value = next(iter(cond.items())) if isinstance(cond, dict) else ("$eq", cond)
+            values = value if op in ("$in", "$nin") else [value]
+            vocab = self._vocabs[key]
+            hit = np.isin(self._columns[key], [vocab[v] for v in values if v in vocab])
+            masks.append(~hit if op in ("$ne", "$nin") else hit)
+        return np.logical_and.reduce(masks) if masks else np.ones(self.count(), dtype=bool)
+
+    def _search(self, queries: np.ndarray, k: int, where: Optional[Dict[str, Any]]) -> Tuple[np.ndarray, np.ndarray]:
+        """(distances, rows) per query; rows are -1 past the available results."""
+        faiss = self._faiss
+        k = min(k, self.count())
+        if not where:
+            return self.index.search(queries, k, params=faiss.SearchParametersHNSW(efSearch=max(self.ef_search, k)))
+        mask = self._mask(where)
+        allowed = int(mask.sum())
+        if not allowed:
+            return np.zeros((len(queries), 0), dtype=np.float32), np.zeros((len(queries), 0), dtype=np.int64)
+        bits = np.packbits(mask, bitorder="little")
+        selector = faiss.IDSelectorBitmap(len(mask), faiss.swig_ptr(bits))
+        k = min(k, allowed)
+        if allowed <= self.exact_filter_max_rows:
+            # The graph walk loses recall when the filter keeps few, clustered rows (e.g. one
+            # domain); scanning just those rows is exact and about as fast as Chroma.
+            return self._storage.search(queries, k, params=faiss.SearchParameters(sel=selector))
+        # Widen the beam so it still holds ~ef_search allowed nodes
+        ef = min(max(self.ef_search, k) * len(mask) // allowed, self.count())
+        return self.index.search(queries, k, params=faiss.SearchParametersHNSW(sel=selector, efSearch=ef))
+
+    def _rescore(self, query: np.ndarray, rows: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Exact Chroma-style distances of the candidate rows, best k first."""
+        rows = np.sort(rows)  # ascending rows read the memory-mapped file sequentially
+        vectors = self._vectors[rows]
+        if self.space == "l2":
+            distances = ((vectors - query) ** 2).sum(axis=1)
+        else:
+            distances = 1.0 - vectors @ query
+        top = np.argsort(distances, kind="stable")[:k]
+        return distances[top], rows[top]
+
+    def _embeddings(self, rows: List[int]) -> np.ndarray:
+        if not rows:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        if self._vectors is not None:
+            return np.asarray(self._vectors[rows])
+        return self.index.reconstruct_batch(np.asarray(rows, dtype=np.int64))
+
+    def _rows_result(self, rows: List[int], include: Iterable[str]) -> Dict[str, Any]:
+        include = set(include)
+        records = [self._record(row) for row in rows] if include & {"documents", "metadatas"} else []
+        return {
+            "ids": [self.ids[row] for row in rows],
+            "documents": [r["document"] for r in records] if "documents" in include else None,
+            "metadatas": [r["metadata"] or None for r in records] if "metadatas" in include else None,
+            "embeddings": self._embeddings(rows) if "embeddings" in include else None,
+        }
+
+    def query(
+        self, query_embeddings, n_results: int = 10, where: Optional[Dict[str, Any]] = None,
+        include: Iterable[str] = ("documents", "metadatas", "distances"),
+    ) -> Dict[str, Any]:
+        queries = np.asarray(query_embeddings, dtype=np.float32).reshape(-1, self.dim)
+        if self.space == "cosine":
+            queries = _unit_rows(queries)
+        include = list(include)
+        out: Dict[str, List[Any]] = {key: [] for key in ("ids", "documents", "metadatas", "embeddings", "distances")}
+
+        if self.compact:
+            pool = n_results * max(self.rescore_factor, 1)
+            _, rows = self._search(_first_stage(queries, self.space, self._truncate_dims), pool, where)
+            ranked = [self._rescore(query, q_rows[q_rows >= 0], n_results) for query, q_rows in zip(queries, rows)]
+        else:
+            distances, rows = self._search(queries, n_results, where)
+            if self.space != "l2":
+                distances = 1.0 - distances  # Chroma reports 1 - dot for "ip" and "cosine"
+            ranked = [(q_distances[q_rows >= 0], q_rows[q_rows >= 0]) for q_distances, q_rows in zip(distances, rows)]
+        for q_distances, q_rows in ranked:
+            result = self._rows_result([int(r) for r in q_rows], include)
+            for key in ("ids", "documents", "metadatas", "embeddings"):
+                out[key].append(result[key])
+            out["distances"].append(q_distances.tolist())
+        return {key: (value if key == "ids" or key in include else None) for key, value in out.items()}
+
+    def get(
+        self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None,
+        limit: Optional[int] = None, offset: int = 0, include: Iterable[str] = ("documents", "metadatas"),
+    ) -> Dict[str, Any]:
+        rows = [self._row[doc_id] for doc_id in ids if doc_id in self._row] if ids is not None else range(self.count())
+        if where:
+            mask = self._mask(where)
+            rows = [row for row in rows if mask[row]]
+        rows = list(rows)[offset: offset + limit if limit is not None else None]
+        return self._rows_result(rows, include)
+
+
+class FaissVectorStore(VectorStore):
+    """Read-only LangChain VectorStore over a FaissCollection (mirrors the Chroma calls the app makes)."""
+
+    def __init__(self, collection: FaissCollection, embedding_function: Embeddings):
+        self._collection = collection
+        self._embedding_function = embedding_function
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding_function
+
+    def add_texts(self, texts, metadatas=None, **kwargs):
+        raise NotImplementedError("The FAISS backend is read-only; ingest into Chroma and re-export")
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, **kwargs):
+        raise NotImplementedError("Build the FAISS backend with export_faiss_index")
+
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        # Same mapping LangChain's Chroma uses for each distance function
+        return {
+            "cosine": self._cosine_relevance_score_fn,
+            "ip": self._max_inner_product_relevance_score_fn,
+        }.get(self._collection.space, self._euclidean_relevance_score_fn)
+
+    def similarity_search_by_vector_with_score(
+        self, embedding: List[float], k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        results = self._collection.query([embedding], n_results=k, where=filter)
+        return [
+            (Document(id=doc_id, page_content=text, metadata=metadata or {}), distance)
+            for doc_id, text, metadata, distance in zip(
+                results["ids"][0], results["documents"][0], results["metadatas"][0], results["distances"][0]
+            )
+        ]
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(self.embeddings.embed_query(query), k, filter)
+
+    def similarity_search_by_vector(
+        self, embedding: List[float], k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k, filter)]
+
+    def similarity_search(
+        self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter)]
+
+    def _similarity_search_with_relevance_scores(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        relevance = self._select_relevance_score_fn()
+        return [(doc, relevance(distance)) for doc, distance in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def max_marginal_relevance_search_by_vector(
+        self, embedding: List[float], k: int = 4, fetch_k: int = 20, lambda_mult: float = 0.5,
+        filter: Optional[Dict[str, Any]] = None, **kwargs: Any,
+    ) -> List[Document]:
+        results = self._collection.query(
+            [embedding], n_results=fetch_k, where=filter, include=["documents", "metadatas", "embeddings"]
+        )
+        order = mmr_select(embedding, results["embeddings"][0], k=k, lambda_mult=lambda_mult)
+        return [
+            Document(id=results["ids"][0][i], page_content=results["documents"][0][i],
+                     metadata=results["metadatas"][0][i] or {})
+            for i in order
+        ]
+
+    def max_marginal_relevance_search(
+        self, query: str, k: int = 4, fetch_k: int = 20, lambda_mult: float = 0.5,
+        filter: Optional[Dict[str, Any]] = None, **kwargs: Any,
+    ) -> List[Document]:
+        return self.max_marginal_relevance_search_by_vector(
+            self.embeddings.embed_query(query), k, fetch_k, lambda_mult, filter
+        )
@@ -8,11 +8,11 @@ from app.models.schemas import (
     ChatRequest, ChatResponse, GoogleTokenRequest, AuthResponse, UserInfo
 )
 from app.api.endpoints import (
-    get_rag_info, health_check, chat, debug_question, concise_chat,
+    get_rag_info, health_check, readiness_check, chat, chat_stream, debug_question, concise_chat,
     google_login, get_user_status, check_chat_limits, upgrade_placeholder,
-    get_chat_history, get_conversation_messages, delete_conversation
+    get_chat_history, get_conversation_messages, delete_conversation,
+    loaded_rag_engine, start_rag_loading
 )
-from app.core.rag_engine import rag_engine
 from app.core.auth import get_current_user, check_chat_limit
 from app.core.firebase_service import firebase_service
 from app.api import payment
@@ -25,11 +25,11 @@ logger = logging.getLogger(__name__)
 
 # Initialize FastAPI app
 app = FastAPI(title=settings.TITLE, version=settings.VERSION)
-app.include_router(payment.router, prefix="/api/payment")
 
-# Register routers
-app.include_router(payment.router, prefix="/api/payment")
-app.include_router(library.router, prefix="/api/library", tags=["library"])  # ✅ 
+# Register routers (a dedicated "rag" worker only serves chat traffic)
+if settings.WORKER_ROLE != "rag":
+    app.include_router(payment.router, prefix="/api/payment")
+    app.include_router(library.router, prefix="/api/library", tags=["library"])  # ✅ 
 
 # Add middleware
 add_cors_middleware(app)
@@ -37,13 +37,23 @@ add_cors_middleware(app)
 # Event handlers
 @app.on_event("startup")
 async def startup_event():
-    """Initialize RAG and Firebase on startup"""
+    """Initialize Firebase, and start loading RAG models in the background"""
     firebase_initialized = firebase_service.initialize()
     if not firebase_initialized:
         logger.warning("Firebase initialization failed - running without persistent storage")
     
-    rag_engine.initialize()
-    logger.info("Application startup complete")
+    # Non-RAG routes serve immediately (the RAG import runs on a worker thread); chat routes
+    # return 503 until /ready reports ready. "api" workers skip this and load the RAG stack
+    # on the first RAG request instead.
+    if settings.WORKER_ROLE in ("rag", "all"):
+        start_rag_loading()
+    logger.info(f"Application startup complete (worker role: {settings.WORKER_ROLE})")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    rag_engine = loaded_rag_engine()
+    if rag_engine is not None:
+        rag_engine.shutdown()
 
 # ============================================
 # HEALTH ROUTES
@@ -52,6 +62,10 @@ async def startup_event():
 async def health_endpoint():
     return await health_check()
 
+@app.get("/ready")
+async def ready_endpoint():
+    return await readiness_check()
+
 # ============================================
 # AUTHENTICATION ROUTES
 # ============================================
@@ -83,6 +97,14 @@ async def chat_endpoint(
 ):
     return await chat(request, current_user, background_tasks) 
 
+@app.post("/chat/stream")
+async def chat_stream_endpoint(
+    request: ChatRequest,
+    background_tasks: BackgroundTasks,
+    current_user: UserInfo = Depends(check_chat_limit)
+):
+    return await chat_stream(request, current_user, background_tasks)
+
 @app.post("/debug")
 async def debug_endpoint(request: ChatRequest, current_user: UserInfo = Depends(get_current_user)):
     return await debug_question(request, current_user)
@@ -1,12 +1,35 @@
 # models/schemas.py
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, field_validator
 from typing import List, Optional
 from datetime import datetime
+from app.config.settings import settings
 
 # Existing schemas (your current ones)
 class ChatRequest(BaseModel):
     message: str
     conversation_id: Optional[str] = "default"
+    mode: Optional[str] = None  # pipeline profile: "fast" | "balanced" | "thorough" (None -> default)
+    domains: Optional[List[str]] = None  # library domain ids to search (None -> all domains)
+
+    @field_validator("mode")
+    @classmethod
+    def check_mode(cls, value):
+        if value is not None and value not in settings.PIPELINE_PROFILES:
+            raise ValueError(f"mode must be one of {sorted(settings.PIPELINE_PROFILES)}")
+        return value
+
+    @field_validator("domains")
+    @classmethod
+    def check_domains(cls, value):
+        if value is None:
+            return None
+        from app.api.library import DOMAIN_NAME_MAPPING  # library imports this module
+
+        domains = list(dict.fromkeys(d.strip().lower() for d in value if d and d.strip()))
+        unknown = [d for d in domains if d not in DOMAIN_NAME_MAPPING]
+        if unknown:
+            raise ValueError(f"unknown domain ids {unknown} (see /api/library/domains)")
+        return domains or None
 
 class Source(BaseModel):
     document: str
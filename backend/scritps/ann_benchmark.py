@@ -0,0 +1,155 @@
+# scripts/ann_benchmark.py
+"""
+Compare the Chroma collection with the exported FAISS HNSW index (VECTOR_BACKEND="faiss").
+
+Queries are stored chunk vectors with Gaussian noise added, so no embedding model is
+needed. Ground truth is an exact search over all stored vectors, using the collection's
+distance function. For Chroma and for FAISS at each --ef-search, the benchmark reports:
+- recall@k against the exact search;
+- single-query latency (p50/p95);
+- resident memory added by loading and querying the backend, split into anonymous
+  (heap) and file-backed (mmap, shared between workers) RSS.
+
+Each backend runs in a fresh interpreter so the RSS numbers do not mix. With --domain,
+every query (and the ground truth) is restricted to those domains, like a scoped chat
+request.
+
+Usage (from backend/, after scritps/export_ann_index.py):
+    python scritps/ann_benchmark.py --queries 200 --k 10 --ef-search 16 32 64 128
+    python scritps/ann_benchmark.py --domain census sports
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config.settings import settings  # noqa: E402
+
+
+def _rss_mb() -> dict:
+    fields = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(("RssAnon:", "RssFile:")):
+                name, value, _ = line.split()
+                fields[name[:-1]] = int(value) / 1024
+    return fields
+
+
+def _queries_and_truth(args):
+    """Noisy copies of stored vectors and their exact top-k ids (from Chroma's stored vectors)."""
+    import chromadb
+    from app.core.vector_backends import _collection_space, _unit_rows
+
+    collection = chromadb.PersistentClient(path=settings.DB_PATH).get_collection(settings.COLLECTION_NAME)
+    space = _collection_space(collection)
+    ids, vectors, domains, offset = [], [], [], 0
+    while True:
+        page = collection.get(include=["embeddings", "metadatas"], limit=5000, offset=offset)
+        if not len(page["ids"]):
+            break
+        ids.extend(page["ids"])
+        vectors.append(np.asarray(page["embeddings"], dtype=np.float32))
+        domains.extend((metadata or {}).get("domain") for metadata in page["metadatas"])
+        offset += len(page["ids"])
+    vectors = np.concatenate(vectors)
+    rng = np.random.default_rng(0)
+    picks = rng.choice(len(vectors), size=min(args.queries, len(vectors)), replace=False)
+    scale = args.noise * np.linalg.norm(vectors[picks], axis=1, keepdims=True) / np.sqrt(vectors.shape[1])
+    queries = vectors[picks] + scale * rng.normal(size=(len(picks), vectors.shape[1])).astype(np.float32)
+
+    if space == "l2":
+        scores = -((queries ** 2).sum(1)[:, None] - 2 * queries @ vectors.T + (vectors ** 2).sum(1)[None, :])
+    elif space == "cosine":
+        scores = _unit_rows(queries) @ _unit_rows(vectors).T
+    else:
+        scores = queries @ vectors.T
+    if args.domain:
+        scores[:, ~np.isin(np.asarray(domains, dtype=object), args.domain)] = -np.inf
+    top = np.argsort(-scores, axis=1)[:, : args.k]
+    truth = [[ids[i] for i in row] for row in top]
+    return queries.tolist(), truth, space, len(ids)
+
+
+def _child(backend: str, ef_search: int, queries, k: int, where) -> dict:
+    """Load one backend, run the queries one by one, report latencies, ids and RSS growth."""
+    import chromadb
+    from app.core.vector_backends import FaissCollection, _import_faiss
+
+    _import_faiss()
+    rss0 = _rss_mb()  # libraries loaded; only the index itself is measured
+    if backend == "chroma":
+        collection = chromadb.PersistentClient(path=settings.DB_PATH).get_collection(settings.COLLECTION_NAME)
+    else:
+        collection = FaissCollection(
+            settings.FAISS_INDEX_PATH, ef_search=ef_search, use_mmap=settings.FAISS_MMAP,
+            exact_filter_max_rows=settings.FAISS_EXACT_FILTER_MAX_ROWS,
+            rescore_factor=settings.FAISS_RESCORE_FACTOR,
+        )
+    collection.query(query_embeddings=[queries[0]], n_results=k, where=where, include=[])  # load / warm up
+
+    latencies, got = [], []
+    for query in queries:
+        start = time.perf_counter()
+        result = collection.query(
+            query_embeddings=[query], n_results=k, where=where, include=["documents", "metadatas", "distances"]
+        )
+        latencies.append((time.perf_counter() - start) * 1000)
+        got.append(result["ids"][0])
+    rss1 = _rss_mb()
+    return {
+        "latencies": latencies,
+        "ids": got,
+        "rss_anon": rss1["RssAnon"] - rss0["RssAnon"],
+        "rss_file": rss1["RssFile"] - rss0["RssFile"],
+    }
+
+
+def _run(backend: str, ef_search: int, queries, k: int, where) -> dict:
+    payload = json.dumps({"backend": backend, "ef_search": ef_search, "queries": queries, "k": k, "where": where})
+    env = dict(os.environ, ANONYMIZED_TELEMETRY="False")
+    out = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child"],
+        input=payload, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--noise", type=float, default=0.3, help="query noise relative to vector norm")
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[16, 32, 64, 128])
+    parser.add_argument("--domain", nargs="*", help="restrict queries to these domain ids")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        job = json.loads(sys.stdin.read())
+        print(json.dumps(_child(job["backend"], job["ef_search"], job["queries"], job["k"], job["where"])))
+        return
+
+    queries, truth, space, n_docs = _queries_and_truth(args)
+    where = {"domain": {"$in": args.domain}} if args.domain else None
+    scope = f", domains {', '.join(args.domain)}" if args.domain else ""
+    print(f"{n_docs} chunks ({space}{scope}), {len(queries)} queries, recall@{args.k} vs exact search\n")
+    print(f"{'backend':16s} {'recall':>7s} {'p50 ms':>7s} {'p95 ms':>7s} {'anon MB':>8s} {'mmap MB':>8s}")
+    runs = [("chroma", 0)] + [("faiss", ef) for ef in args.ef_search]
+    for backend, ef_search in runs:
+        result = _run(backend, ef_search, queries, args.k, where)
+        recall = np.mean([len(set(t) & set(g)) / len(t) for t, g in zip(truth, result["ids"])])
+        ms = np.asarray(result["latencies"])
+        label = backend if backend == "chroma" else f"faiss ef={ef_search}"
+        print(f"{label:16s} {recall:7.4f} {np.percentile(ms, 50):7.3f} {np.percentile(ms, 95):7.3f} "
+              f"{result['rss_anon']:8.1f} {result['rss_file']:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+# scripts/build_bm25_index.py
+"""
+Prebuild the BM25 index used by RETRIEVAL_MODE = "hybrid" from the served Chroma collection
+(COLLECTION_NAME, or DEDUP_COLLECTION_NAME when SERVE_DEDUPLICATED), so API workers load it
+instead of building it at startup.
+
+Usage (from backend/):
+    python scritps/build_bm25_index.py [--out ./bm25_index.pkl]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config.settings import settings  # noqa: E402
+from app.core.dedup import serving_collection_name  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", default=settings.BM25_INDEX_PATH)
+    parser.add_argument("--collection", default=serving_collection_name(),
+                        help="defaults to the served collection (DEDUP_COLLECTION_NAME when SERVE_DEDUPLICATED)")
+    args = parser.parse_args()
+
+    import chromadb
+    from app.core.hybrid import BM25Index
+
+    collection = chromadb.PersistentClient(path=settings.DB_PATH).get_collection(args.collection)
+    start = time.perf_counter()
+    index = BM25Index.from_collection(collection, db_path=settings.DB_PATH)
+    index.save(args.out)
+    print(f"✅ BM25 index: {len(index)} chunks, {len(index.postings)} terms "
+          f"in {time.perf_counter() - start:.1f}s -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
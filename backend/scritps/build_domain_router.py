@@ -0,0 +1,44 @@
+# scripts/build_domain_router.py
+"""
+Prebuild the domain-router centroid table (DOMAIN_ROUTER_PATH) from the served Chroma
+collection (COLLECTION_NAME, or DEDUP_COLLECTION_NAME when SERVE_DEDUPLICATED), so API
+workers only load it at startup instead of each building its own.
+scritps/ingest.py rebuilds it automatically whenever chunks change.
+
+Usage (from backend/):
+    python scritps/build_domain_router.py [--centroids-per-domain 2] [--out ./chroma_db/domain_centroids.npz]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config.settings import settings  # noqa: E402
+from app.core.dedup import serving_collection_name  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", default=settings.DOMAIN_ROUTER_PATH)
+    parser.add_argument("--centroids-per-domain", type=int, default=settings.DOMAIN_ROUTER_CENTROIDS_PER_DOMAIN)
+    parser.add_argument("--collection", default=serving_collection_name(),
+                        help="defaults to the served collection (DEDUP_COLLECTION_NAME when SERVE_DEDUPLICATED)")
+    args = parser.parse_args()
+
+    import chromadb
+    from app.core.routing import DomainRouter
+
+    collection = chromadb.PersistentClient(path=settings.DB_PATH).get_collection(args.collection)
+    start = time.perf_counter()
+    router = DomainRouter.from_collection(
+        collection, centroids_per_domain=args.centroids_per_domain, db_path=settings.DB_PATH
+    )
+    router.save(args.out)
+    print(f"✅ Domain router: {len(router)} domains, {len(router.centroid_domains)} centroids over "
+          f"{router.doc_count} chunks in {time.perf_counter() - start:.1f}s -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+# scripts/check_startup_time.py
+"""
+Startup-time regression check for the lightweight `api` worker role.
+
+Imports app.main in a fresh interpreter with WORKER_ROLE=api (best of N runs) and fails
+(exit code 1) if any heavy RAG dependency (langchain, chromadb, torch, ...) was imported
+or if the app's own import time exceeds the budget. Suitable for CI.
+
+The budget applies to the delta over a baseline: the web/auth/payment stack every worker
+needs (fastapi, uvicorn, firebase_admin, ...) is imported and timed first, then app.main
+on top of it. Absolute wall-clock time mostly measures the host (disk cache, CPU), so it
+is only reported, or checked against --total-budget when one is given.
+
+Usage (from backend/):
+    python scritps/check_startup_time.py --budget 0.25 --runs 3
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = [
+    "app.core.rag_engine",
+    "langchain",
+    "langchain_community",
+    "langchain_groq",
+    "chromadb",
+    "sentence_transformers",
+    "transformers",
+    "torch",
+    "onnxruntime",
+]
+
+# Third-party modules app.main pulls in for any role; their import cost is the baseline.
+BASELINE_MODULES = [
+    "fastapi",
+    "fastapi.responses",
+    "fastapi.security",
+    "starlette.middleware.cors",
+    "uvicorn",
+    "pydantic",
+    "email_validator",
+    "dotenv",
+    "firebase_admin",
+    "firebase_admin.credentials",
+    "firebase_admin.firestore",
+    "google.oauth2.id_token",
+    "google.auth.transport.requests",
+    "jwt",
+    "bcrypt",
+    "razorpay",
+]
+
+PROBE = """
+import importlib, json, sys, time
+start = time.perf_counter()
+for name in {baseline!r}:
+    try:
+        importlib.import_module(name)
+    except ImportError:
+        pass
+baseline = time.perf_counter() - start
+start = time.perf_counter()
+import app.main
+delta = time.perf_counter() - start
+print(json.dumps({{"baseline": baseline, "seconds": delta,
+                  "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def _measure(role: str) -> dict:
+    env = dict(os.environ, WORKER_ROLE=role, ANONYMIZED_TELEMETRY="False")
+    out = subprocess.run(
+        [sys.executable, "-c", PROBE.format(baseline=BASELINE_MODULES, heavy=HEAVY_MODULES)],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget", type=float, default=0.25,
+                        help="max seconds to import app.main on top of the baseline modules")
+    parser.add_argument("--total-budget", type=float, default=None,
+                        help="optional max seconds for baseline + app.main (host dependent)")
+    parser.add_argument("--runs", type=int, default=3, help="fresh interpreters; the fastest run is checked")
+    parser.add_argument("--role", default="api")
+    args = parser.parse_args()
+
+    results = [_measure(args.role) for _ in range(args.runs)]
+    best = min(r["seconds"] for r in results)
+    best_total = min(r["baseline"] + r["seconds"] for r in results)
+    heavy = sorted({m for r in results for m in r["heavy"]})
+
+    runs = ", ".join(f"{r['seconds']:.3f}" for r in results)
+    print(f"WORKER_ROLE={args.role}: import app.main best={best:.3f}s over baseline (runs: {runs}), "
+          f"budget={args.budget:.3f}s; total with baseline best={best_total:.3f}s")
+    failed = False
+    if heavy:
+        print(f"FAIL: heavy RAG modules imported at startup: {', '.join(heavy)}")
+        failed = True
+    if best > args.budget:
+        print(f"FAIL: app import exceeds budget by {best - args.budget:.3f}s")
+        failed = True
+    if args.total_budget is not None and best_total > args.total_budget:
+        print(f"FAIL: total startup import exceeds --total-budget by {best_total - args.total_budget:.3f}s")
+        failed = True
+    if not failed:
+        print("OK")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
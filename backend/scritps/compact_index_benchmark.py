@@ -0,0 +1,110 @@
+# scripts/compact_index_benchmark.py
+"""
+Recall@k vs latency of the two-stage FAISS exports (FAISS_COMPACT), to pick an operating
+point.
+
+Exports the Chroma collection into temporary HNSW indexes:
+- full precision;
+- int8 scalar-quantized;
+- truncated to each --truncate-dims.
+Each compact variant is queried at every --rescore-factor: the first stage returns
+factor x k candidates, which are rescored exactly with the full vectors.
+
+Queries are stored chunk vectors plus Gaussian noise (no embedding model needed).
+Ground truth is an exact search. Reports:
+- recall@k;
+- single-query latency;
+- first-stage index size, which is what stays resident;
+- full-vector file size (on disk, paged in only for rescored rows).
+
+Usage (from backend/):
+    python scritps/compact_index_benchmark.py --queries 200 --k 10 --rescore-factor 1 2 4 8
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config.settings import settings  # noqa: E402
+
+
+def _mb(path: str) -> float:
+    return os.path.getsize(path) / (1024 * 1024) if os.path.exists(path) else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--noise", type=float, default=0.3, help="query noise relative to vector norm")
+    parser.add_argument("--truncate-dims", type=int, nargs="*", default=[128, 256, 384])
+    parser.add_argument("--rescore-factor", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--ef-search", type=int, default=settings.FAISS_HNSW_EF_SEARCH)
+    parser.add_argument("--m", type=int, default=settings.FAISS_HNSW_M)
+    args = parser.parse_args()
+
+    import chromadb
+    from app.core.vector_backends import (
+        INDEX_FILE, VECTORS_FILE, FaissCollection, _collection_space, _unit_rows, export_faiss_index,
+    )
+
+    collection = chromadb.PersistentClient(path=settings.DB_PATH).get_collection(settings.COLLECTION_NAME)
+    space = _collection_space(collection)
+    ids, vectors, offset = [], [], 0
+    while True:
+        page = collection.get(include=["embeddings"], limit=5000, offset=offset)
+        if not len(page["ids"]):
+            break
+        ids.extend(page["ids"])
+        vectors.append(np.asarray(page["embeddings"], dtype=np.float32))
+        offset += len(page["ids"])
+    vectors = np.concatenate(vectors)
+    rng = np.random.default_rng(0)
+    picks = rng.choice(len(vectors), size=min(args.queries, len(vectors)), replace=False)
+    scale = args.noise * np.linalg.norm(vectors[picks], axis=1, keepdims=True) / np.sqrt(vectors.shape[1])
+    queries = vectors[picks] + scale * rng.normal(size=(len(picks), vectors.shape[1])).astype(np.float32)
+    if space == "l2":
+        scores = 2 * queries @ vectors.T - (vectors ** 2).sum(1)[None, :]
+    elif space == "cosine":
+        scores = _unit_rows(queries) @ _unit_rows(vectors).T
+    else:
+        scores = queries @ vectors.T
+    truth = [{ids[i] for i in row} for row in np.argsort(-scores, axis=1)[:, : args.k]]
+    print(f"{len(ids)} chunks x {vectors.shape[1]} dims ({space}), {len(queries)} queries, "
+          f"recall@{args.k}, ef_search={args.ef_search}, M={args.m}\n")
+    del vectors, scores
+
+    variants = [("full", None, None), ("int8", "int8", None)]
+    variants += [(f"truncate {d}", "truncate", d) for d in args.truncate_dims]
+    print(f"{'first stage':14s} {'factor':>6s} {'recall':>7s} {'p50 ms':>7s} {'p95 ms':>7s} "
+          f"{'graph MB':>9s} {'full vecs MB':>13s}")
+    work_dir = tempfile.mkdtemp(prefix="compact_bench_")
+    try:
+        for label, compact, dims in variants:
+            path = os.path.join(work_dir, label.replace(" ", "_"))
+            export_faiss_index(collection, path, m=args.m, compact=compact, truncate_dims=dims or 256)
+            for factor in (args.rescore_factor if compact else [1]):
+                index = FaissCollection(path, ef_search=args.ef_search, rescore_factor=factor)
+                index.query(queries[:1], n_results=args.k, include=[])  # warm up
+                latencies, recalls = [], []
+                for query, expected in zip(queries, truth):
+                    start = time.perf_counter()
+                    got = index.query([query], n_results=args.k, include=["documents", "metadatas", "distances"])
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    recalls.append(len(expected & set(got["ids"][0])) / len(expected))
+                ms = np.asarray(latencies)
+                print(f"{label:14s} {factor:6d} {np.mean(recalls):7.4f} {np.percentile(ms, 50):7.3f} "
+                      f"{np.percentile(ms, 95):7.3f} {_mb(os.path.join(path, INDEX_FILE)):9.1f} "
+                      f"{_mb(os.path.join(path, VECTORS_FILE)):13.1f}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+# scripts/dedup_chunks.py
+"""
+Cluster near-duplicate chunks (repeated headers, templated rows) and build the
+deduplicated serving collection.
+
+Chunks of DB_PATH / COLLECTION_NAME are fingerprinted with a 64-bit SimHash of their
+word shingles; pairs within DEDUP_MAX_HAMMING bits (found by LSH banding) whose
+embeddings have cosine >= DEDUP_MIN_COSINE are merged into clusters. Every chunk is
+tagged with cluster_id (its representative's id) and cluster_size, and
+DEDUP_COLLECTION_NAME is synced to hold one representative per cluster. Set
+SERVE_DEDUPLICATED = True to serve it, rebuild the BM25 / router / FAISS indexes from it
+(scritps/ingest.py does this on every run once it is enabled), then lower fetch_k.
+
+Usage (from backend/):
+    python scritps/dedup_chunks.py --dry-run             # report cluster stats only
+    python scritps/dedup_chunks.py --min-cosine 0.97
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config.settings import settings  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--max-hamming", type=int, default=settings.DEDUP_MAX_HAMMING)
+    parser.add_argument("--min-cosine", type=float, default=settings.DEDUP_MIN_COSINE)
+    parser.add_argument("--target", default=settings.DEDUP_COLLECTION_NAME, help="deduplicated collection name")
+    parser.add_argument("--dry-run", action="store_true", help="compute clusters without writing anything")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    import chromadb
+    from app.core.dedup import deduplicate_collection
+    from app.core.ingestion import ingest_lock
+
+    with ingest_lock(settings.INGEST_MANIFEST_PATH):
+        client = chromadb.PersistentClient(path=settings.DB_PATH)
+        source = client.get_collection(settings.COLLECTION_NAME)
+        target = None
+        if not args.dry_run:
+            target = client.get_or_create_collection(args.target, metadata=source.metadata)
+        report = deduplicate_collection(
+            source, target, max_hamming=args.max_hamming, min_cosine=args.min_cosine, dry_run=args.dry_run,
+        )
+    print(json.dumps(report, indent=2))
+    if target is not None:
+        print(f"Collection '{args.target}' now holds {target.count()} chunks "
+              f"({report['reduction']:.1%} fewer than '{settings.COLLECTION_NAME}')")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# scripts/embedding_parity.py
+"""
+Check that the ONNX (int8) query encoder stays compatible with the fp32 vectors
+already persisted in chroma_db.
+
+- Stored-vector drift: cosine between re-embedded chunks and their stored vectors.
+- Retrieval parity: recall@k of ONNX query vectors vs fp32 query vectors against the
+  same collection, using the sample_questions in data/domains.json.
+- Per-query latency and the resident memory added by loading each model.
+
+Usage (from backend/):
+    python scritps/embedding_parity.py --k 10
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config.settings import settings  # noqa: E402
+
+
+def _rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+def _encode_timed(model, questions):
+    vectors, latencies = [], []
+    for question in questions:
+        start = time.perf_counter()
+        vectors.append(model.embed_query(question))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return vectors, np.asarray(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--k", type=int, default=10, help="recall@k cutoff")
+    parser.add_argument("--sample", type=int, default=256, help="stored chunks to re-embed")
+    parser.add_argument("--max-queries", type=int, default=300)
+    parser.add_argument("--no-quantize", action="store_true")
+    args = parser.parse_args()
+
+    import chromadb
+    from langchain_community.embeddings import SentenceTransformerEmbeddings
+    from app.core.embeddings import check_embedding_compatibility
+    from app.core.onnx_models import OnnxEmbeddings
+
+    domains_file = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "domains.json")
+    with open(domains_file, "r", encoding="utf-8") as f:
+        questions = [q for d in json.load(f)["domains"] for q in d.get("sample_questions", [])]
+    questions = questions[: args.max_queries]
+
+    rss0 = _rss_mb()
+    fp32 = SentenceTransformerEmbeddings(model_name=settings.EMBEDDING_MODEL)
+    fp32.embed_query("warm up")
+    rss1 = _rss_mb()
+    onnx = OnnxEmbeddings(settings.EMBEDDING_MODEL, cache_dir=settings.ONNX_CACHE_DIR, quantize=not args.no_quantize)
+    onnx.embed_query("warm up")
+    rss2 = _rss_mb()
+
+    compatible, report = check_embedding_compatibility(
+        onnx, settings.DB_PATH, settings.COLLECTION_NAME,
+        sample_size=args.sample, min_cosine=settings.EMBEDDING_ONNX_MIN_COSINE,
+    )
+
+    fp32_vecs, fp32_ms = _encode_timed(fp32, questions)
+    onnx_vecs, onnx_ms = _encode_timed(onnx, questions)
+
+    collection = chromadb.PersistentClient(path=settings.DB_PATH).get_collection(settings.COLLECTION_NAME)
+    ref = collection.query(query_embeddings=fp32_vecs, n_results=args.k, include=[])["ids"]
+    got = collection.query(query_embeddings=onnx_vecs, n_results=args.k, include=[])["ids"]
+    recalls = [len(set(r) & set(g)) / max(len(r), 1) for r, g in zip(ref, got)]
+    query_cos = [
+        float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))) for a, b in zip(fp32_vecs, onnx_vecs)
+    ]
+
+    print("=== Stored-vector compatibility ===")
+    print(f"{report}  -> {'COMPATIBLE' if compatible else 'NOT COMPATIBLE'} "
+          f"(threshold {settings.EMBEDDING_ONNX_MIN_COSINE})")
+    print(f"\n=== Retrieval parity over {len(questions)} queries ===")
+    print(f"recall@{args.k}: mean={np.mean(recalls):.4f}  min={np.min(recalls):.4f}")
+    print(f"query cosine fp32 vs onnx: mean={np.mean(query_cos):.4f}  min={np.min(query_cos):.4f}")
+    print("\n=== Latency per query (ms) ===")
+    for name, ms in (("fp32", fp32_ms), ("onnx", onnx_ms)):
+        print(f"{name:5s} mean={ms.mean():7.2f}  p50={np.percentile(ms, 50):7.2f}  p95={np.percentile(ms, 95):7.2f}")
+    print(f"speedup: {fp32_ms.mean() / onnx_ms.mean():.2f}x")
+    print("\n=== Resident memory added by model load (MB) ===")
+    print(f"fp32: {rss1 - rss0:.0f}   onnx: {rss2 - rss1:.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+# scripts/export_ann_index.py
+"""
+Export the Chroma collection (DB_PATH / COLLECTION_NAME, or DEDUP_COLLECTION_NAME when
+SERVE_DEDUPLICATED) into the read-only HNSW index served when VECTOR_BACKEND = "faiss".
+
+Writes FAISS_INDEX_PATH: the FAISS HNSW graph + vectors, the chunk texts/metadata as
+memory-mappable records, and codes for the FAISS_FILTER_KEYS metadata used by `where`
+filters. With --compact int8|truncate the graph is built over compact vectors and the
+full-precision vectors are written alongside for rescoring. The previous export is replaced only once the new one is complete.
+scritps/ingest.py re-exports automatically when an export already exists.
+
+Usage (from backend/):
+    python scritps/export_ann_index.py --m 32 --ef-construction 200
+    python scritps/export_ann_index.py --compact int8
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config.settings import settings  # noqa: E402
+from app.core.dedup import serving_collection_name  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", default=settings.FAISS_INDEX_PATH)
+    parser.add_argument("--m", type=int, default=settings.FAISS_HNSW_M, help="HNSW graph degree")
+    parser.add_argument("--ef-construction", type=int, default=settings.FAISS_HNSW_EF_CONSTRUCTION)
+    parser.add_argument("--filter-keys", nargs="*", default=settings.FAISS_FILTER_KEYS)
+    parser.add_argument("--compact", choices=["int8", "truncate"], default=settings.FAISS_COMPACT)
+    parser.add_argument("--truncate-dims", type=int, default=settings.FAISS_TRUNCATE_DIMS)
+    parser.add_argument("--collection", default=serving_collection_name(),
+                        help="defaults to the served collection (DEDUP_COLLECTION_NAME when SERVE_DEDUPLICATED)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    import chromadb
+    from app.core.vector_backends import export_faiss_index
+
+    collection = chromadb.PersistentClient(path=settings.DB_PATH).get_collection(args.collection)
+    start = time.perf_counter()
+    meta = export_faiss_index(
+        collection, args.out, m=args.m, ef_construction=args.ef_construction, filter_keys=args.filter_keys,
+        compact=args.compact, truncate_dims=args.truncate_dims,
+    )
+    print(json.dumps({**meta, "vocabs": {k: len(v) for k, v in meta["vocabs"].items()}}, indent=2))
+    print(f"Exported in {time.perf_counter() - start:.1f}s to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
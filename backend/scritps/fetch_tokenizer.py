@@ -0,0 +1,50 @@
+# scripts/fetch_tokenizer.py
+"""
+Download LLM_TOKENIZER's tokenizer.json from the Hugging Face Hub into LLM_TOKENIZER_FILE.
+
+count_tokens loads LLM_TOKENIZER_FILE when it exists, so hosts without Hub access (offline,
+locked-down egress) still budget prompts with the real tokenizer instead of the len/4
+heuristic. Run this once on a connected machine (or in the image build) and ship the file
+with the backend.
+
+Usage (from backend/):
+    python scritps/fetch_tokenizer.py [--repo NousResearch/Meta-Llama-3.1-8B-Instruct] [--out ./models/llm_tokenizer.json]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config.settings import settings  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repo", default=settings.LLM_TOKENIZER, help="Hub repo id holding tokenizer.json")
+    parser.add_argument("--out", default=settings.LLM_TOKENIZER_FILE)
+    args = parser.parse_args()
+
+    from huggingface_hub import hf_hub_download
+    from tokenizers import Tokenizer
+
+    downloaded = hf_hub_download(repo_id=args.repo, filename="tokenizer.json")
+    tokenizer = Tokenizer.from_file(downloaded)  # fail here, not at serving time, on a bad file
+
+    directory = os.path.dirname(args.out)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with tempfile.NamedTemporaryFile(
+        "wb", dir=directory or ".", prefix=f"{os.path.basename(args.out)}.", suffix=".tmp", delete=False
+    ) as f:
+        tmp_path = f.name
+        with open(downloaded, "rb") as src:
+            shutil.copyfileobj(src, f)
+    os.replace(tmp_path, args.out)
+    print(f"✅ {args.repo} tokenizer ({tokenizer.get_vocab_size()} tokens) -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+# scripts/ingest.py
+"""
+Build the vector store from the domain folders under GDRIVE_ROOT_PATH.
+
+Walks <root>/<folder> for every domain in library.DOMAIN_NAME_MAPPING, then:
+- chunks files in a process pool;
+- embeds chunks in large batches with EMBEDDING_MODEL;
+- upserts them into DB_PATH / COLLECTION_NAME, tagged with source, title and domain
+  metadata.
+Prints throughput (chunks/s) and peak memory at the end.
+
+Runs are incremental. A manifest (INGEST_MANIFEST_PATH) maps each file to its content
+hash and chunk ids, so only new or changed files are re-chunked and re-embedded, and
+chunks of deleted files are removed. New chunks are written before superseded ones are
+deleted, and the collection is never dropped (unless --reset). The BM25 index (if
+present) and the domain-router centroid table (DOMAIN_ROUTER_PATH) are rebuilt, and an
+existing FAISS export (FAISS_INDEX_PATH) re-exported, whenever chunks changed. With SERVE_DEDUPLICATED the near-duplicate clusters
+are recomputed first (see scritps/dedup_chunks.py) and those indexes are built from the
+deduplicated collection.
+
+Ingestion is an offline step. Chroma's PersistentClient does not support several
+processes writing DB_PATH, and a running API keeps its in-memory index and the
+BM25 / router / FAISS files it loaded at startup. Stop other writers, and restart
+(or redeploy) serving workers after a run so they pick up the new chunks and indexes.
+
+Usage (from backend/):
+    python scritps/ingest.py                       # all domains, incremental
+    python scritps/ingest.py --domains census sports --workers 8
+    python scritps/ingest.py --reset               # drop the collection + manifest, rebuild
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config.settings import settings  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--root", default=settings.GDRIVE_ROOT_PATH, help="corpus root with one folder per domain")
+    parser.add_argument("--domains", nargs="*", help="domain ids to ingest (default: all)")
+    parser.add_argument("--workers", type=int, default=settings.INGEST_WORKERS)
+    parser.add_argument("--chunk-size", type=int, default=settings.INGEST_CHUNK_SIZE)
+    parser.add_argument("--chunk-overlap", type=int, default=settings.INGEST_CHUNK_OVERLAP)
+    parser.add_argument("--batch-size", type=int, default=settings.INGEST_EMBED_BATCH_SIZE)
+    parser.add_argument("--reset", action="store_true", help="delete the collection before ingesting")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    import chromadb
+    from langchain_community.embeddings import SentenceTransformerEmbeddings
+    from app.api.library import DOMAIN_NAME_MAPPING
+    from app.core.ingestion import IngestManifest, discover_files, ingest_lock, reindex
+
+    domains = DOMAIN_NAME_MAPPING
+    if args.domains:
+        unknown = [d for d in args.domains if d not in DOMAIN_NAME_MAPPING]
+        if unknown:
+            sys.exit(f"Unknown domain ids: {', '.join(unknown)}")
+        domains = {d: DOMAIN_NAME_MAPPING[d] for d in args.domains}
+
+    files = discover_files(args.root, domains)
+    print(f"{len(files)} files in {len(domains)} domains under {args.root}")
+
+    snippet_chars = 600  # truncate_documents default
+    chunking = {
+        "chunk_size": args.chunk_size,
+        "chunk_overlap": args.chunk_overlap,
+        "snippet_chars": snippet_chars,
+        "embedding_model": settings.EMBEDDING_MODEL,
+    }
+    with ingest_lock(settings.INGEST_MANIFEST_PATH):
+        client = chromadb.PersistentClient(path=settings.DB_PATH)
+        if args.reset:
+            if settings.COLLECTION_NAME in [c.name for c in client.list_collections()]:
+                client.delete_collection(settings.COLLECTION_NAME)
+            if os.path.exists(settings.INGEST_MANIFEST_PATH):
+                os.remove(settings.INGEST_MANIFEST_PATH)
+        collection = client.get_or_create_collection(settings.COLLECTION_NAME)
+        manifest = IngestManifest(settings.INGEST_MANIFEST_PATH, chunking).load()
+
+        embeddings = SentenceTransformerEmbeddings(model_name=settings.EMBEDDING_MODEL)
+        report = reindex(
+            files, collection, embeddings, manifest,
+            domains=domains.keys(),
+            workers=args.workers,
+            chunk_size=args.chunk_size,
+            chunk_overlap=args.chunk_overlap,
+            embed_batch_size=args.batch_size,
+            snippet_chars=snippet_chars,
+        )
+        print(json.dumps(report, indent=2))
+        print(f"Collection '{settings.COLLECTION_NAME}' now holds {collection.count()} chunks")
+
+        # Derived indexes are built from the collection the engine serves
+        from app.core.dedup import serving_collection_name
+        serving = collection
+        if serving_collection_name() != settings.COLLECTION_NAME:
+            serving = client.get_or_create_collection(serving_collection_name(), metadata=collection.metadata)
+            if report["chunks"] or report["deleted_chunks"] or not serving.count():
+                from app.core.dedup import deduplicate_collection
+                dedup = deduplicate_collection(
+                    collection, serving,
+                    max_hamming=settings.DEDUP_MAX_HAMMING,
+                    min_cosine=settings.DEDUP_MIN_COSINE,
+                )
+                print(f"Deduplicated into '{serving.name}': {json.dumps(dedup)}")
+
+        bm25_path = getattr(settings, "BM25_INDEX_PATH", None)
+        if (report["chunks"] or report["deleted_chunks"]) and bm25_path and os.path.exists(bm25_path):
+            from app.core.hybrid import BM25Index
+            BM25Index.from_collection(serving, db_path=settings.DB_PATH).save(bm25_path)
+            print(f"Rebuilt BM25 index at {bm25_path}")
+
+        router_path = getattr(settings, "DOMAIN_ROUTER_PATH", None)
+        if router_path:
+            # Rebuilt (and saved) only when missing or stale against the collection fingerprint
+            from app.core.routing import load_or_build_router
+            router = load_or_build_router(
+                serving, router_path, centroids_per_domain=settings.DOMAIN_ROUTER_CENTROIDS_PER_DOMAIN,
+                db_path=settings.DB_PATH,
+            )
+            print(f"Domain router ({len(router)} domains) at {router_path} is current")
+
+        faiss_path = getattr(settings, "FAISS_INDEX_PATH", None)
+        if (report["chunks"] or report["deleted_chunks"]) and faiss_path and os.path.exists(faiss_path):
+            from app.core.vector_backends import export_faiss_index
+            export_faiss_index(
+                serving, faiss_path,
+                m=settings.FAISS_HNSW_M,
+                ef_construction=settings.FAISS_HNSW_EF_CONSTRUCTION,
+                filter_keys=settings.FAISS_FILTER_KEYS,
+                compact=settings.FAISS_COMPACT,
+                truncate_dims=settings.FAISS_TRUNCATE_DIMS,
+            )
+            print(f"Re-exported FAISS index at {faiss_path}")
+
+
+if __name__ == "__main__":
+    main()
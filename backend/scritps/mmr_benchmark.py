@@ -0,0 +1,94 @@
+# scripts/mmr_benchmark.py
+"""
+Micro-benchmark: langchain's maximal_marginal_relevance vs the vectorized mmr_select
+used by VectorSearchRetriever.
+
+For each fetch_k, candidates are synthetic clustered unit vectors (768-d by default,
+the dimension of EMBEDDING_MODEL bge-base-en-v1.5; pass --dim for other models). Reports the per-call latency of both
+implementations, whether they pick the same indices, and the per-question cost
+with MultiQuery: one MMR per variant vs one MMR over the union of the variants'
+candidates (MMR_OVER_UNION).
+
+Usage (from backend/):
+    python scritps/mmr_benchmark.py --fetch-k 60 200 1000 --k 18 --variants 5
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config.settings import settings  # noqa: E402
+
+
+def _clustered(rng, n: int, dim: int, clusters: int = 8) -> np.ndarray:
+    centers = rng.normal(size=(clusters, dim))
+    vectors = centers[rng.integers(clusters, size=n)] + 0.6 * rng.normal(size=(n, dim))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+def _timed_ms(func, repeat: int) -> float:
+    func()  # warm-up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fetch-k", type=int, nargs="+", default=[60, 200, 1000])
+    parser.add_argument("--k", type=int, default=settings.RETRIEVAL_K)
+    parser.add_argument("--lambda-mult", type=float, default=settings.LAMBDA_MULT)
+    parser.add_argument("--dim", type=int, default=768, help="embedding dimension (bge-base-en-v1.5: 768)")
+    parser.add_argument("--variants", type=int, default=5, help="MultiQuery variants incl. the original")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    from langchain_community.vectorstores.utils import maximal_marginal_relevance
+    from app.core.retrievers import mmr_select
+
+    rng = np.random.default_rng(0)
+    print(f"k={args.k} lambda_mult={args.lambda_mult} dim={args.dim} variants={args.variants}\n")
+    print(f"{'fetch_k':>7s} {'langchain ms':>13s} {'numpy ms':>9s} {'speedup':>8s} {'same picks':>11s} "
+          f"{'per-variant lc/np ms':>21s} {'union ms':>9s}")
+    for fetch_k in args.fetch_k:
+        candidates = _clustered(rng, fetch_k, args.dim)
+        query = candidates[0] + 0.3 * rng.normal(size=args.dim).astype(np.float32)
+        cand_list = list(candidates)  # Chroma returns a list of vectors per query
+
+        lc_ms = _timed_ms(lambda: maximal_marginal_relevance(query, cand_list, k=args.k, lambda_mult=args.lambda_mult),
+                          args.repeat)
+        np_ms = _timed_ms(lambda: mmr_select(query, cand_list, k=args.k, lambda_mult=args.lambda_mult), args.repeat)
+        same = (maximal_marginal_relevance(query, cand_list, k=args.k, lambda_mult=args.lambda_mult)
+                == mmr_select(query, cand_list, k=args.k, lambda_mult=args.lambda_mult))
+
+        # MultiQuery: each variant has its own fetch_k candidates, half of them shared
+        pools = [np.concatenate([candidates[: fetch_k // 2], _clustered(rng, fetch_k - fetch_k // 2, args.dim)])
+                 for _ in range(args.variants)]
+        queries = np.stack([p[0] for p in pools])
+        union = np.concatenate([candidates[: fetch_k // 2]] + [p[fetch_k // 2:] for p in pools])
+        per_variant_ms = _timed_ms(
+            lambda: [maximal_marginal_relevance(q, list(p), k=args.k, lambda_mult=args.lambda_mult)
+                     for q, p in zip(queries, pools)],
+            max(args.repeat // args.variants, 1),
+        )
+        per_variant_np_ms = _timed_ms(
+            lambda: [mmr_select(q, list(p), k=args.k, lambda_mult=args.lambda_mult) for q, p in zip(queries, pools)],
+            max(args.repeat // args.variants, 1),
+        )
+        union_ms = _timed_ms(
+            lambda: mmr_select(queries, union, k=args.k * args.variants, lambda_mult=args.lambda_mult),
+            max(args.repeat // args.variants, 1),
+        )
+        print(f"{fetch_k:7d} {lc_ms:13.3f} {np_ms:9.3f} {lc_ms / np_ms:7.1f}x {str(same):>11s} "
+              f"{per_variant_ms:10.3f} /{per_variant_np_ms:9.3f} {union_ms:9.3f}")
+    print("\nper-variant = one MMR per MultiQuery variant (langchain / vectorized); "
+          "union = one vectorized MMR over the deduplicated union")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# scripts/precompute_snippets.py
+"""
+Offline pass over the Chroma collection: store each chunk's sanitized context snippet
+and its token count in the chunk metadata, so truncate_documents / pack_documents skip
+the regex sanitization and tokenization at request time.
+
+Stored counts are tagged with the snippet length and tokenizer; they are ignored (and
+recomputed per request) if either setting changes, so re-run this after changing
+LLM_TOKENIZER or the snippet length.
+
+COLLECTION_NAME is always updated; with SERVE_DEDUPLICATED the served DEDUP_COLLECTION_NAME
+is updated too (it is what the engine reads, and dedup re-syncs copy the source metadata).
+These metadata writes change the collection fingerprint, so re-run build_bm25_index.py /
+build_domain_router.py afterwards; serving workers treat both as stale until then.
+
+Usage (from backend/):
+    python scritps/precompute_snippets.py --snippet-chars 600
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config.settings import settings  # noqa: E402
+from app.core.dedup import serving_collection_name  # noqa: E402
+
+
+def _precompute(collection, snippet_chars, batch_size, force):
+    from app.core import utils
+
+    tokenizer = utils.tokenizer_name()
+    total = collection.count()
+    print(f"{total} chunks in '{collection.name}', tokenizer={tokenizer}, snippet_chars={snippet_chars}")
+
+    start = time.perf_counter()
+    updated = skipped = offset = 0
+    while offset < total:
+        page = collection.get(include=["documents", "metadatas"], limit=batch_size, offset=offset)
+        if not page["ids"]:
+            break
+        offset += len(page["ids"])
+
+        ids, metadatas = [], []
+        for chunk_id, text, metadata in zip(page["ids"], page["documents"], page["metadatas"]):
+            metadata = metadata or {}
+            if (
+                not force
+                and metadata.get(utils.SNIPPET_CHARS_KEY) == snippet_chars
+                and metadata.get(utils.SNIPPET_TOKENIZER_KEY) == tokenizer
+            ):
+                skipped += 1
+                continue
+            ids.append(chunk_id)
+            metadatas.append({**metadata, **utils.snippet_metadata(text, snippet_chars)})
+        if ids:
+            collection.update(ids=ids, metadatas=metadatas)
+            updated += len(ids)
+        print(f"  {offset}/{total} scanned, {updated} updated, {skipped} already current")
+
+    print(f"Done in {time.perf_counter() - start:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--snippet-chars", type=int, default=600, help="must match truncate_documents' snippet_chars")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--force", action="store_true", help="recompute chunks that are already up to date")
+    args = parser.parse_args()
+
+    import chromadb
+
+    client = chromadb.PersistentClient(path=settings.DB_PATH)
+    for name in dict.fromkeys([settings.COLLECTION_NAME, serving_collection_name()]):
+        if name not in [c.name for c in client.list_collections()]:
+            print(f"Collection '{name}' does not exist yet, skipping")
+            continue
+        _precompute(client.get_collection(name), args.snippet_chars, args.batch_size, args.force)
+
+
+if __name__ == "__main__":
+    main()
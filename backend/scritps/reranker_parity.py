@@ -0,0 +1,104 @@
+# scripts/reranker_parity.py
+"""
+Compare the ONNX (int8) reranker backend against the PyTorch HuggingFaceCrossEncoder.
+
+Queries come from the sample_questions in data/domains.json; candidates are the top
+chunks returned by the vector store for each query, i.e. the same kind of pairs the
+reranker sees in production. Reports score correlation, top-k agreement and latency.
+
+Usage (from backend/):
+    python scritps/reranker_parity.py --candidates 20 --top-k 6
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config.settings import settings  # noqa: E402
+
+
+def _ranks(values: np.ndarray) -> np.ndarray:
+    ranks = np.empty(len(values))
+    ranks[np.argsort(values)] = np.arange(len(values))
+    return ranks
+
+
+def _timed_scores(model, pairs_per_query):
+    scores, latencies = [], []
+    for pairs in pairs_per_query:
+        start = time.perf_counter()
+        scores.append(np.asarray(model.score(pairs), dtype=np.float64))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return scores, np.asarray(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=settings.RERANKER_MODEL)
+    parser.add_argument("--candidates", type=int, default=20, help="chunks per query")
+    parser.add_argument("--top-k", type=int, default=settings.RERANKER_TOP_N)
+    parser.add_argument("--max-queries", type=int, default=100)
+    parser.add_argument("--no-quantize", action="store_true", help="compare the fp32 ONNX export instead")
+    args = parser.parse_args()
+
+    from langchain_community.cross_encoders import HuggingFaceCrossEncoder
+    from langchain_community.embeddings import SentenceTransformerEmbeddings
+    from langchain_community.vectorstores import Chroma
+    from app.core.onnx_models import OnnxCrossEncoder
+
+    domains_file = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "domains.json")
+    with open(domains_file, "r", encoding="utf-8") as f:
+        questions = [q for d in json.load(f)["domains"] for q in d.get("sample_questions", [])]
+    questions = questions[: args.max_queries]
+
+    vectordb = Chroma(
+        persist_directory=settings.DB_PATH,
+        embedding_function=SentenceTransformerEmbeddings(model_name=settings.EMBEDDING_MODEL),
+    )
+    pairs_per_query = []
+    for question in questions:
+        docs = vectordb.similarity_search(question, k=args.candidates)
+        if docs:
+            pairs_per_query.append([(question, doc.page_content) for doc in docs])
+    print(f"{len(pairs_per_query)} queries x up to {args.candidates} candidates")
+
+    torch_model = HuggingFaceCrossEncoder(model_name=args.model)
+    onnx_model = OnnxCrossEncoder(args.model, cache_dir=settings.ONNX_CACHE_DIR, quantize=not args.no_quantize)
+
+    # Warm both backends so first-call allocation does not skew latency
+    torch_model.score(pairs_per_query[0])
+    onnx_model.score(pairs_per_query[0])
+
+    torch_scores, torch_ms = _timed_scores(torch_model, pairs_per_query)
+    onnx_scores, onnx_ms = _timed_scores(onnx_model, pairs_per_query)
+
+    all_torch = np.concatenate(torch_scores)
+    all_onnx = np.concatenate(onnx_scores)
+    pearson = float(np.corrcoef(all_torch, all_onnx)[0, 1])
+    spearman = float(np.mean([
+        np.corrcoef(_ranks(t), _ranks(o))[0, 1] for t, o in zip(torch_scores, onnx_scores) if len(t) > 1
+    ]))
+    overlap = float(np.mean([
+        len(set(np.argsort(-t)[: args.top_k]) & set(np.argsort(-o)[: args.top_k])) / min(args.top_k, len(t))
+        for t, o in zip(torch_scores, onnx_scores)
+    ]))
+
+    print("\n=== Score parity ===")
+    print(f"Pearson (all pairs):        {pearson:.4f}")
+    print(f"Spearman (mean per query):  {spearman:.4f}")
+    print(f"Top-{args.top_k} overlap (mean):      {overlap:.2%}")
+    print(f"Max abs score diff:         {float(np.max(np.abs(all_torch - all_onnx))):.4f}")
+
+    print("\n=== Latency per query (ms) ===")
+    for name, ms in (("torch", torch_ms), ("onnx", onnx_ms)):
+        print(f"{name:6s} mean={ms.mean():8.1f}  p50={np.percentile(ms, 50):8.1f}  p95={np.percentile(ms, 95):8.1f}")
+    print(f"speedup: {torch_ms.mean() / onnx_ms.mean():.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# scripts/semantic_cache_threshold.py
+"""
+Check SEMANTIC_CACHE_THRESHOLD against paraphrase and near-miss question pairs.
+
+A paraphrase pair (same: true) should hit the semantic answer cache; a near-miss pair
+(same: false: another state, year, section number...) must not. For each threshold the
+script reports the paraphrase hit rate and the near-miss false-hit rate, with and without
+the key-term guard (SEMANTIC_CACHE_KEY_TERM_GUARD), embedding with EMBEDDING_MODEL.
+
+Pairs come from --pairs (JSON lines {"a": ..., "b": ..., "same": true|false}, e.g. taken
+from logged traffic) or a small built-in set.
+
+Usage (from backend/):
+    python scritps/semantic_cache_threshold.py
+    python scritps/semantic_cache_threshold.py --pairs pairs.jsonl --thresholds 0.9 0.95 0.97
+"""
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config.settings import settings  # noqa: E402
+
+DEFAULT_PAIRS = [
+    ("What is the population of Kerala?", "How many people live in Kerala?", True),
+    ("What is the literacy rate of Bihar according to the census?", "Census literacy rate for Bihar", True),
+    ("Summarize the major IPL seasons described in the documents.", "Give a summary of the main IPL seasons.", True),
+    ("Which team won the most IPL matches?", "Which IPL team has the most match wins?", True),
+    ("What are modes of news distribution in India?", "How is news distributed in India?", True),
+    ("Explain the key findings of NFHS-5.", "What are the main findings of NFHS-5?", True),
+    ("What is the population of Kerala?", "What is the population of Punjab?", False),
+    ("What was the literacy rate in 2011?", "What was the literacy rate in 2001?", False),
+    ("Explain the key findings of NFHS-5.", "Explain the key findings of NFHS-4.", False),
+    ("What does Section 302 of the IPC say?", "What does Section 304 of the IPC say?", False),
+    ("Who won the IPL in 2016?", "Who won the IPL in 2018?", False),
+    ("What is the sex ratio of Haryana?", "What is the sex ratio of Kerala?", False),
+    ("How many districts are in Uttar Pradesh?", "How many districts are in Madhya Pradesh?", False),
+    ("What is the GDP growth rate for 2020-21?", "What is the GDP growth rate for 2021-22?", False),
+]
+
+
+def _load_pairs(path):
+    pairs = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                row = json.loads(line)
+                pairs.append((row["a"], row["b"], bool(row["same"])))
+    return pairs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pairs", help="JSON lines file of {a, b, same} question pairs")
+    parser.add_argument("--thresholds", nargs="*", type=float,
+                        default=[0.85, 0.9, 0.92, 0.94, settings.SEMANTIC_CACHE_THRESHOLD, 0.97])
+    parser.add_argument("--show", action="store_true", help="print the cosine of every pair")
+    args = parser.parse_args()
+
+    from langchain_community.embeddings import SentenceTransformerEmbeddings
+    from app.core.cache import key_terms
+
+    pairs = _load_pairs(args.pairs) if args.pairs else DEFAULT_PAIRS
+    embeddings = SentenceTransformerEmbeddings(model_name=settings.EMBEDDING_MODEL)
+    a = np.asarray([embeddings.embed_query(q) for q, _, _ in pairs], dtype=np.float32)
+    b = np.asarray([embeddings.embed_query(q) for _, q, _ in pairs], dtype=np.float32)
+    cosines = np.sum(a * b, axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+    same = np.asarray([s for _, _, s in pairs])
+    terms_match = np.asarray([key_terms(qa) == key_terms(qb) for qa, qb, _ in pairs])
+
+    if args.show:
+        for (qa, qb, s), cosine, match in zip(pairs, cosines, terms_match):
+            print(f"{cosine:.4f} {'same' if s else 'diff'} {'=' if match else '≠'}  {qa!r} | {qb!r}")
+        print()
+
+    print(f"{len(pairs)} pairs ({int(same.sum())} paraphrases, {int((~same).sum())} near-misses), "
+          f"model={settings.EMBEDDING_MODEL}")
+    print(f"near-miss cosine: max={cosines[~same].max():.4f}   paraphrase cosine: min={cosines[same].min():.4f}")
+    print(f"{'threshold':>9}  {'para hit':>8}  {'near-miss hit':>13}  {'+guard para':>11}  {'+guard near-miss':>16}")
+    for threshold in sorted(args.thresholds):
+        hit = cosines >= threshold
+        guarded = hit & terms_match
+        print(f"{threshold:9.3f}  {hit[same].mean():8.2%}  {hit[~same].mean():13.2%}  "
+              f"{guarded[same].mean():11.2%}  {guarded[~same].mean():16.2%}")
+
+
+if __name__ == "__main__":
+    main()
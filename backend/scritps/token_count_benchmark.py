@@ -0,0 +1,92 @@
+# scripts/token_count_benchmark.py
+"""
+Compare the len/4 token heuristic with the LLM tokenizer used by count_tokens.
+
+Chunks are sampled from the Chroma collection and cut to the same sanitized snippets
+truncate_documents builds. Reports, per text class (all / non-ASCII-heavy /
+numeric-heavy):
+- accuracy: heuristic error relative to the real tokenizer count;
+- cost: per-snippet latency of the heuristic, of the tokenizer on a cold cache, and
+  of the cached (chunk id -> count) lookup.
+
+Usage (from backend/):
+    python scritps/token_count_benchmark.py --sample 2000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config.settings import settings  # noqa: E402
+
+
+def _ratio(text: str, predicate) -> float:
+    return sum(1 for ch in text if predicate(ch)) / max(len(text), 1)
+
+
+def _timed_us(func, items) -> float:
+    start = time.perf_counter()
+    for item in items:
+        func(*item)
+    return (time.perf_counter() - start) / max(len(items), 1) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sample", type=int, default=2000, help="chunks to read from Chroma")
+    parser.add_argument("--snippet-chars", type=int, default=600)
+    args = parser.parse_args()
+
+    import chromadb
+    from app.core import utils
+
+    tokenizer = utils.get_tokenizer()
+    if tokenizer is None:
+        sys.exit(f"Tokenizer {settings.LLM_TOKENIZER!r} could not be loaded; nothing to compare against.")
+
+    collection = chromadb.PersistentClient(path=settings.DB_PATH).get_collection(settings.COLLECTION_NAME)
+    page = collection.get(limit=args.sample, include=["documents"])
+    items = [
+        (utils._sanitize(doc.strip()[: args.snippet_chars]), f"{doc_id}:{args.snippet_chars}")
+        for doc_id, doc in zip(page["ids"], page["documents"])
+        if doc and doc.strip()
+    ]
+    texts = [text for text, _ in items]
+    print(f"{len(texts)} snippets (<= {args.snippet_chars} chars) from {settings.DB_PATH}")
+
+    real = np.asarray([len(tokenizer.encode(t, add_special_tokens=False).ids) for t in texts], dtype=np.float64)
+    heur = np.asarray([utils.heuristic_count_tokens(t) for t in texts], dtype=np.float64)
+    rel_err = (heur - real) / np.clip(real, 1, None)
+
+    classes = {
+        "all": np.ones(len(texts), dtype=bool),
+        "non-ascii > 20%": np.asarray([_ratio(t, lambda c: ord(c) > 127) > 0.2 for t in texts]),
+        "digits > 20%": np.asarray([_ratio(t, str.isdigit) > 0.2 for t in texts]),
+    }
+    print("\n=== Heuristic accuracy vs tokenizer (relative error of len/4) ===")
+    print(f"{'class':18s} {'n':>6s} {'mean':>8s} {'mean |err|':>11s} {'p95 |err|':>10s} {'undercount':>11s}")
+    for name, mask in classes.items():
+        if not mask.any():
+            continue
+        err = rel_err[mask]
+        print(f"{name:18s} {int(mask.sum()):6d} {err.mean():8.1%} {np.abs(err).mean():11.1%} "
+              f"{np.percentile(np.abs(err), 95):10.1%} {np.mean(err < 0):11.1%}")
+
+    # Cost per snippet: cache misses first (fresh keys), then hits on the same keys
+    utils._token_cache.clear()
+    heuristic_us = _timed_us(lambda t, _k: utils.heuristic_count_tokens(t), items)
+    cold_us = _timed_us(utils.count_tokens, items)
+    cached_us = _timed_us(utils.count_tokens, items)
+    print("\n=== Cost per snippet (us) ===")
+    print(f"heuristic:          {heuristic_us:8.2f}")
+    print(f"tokenizer (cold):   {cold_us:8.2f}")
+    print(f"tokenizer (cached): {cached_us:8.2f}")
+    print(f"\n~{cold_us * 18 / 1000:.2f} ms per request to count 18 uncached candidate snippets")
+
+
+if __name__ == "__main__":
+    main()